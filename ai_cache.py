@@ -0,0 +1,99 @@
+"""Answer cache for the AI assistant.
+
+Questions are normalized before they are used as keys: lowercased,
+punctuation and stopwords removed, tokens de-duplicated and sorted. So "How
+often should I feed my newborn?" and "newborn feed how often" share an entry.
+The key also carries a fingerprint of the recent history the providers see
+(the normalized user turns), so a follow-up question is never answered from a
+different conversation's context.
+
+The first tier is an in-process LRU with a TTL. With shared=True, entries
+are also written to the ai_answer_cache table (migration 11), so every worker
+benefits from an answer any of them paid for.
+"""
+import hashlib
+import re
+import time
+
+from cache import LRUCache
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_SIZE = 2048
+HISTORY_TURNS = 5
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("""
+    a an the and or but if then so to of in on at by for with about from into over under
+    is are was were be been being am do does did doing have has had having can could
+    should would will shall may might must i me my mine we our you your he she it its
+    they them their this that these those what which who whom whose when where why how
+    please tell know want need any some much many very just also too there here
+    baby babys baby's
+""".split())
+
+
+def normalize_question(question):
+    tokens = {t for t in _TOKEN.findall((question or '').lower()) if t not in STOPWORDS}
+    return ' '.join(sorted(tokens))
+
+
+def history_fingerprint(history):
+    turns = [normalize_question(turn.get('user')) for turn in (history or [])[-HISTORY_TURNS:]]
+    if not turns:
+        return ''
+    return hashlib.sha1('\x1f'.join(turns).encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(question, history):
+    """Key for a question, or None when nothing is left after normalization."""
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+    return f"{history_fingerprint(history)}:{normalized}"
+
+
+class AnswerCache:
+
+    def __init__(self, maxsize=DEFAULT_SIZE, ttl=DEFAULT_TTL, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared_hits = 0
+
+    def get(self, question, history, conn=None):
+        key = cache_key(question, history)
+        if key is None:
+            return None
+        answer = self.memory.get(key)
+        if answer is not None or not (self.shared and conn is not None):
+            return answer
+        row = conn.execute("SELECT answer, expires_ts FROM ai_answer_cache WHERE key = ? AND expires_ts > ?",
+                           (key, int(time.time()))).fetchone()
+        if row is None:
+            return None
+        self.shared_hits += 1
+        self.memory.set(key, row[0], ttl=max(1, row[1] - int(time.time())))
+        return row[0]
+
+    def put(self, question, history, answer, conn=None):
+        key = cache_key(question, history)
+        if key is None or not answer:
+            return
+        self.memory.set(key, answer)
+        if self.shared and conn is not None:
+            now = int(time.time())
+            conn.execute("""INSERT INTO ai_answer_cache (key, answer, expires_ts) VALUES (?, ?, ?)
+                            ON CONFLICT(key) DO UPDATE SET answer = excluded.answer,
+                                                           expires_ts = excluded.expires_ts""",
+                         (key, answer, now + self.ttl))
+            conn.execute("DELETE FROM ai_answer_cache WHERE expires_ts <= ?", (now,))
+            conn.commit()
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['shared'] = self.shared
+        stats['shared_hits'] = self.shared_hits
+        return stats
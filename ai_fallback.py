@@ -0,0 +1,117 @@
+"""Local answers for the AI assistant when no provider is configured or all fail.
+
+The keyword lists of every language (translations[lang]['ai_keywords']) are
+compiled once, at import, into a single alternation with one named group per
+intent. A question is scored in one finditer pass: each match counts for the
+intent whose group matched, and the intent with the most matches wins, so
+"my baby has a fever and a rash, is it the fever?" is about fever. Ties go to
+the earlier intent in INTENTS, and greetings and thanks only count for half
+so that "hi, baby won't sleep" is answered about sleep.
+
+English keywords match at word starts ("feed*" is a prefix, "cry" a whole
+word). Other scripts match anywhere in the question: vowel signs are not word
+characters to the re module, and inflected forms share the keyword as a stem.
+
+When the tips index found passages for the question (see tips_index), they
+are quoted in the answer, in the question's language. A question with an
+intent only takes passages from the tips on that topic (INTENT_TOPICS);
+intents no tip covers, and questions no passage matched, get the intent
+answer.
+"""
+import re
+
+import tips_index
+from translations import translations
+
+INTENTS = (
+    ('fever', "For babies <3 months, a temp >100.4°F (38°C) is an emergency—call a doctor. For older babies, monitor behavior. If they are playing and drinking, they may just need rest. Keep them hydrated."),
+    ('vomit', "Spit-up is normal. Projectile vomiting or green/bloody vomit requires a doctor. Keep baby upright after feeds. If vomiting persists, watch for dehydration (dry lips, no tears)."),
+    ('sleep', "Newborns sleep 14-17h/day. Establish a 'Bath, Book, Bed' routine. Ensure the room is cool and dark. If baby wakes often, check hunger/diaper, but try to let them self-soothe."),
+    ('feeding', "Newborns feed every 2-3 hours. Look for hunger cues like rooting. 6+ wet diapers/day means they are getting enough. If latching hurts, consult a lactation expert."),
+    ('stool', "Breastfed poop is yellow/seedy; formula is tan. Hard pellets mean constipation—consult a doctor. Watery diarrhea risks dehydration. Call a doctor if there's blood in stool."),
+    ('crying', "Check the basics: Hunger, Diaper, Sleep. Try the 5 S's: Swaddle, Side-position, Shush, Swing, Suck. If crying is inconsolable for hours, it might be colic."),
+    ('rash', "Baby acne usually clears up alone. For diaper rash, use zinc cream and air time. If a rash doesn't fade when pressed or comes with fever, seek medical help."),
+    ('cold', "Saline drops and a bulb syringe help with congestion. A cool-mist humidifier can ease breathing. Watch for rapid breathing or chest retractions—that's urgent."),
+    ('solids', "Start solids around 6 months when baby can sit up. Start with single-ingredient purees (sweet potato, avocado) or soft finger foods. Introduce allergens one by one."),
+    ('greeting', "Hello! I'm Dream Baby AI. I can help with sleep, feeding, health, and development. What's on your mind?"),
+    ('thanks', "You're very welcome! You're doing a great job. Let me know if you need anything else."),
+)
+DEFAULT_ANSWER = ("I can help with general baby care (sleep, feeding, health). Since I'm an AI, for specific "
+                  "medical diagnoses, please see your pediatrician. Could you rephrase your question?")
+WEIGHTS = {'greeting': 0.5, 'thanks': 0.5}
+FALLBACK_PASSAGES = 2
+# tips (catalog.TIP_KEYS) that answer an intent; intents missing here have none
+INTENT_TOPICS = {
+    'sleep': ('sleep',),
+    'feeding': ('feeding',),
+    'solids': ('feeding',),
+    'crying': ('crying',),
+    'stool': ('diapering',),
+    'rash': ('diapering',),
+}
+FALLBACK_PASSAGE_CHARS = 300
+
+ANSWERS = dict(INTENTS)
+_ORDER = {name: i for i, (name, _) in enumerate(INTENTS)}
+
+
+def keyword_pattern(word):
+    """Regex source for one keyword (see the module docstring for the rules)."""
+    if not word.isascii():
+        return re.escape(word)
+    prefix = word.endswith('*')
+    source = r'(?<!\w)' + re.escape(word.rstrip('*').lower())
+    return source if prefix else source + r'(?!\w)'
+
+
+def build_matcher(catalog=translations):
+    """One compiled alternation over every language's keywords, a named group per intent."""
+    keywords = {name: set() for name, _ in INTENTS}
+    for lang_data in catalog.values():
+        for intent, words in lang_data.get('ai_keywords', {}).items():
+            if intent in keywords:
+                keywords[intent].update(words)
+    groups = []
+    for name, _ in INTENTS:
+        if keywords[name]:
+            # longest first, so a phrase wins over a keyword it contains
+            words = sorted(keywords[name], key=lambda w: (-len(w), w))
+            groups.append(f"(?P<{name}>{'|'.join(keyword_pattern(w) for w in words)})")
+    return re.compile('|'.join(groups))
+
+
+MATCHER = build_matcher()
+
+
+def classify(question, matcher=MATCHER):
+    """Best matching intent for question, or None."""
+    scores = {}
+    for m in matcher.finditer((question or '').lower()):
+        scores[m.lastgroup] = scores.get(m.lastgroup, 0) + WEIGHTS.get(m.lastgroup, 1)
+    if not scores:
+        return None
+    return min(scores, key=lambda name: (-scores[name], _ORDER[name]))
+
+
+def topics(question):
+    """Tips a passage for question may come from, or None when no intent matched."""
+    intent = classify(question)
+    return INTENT_TOPICS.get(intent, ()) if intent else None
+
+
+def answer(question, passages=()):
+    """Answer from the matched intent and the retrieved tip passages (in the question's language).
+
+    The canned intent answers are in English, so for questions in other
+    languages the passages are used on their own when any are on the topic.
+    """
+    intent = classify(question)
+    if intent:
+        passages = [p for p in passages if p.topic in INTENT_TOPICS.get(intent, ())]
+    if intent in ('greeting', 'thanks') or not passages:
+        return ANSWERS[intent] if intent else DEFAULT_ANSWER
+    parts = []
+    if intent and tips_index.detect_language(question) == 'en':
+        parts.append(ANSWERS[intent])
+    parts.extend(tips_index.quote(p, FALLBACK_PASSAGE_CHARS) for p in passages[:FALLBACK_PASSAGES])
+    return '\n\n'.join(parts)
@@ -0,0 +1,150 @@
+"""Bounded thread pool for AI assistant requests.
+
+Answers are computed on a dedicated pool of `workers` threads with room for
+`queue_size` waiting requests. When both are taken, submit() raises PoolFull
+straight away with a retry hint instead of letting the request wait.
+
+The request thread still waits for its answer, so every AI request in flight
+holds one of the server's request threads. size_for() therefore caps workers
++ queue_size below the WSGI thread count (WEB_THREADS, which gunicorn.conf.py
+also reads), after the threads held by open event streams (see
+events.StreamSlots), keeping `reserved` threads per process for the tracker
+and shop pages however slow the providers are.
+
+run() waits for the result up to a deadline that includes the time spent in
+the queue; a task that misses it keeps its slot until it really finishes, so
+abandoned work still counts against the bound.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from queue import Queue, Empty
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE = 8
+DEFAULT_DEADLINE = 25.0
+DEFAULT_WEB_THREADS = 16    # request threads per server process, see gunicorn.conf.py
+
+_DONE = object()
+
+
+class PoolFull(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__(f"AI pool is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def stream_share(web_threads):
+    """Default number of open event streams per process: a quarter of the threads."""
+    return max(1, web_threads // 4)
+
+
+def size_for(web_threads, reserved=None, streams=0, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE):
+    """(workers, queue_size) shrunk so in-flight AI requests plus `streams` open event
+    streams leave `reserved` request threads free.
+
+    reserved defaults to half the threads. With a single request thread
+    (sync workers) one AI request is still let through, and it can hold the
+    whole process; use threaded workers.
+    """
+    if reserved is None:
+        reserved = max(1, web_threads // 2)
+    limit = max(1, web_threads - reserved - streams)
+    workers = max(1, min(workers, limit))
+    return workers, max(0, min(queue_size, limit - workers))
+
+
+class AIPool:
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE, deadline=DEFAULT_DEADLINE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.rejected = 0
+        self._durations = deque(maxlen=50)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-request')
+                    self._in_flight = 0
+                    self._pid = os.getpid()
+        return self._executor
+
+    def retry_after(self):
+        """Seconds until a slot is likely free: the queue ahead of us at the recent task duration."""
+        avg = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        return max(1, math.ceil(avg * max(1, self._in_flight - self.workers + 1) / self.workers))
+
+    def submit(self, fn, *args, **kwargs):
+        executor = self._get_executor()
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PoolFull(self.retry_after())
+            self._in_flight += 1
+
+        def task():
+            started = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._durations.append(time.monotonic() - started)
+
+        future = executor.submit(task)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run(self, fn, *args, deadline=None, **kwargs):
+        """fn(*args) on the pool; raises PoolFull, or TimeoutError past the deadline."""
+        future = self.submit(fn, *args, **kwargs)
+        return future.result(timeout=self.deadline if deadline is None else deadline)
+
+    def stream(self, gen_fn, *args, deadline=None, **kwargs):
+        """Run the generator gen_fn(*args) on the pool and yield its items here.
+
+        Raises PoolFull before anything is yielded, TimeoutError when the
+        deadline passes mid-stream, and re-raises the generator's exceptions.
+        """
+        items = Queue()
+
+        def produce():
+            try:
+                for item in gen_fn(*args, **kwargs):
+                    items.put(item)
+            except BaseException as e:
+                items.put(e)
+            finally:
+                items.put(_DONE)
+
+        self.submit(produce)
+        return self._consume(items, time.monotonic() + (self.deadline if deadline is None else deadline))
+
+    def _consume(self, items, end):
+        while True:
+            try:
+                item = items.get(timeout=max(0, end - time.monotonic()))
+            except Empty:
+                raise TimeoutError("AI answer deadline exceeded")
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def stats(self):
+        return {'workers': self.workers, 'queue_size': self.queue_size, 'in_flight': self._in_flight,
+                'rejected': self.rejected, 'retry_after': self.retry_after()}
@@ -0,0 +1,438 @@
+"""LLM provider clients for the AI assistant.
+
+Each provider does its imports, API-key configuration and client construction
+once per worker, when the registry is built, and keeps the client (and its
+HTTP connection pool) for every later question. generate_ai_answer then only
+pays for the network call itself. Providers also implement stream(), which
+yields the answer piece by piece from the vendor's streaming API so /ai/ask
+can relay text as soon as the first tokens arrive.
+
+Providers are tried in the order given by AI_PROVIDERS (default
+"gemini,openai"); a provider without an API key or without its library
+installed is simply left out. ProviderRegistry.ask bounds the whole answer by
+AI_DEADLINE, can hedge with the next provider after AI_HEDGE_AFTER seconds,
+and skips providers whose circuit breaker is open. Setting AI_PROVIDERS=fake uses FakeProvider,
+which answers locally and is meant for tests and offline development.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+SYSTEM_PROMPT = ("You are Dream Baby AI, a helpful, warm, and evidence-based pediatric assistant. "
+                 "Keep answers concise (max 3-4 sentences) and supportive. "
+                 "Always advise seeing a doctor for emergencies.")
+HISTORY_TURNS = 5
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_DEADLINE = 20.0       # seconds for a whole answer, across providers
+BREAKER_FAILURES = 3          # consecutive failures that open a provider's circuit
+BREAKER_COOLDOWN = 30.0       # seconds an open circuit skips the provider
+STATS_WINDOW = 200            # calls kept per provider for latency percentiles
+
+log = logging.getLogger(__name__)
+
+
+def context_block(context):
+    """Retrieved tip passages, as a section of the prompt."""
+    if not context:
+        return ''
+    return "Relevant Dream Baby tips (use them where they help):\n" + '\n'.join(f"- {c}" for c in context) + "\n\n"
+
+
+def build_prompt(question, history, context=None):
+    """Single-string prompt (Gemini)."""
+    context_str = f"{SYSTEM_PROMPT}\n\n{context_block(context)}Conversation History:\n"
+    for turn in history[-HISTORY_TURNS:]:
+        context_str += f"User: {turn['user']}\nAI: {turn['ai']}\n"
+    return f"{context_str}\nUser: {question}\nAI:"
+
+
+def build_messages(question, history, context=None):
+    """Chat messages (OpenAI)."""
+    messages = [{"role": "system", "content": "You are a helpful pediatric assistant.\n\n" + context_block(context)}]
+    for turn in history[-HISTORY_TURNS:]:
+        messages.append({"role": "user", "content": turn['user']})
+        messages.append({"role": "assistant", "content": turn['ai']})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+class CircuitBreaker:
+    """Skips a provider after `failures` consecutive errors, for `cooldown` seconds.
+
+    When the cooldown is over one call is let through (half-open); its outcome
+    closes the circuit again or re-opens it for another cooldown.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self._trial or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        """A call ended without an outcome (another provider answered first): free the half-open trial."""
+        with self._lock:
+            self._trial = False
+
+
+class LatencyStats:
+    """Rolling latencies and outcomes of the last `window` calls."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self.calls = deque(maxlen=window)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.calls.append((seconds, ok))
+            self.total += 1
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self.calls if ok)
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))], 4)
+
+    def snapshot(self):
+        with self._lock:
+            calls = list(self.calls)
+        errors = sum(1 for _, ok in calls if not ok)
+        return {'calls': self.total, 'window': len(calls), 'errors': errors,
+                'error_rate': round(errors / len(calls), 3) if calls else 0.0,
+                'p50': self.percentile(50), 'p95': self.percentile(95), 'p99': self.percentile(99)}
+
+
+class Provider:
+    """A configured LLM client. Subclasses implement setup() and generate()."""
+
+    name = 'provider'
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.stats = LatencyStats()     # whole answers
+        self.ttft = LatencyStats()      # streamed answers: time to the first piece
+
+    def setup(self):
+        """Import and configure the client; return False if the provider cannot be used."""
+        return True
+
+    def generate(self, question, history, context=None):
+        raise NotImplementedError
+
+    def stream(self, question, history, context=None):
+        """Yield the answer in pieces as they arrive; by default all at once."""
+        yield self.generate(question, history, context)
+
+
+class GeminiProvider(Provider):
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model='gemini-pro', timeout=DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.api_key = api_key
+        self.model_name = model
+        self.model = None
+
+    def setup(self):
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            return False
+        genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel(self.model_name)
+        return True
+
+    def generate(self, question, history, context=None):
+        response = self.model.generate_content(build_prompt(question, history, context),
+                                               request_options={'timeout': self.timeout})
+        return (response.text or '').strip()
+
+    def stream(self, question, history, context=None):
+        response = self.model.generate_content(build_prompt(question, history, context), stream=True,
+                                               request_options={'timeout': self.timeout})
+        for chunk in response:
+            yield chunk.text or ''
+
+
+class OpenAIProvider(Provider):
+
+    name = 'openai'
+
+    def __init__(self, api_key, model='gpt-3.5-turbo', timeout=DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.api_key = api_key
+        self.model_name = model
+        self.client = None
+        self.legacy = None
+
+    def setup(self):
+        try:
+            import openai
+        except ImportError:
+            return False
+        if hasattr(openai, 'OpenAI'):
+            # openai>=1.0: the client keeps an httpx connection pool alive between calls
+            self.client = openai.OpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+        else:
+            openai.api_key = self.api_key
+            self.legacy = openai
+        return True
+
+    def generate(self, question, history, context=None):
+        messages = build_messages(question, history, context)
+        if self.client is not None:
+            resp = self.client.chat.completions.create(model=self.model_name, messages=messages, max_tokens=300)
+        else:
+            resp = self.legacy.ChatCompletion.create(model=self.model_name, messages=messages, max_tokens=300,
+                                                     request_timeout=self.timeout)
+        return (resp.choices[0].message.content or '').strip()
+
+    def stream(self, question, history, context=None):
+        messages = build_messages(question, history, context)
+        if self.client is not None:
+            chunks = self.client.chat.completions.create(model=self.model_name, messages=messages, max_tokens=300,
+                                                         stream=True)
+            for chunk in chunks:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ''
+        else:
+            chunks = self.legacy.ChatCompletion.create(model=self.model_name, messages=messages, max_tokens=300,
+                                                       request_timeout=self.timeout, stream=True)
+            for chunk in chunks:
+                yield chunk.choices[0].delta.get('content') or ''
+
+
+class FakeProvider(Provider):
+    """Local stand-in for tests: canned answers, optional latency and failures."""
+
+    name = 'fake'
+
+    def __init__(self, answers=None, delay=0.0, fail=False, timeout=DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.answers = answers or {}
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def generate(self, question, history, context=None):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake provider failure")
+        return self.answers.get(question, f"[fake] {question}")
+
+    def stream(self, question, history, context=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("fake provider failure")
+        for i, word in enumerate(self.answers.get(question, f"[fake] {question}").split(' ')):
+            if self.delay:
+                time.sleep(self.delay / 10)
+            yield (' ' if i else '') + word
+
+
+def providers_from_env(environ=None):
+    """Provider instances in AI_PROVIDERS order (not yet set up)."""
+    env = os.environ if environ is None else environ
+    order = [name.strip() for name in env.get('AI_PROVIDERS', 'gemini,openai').split(',') if name.strip()]
+    providers = []
+    for name in order:
+        timeout = float(env.get(f"{name.upper()}_TIMEOUT", DEFAULT_TIMEOUT))
+        if name == 'gemini' and env.get('GEMINI_API_KEY'):
+            providers.append(GeminiProvider(env['GEMINI_API_KEY'], env.get('GEMINI_MODEL', 'gemini-pro'), timeout))
+        elif name == 'openai' and env.get('OPENAI_API_KEY'):
+            providers.append(OpenAIProvider(env['OPENAI_API_KEY'], env.get('OPENAI_MODEL', 'gpt-3.5-turbo'), timeout))
+        elif name == 'fake':
+            providers.append(FakeProvider(delay=float(env.get('FAKE_AI_DELAY', 0)), timeout=timeout))
+    return providers
+
+
+class _Call:
+    """One provider call made by ask(). Its outcome is recorded once: by the call
+    itself, or by ask() when it gives up on it; whatever comes second is ignored."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = time.monotonic()
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def settle(self):
+        with self._lock:
+            settled, self._settled = self._settled, True
+        return not settled
+
+    def record(self, ok):
+        if self.settle():
+            self.provider.stats.record(time.monotonic() - self.started, ok)
+            if ok:
+                self.provider.breaker.record_success()
+            else:
+                self.provider.breaker.record_failure()
+            return True
+        return False
+
+    def abandon(self):
+        """Another provider answered first: this call counts neither way."""
+        if self.settle():
+            self.provider.breaker.release()
+
+
+class ProviderRegistry:
+    """The configured providers of this worker, rebuilt after fork.
+
+    ask() runs them under one deadline: each provider gets its own timeout,
+    providers whose circuit is open are skipped, and with hedge_after set the
+    next provider is started when the current one has not answered by then;
+    the first answer wins. Calls run on a small per-worker thread pool, so a
+    hung provider costs a pool thread, not the request.
+    """
+
+    def __init__(self, factory=providers_from_env, hedge_after=None, deadline=DEFAULT_DEADLINE, workers=8):
+        self.factory = factory
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self.workers = workers
+        self._pid = None
+        self._providers = []
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, environ=None):
+        env = os.environ if environ is None else environ
+        hedge_after = env.get('AI_HEDGE_AFTER')
+        return cls(hedge_after=float(hedge_after) if hedge_after else None,
+                   deadline=float(env.get('AI_DEADLINE', DEFAULT_DEADLINE)),
+                   factory=lambda: providers_from_env(env))
+
+    def set(self, providers):
+        """Replace the providers (already instantiated); used by tests."""
+        self._providers = [p for p in providers if self._setup(p)]
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-provider')
+        self._pid = os.getpid()
+        return self._providers
+
+    def _setup(self, provider):
+        try:
+            return provider.setup()
+        except Exception:
+            log.exception("Could not set up AI provider %s", provider.name)
+            return False
+
+    def providers(self):
+        if self._pid != os.getpid():
+            self.set(self.factory())
+        return self._providers
+
+    def _call(self, call, question, history, context):
+        provider = call.provider
+        try:
+            text = provider.generate(question, history, context)
+        except Exception:
+            if call.record(False):
+                log.warning("AI provider %s failed", provider.name, exc_info=True)
+            raise
+        call.record(bool(text))
+        return text
+
+    def ask(self, question, history, context=None):
+        """First non-empty answer from the providers, or None if none answered in time."""
+        queue = deque(self.providers())
+        end = time.monotonic() + self.deadline
+        running = {}    # future -> _Call
+
+        def launch():
+            # the breaker is asked only when a provider is really called (it may grant a half-open trial)
+            while queue:
+                provider = queue.popleft()
+                if provider.breaker.allow():
+                    call = _Call(provider)
+                    running[self._executor.submit(self._call, call, question, history, context)] = call
+                    return
+
+        def give_up(call):
+            # the pool thread finishes on the client's own timeout; its late outcome is ignored
+            if call.record(False):
+                log.warning("AI provider %s timed out after %.1fs", call.provider.name,
+                            time.monotonic() - call.started)
+
+        launch()
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= end:
+                    break
+                # wake up for the earliest of: the deadline, a provider's own timeout, the hedge point
+                wake = min([end] + [call.started + call.provider.timeout for call in running.values()])
+                if queue and self.hedge_after is not None:
+                    wake = min(wake, max(call.started for call in running.values()) + self.hedge_after)
+                done, _ = wait(running, timeout=max(0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    if future.exception() is None and future.result():
+                        return future.result()
+                now = time.monotonic()
+                for future, call in list(running.items()):
+                    if now - call.started >= call.provider.timeout:
+                        running.pop(future)
+                        give_up(call)
+                hedge_due = self.hedge_after is not None and all(
+                    now - call.started >= self.hedge_after for call in running.values())
+                if queue and (not running or hedge_due):
+                    launch()
+            # out of time: whatever is still running has timed out
+            for call in running.values():
+                give_up(call)
+            running.clear()
+            return None
+        finally:
+            # an answer arrived: the calls it beat are abandoned without an outcome
+            for call in running.values():
+                call.abandon()
+
+    def stats(self):
+        return {p.name: dict(p.stats.snapshot(), circuit=p.breaker.state, first_token=p.ttft.snapshot())
+                for p in self._providers}
+
+
+registry = ProviderRegistry.from_env()
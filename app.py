@@ -1,16 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, send_from_directory, abort
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, send_from_directory, abort, Response, stream_with_context, g
 from functools import wraps
-import sqlite3
+import click
 from datetime import datetime, timedelta
 import os
+import time
 import json
-from translations import translations
+import catalog
 import smtplib
 from email.message import EmailMessage
 from urllib.parse import quote
+import ai_cache
+import ai_fallback
+import ai_pool
+import ai_providers
+import conversations
+import db
+import etags
+import events
+import migrations
+import reminders
+import sessions
+import tracker
+import tracker_archive
+import tracker_export
+import tracker_trends
+import tips_index
+from cache import LRUCache
+from db import get_db
+from etags import conditional
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Change this in production
+# One pooled SQLite connection per request (see db.py)
+db.init_app(app)
+# Session data lives in the database; the cookie only holds its id (see sessions.py)
+sessions.init_app(app)
+tracker_archive.init_app(app)
 # Admin credentials (change in production or use env vars)
 app.config['ADMIN_USER'] = 'admin'
 app.config['ADMIN_PASS'] = 'admin123'
@@ -55,219 +80,148 @@ def admin_required(f):
         user_email = session.get('user_id')
         if user_email:
             try:
-                conn = sqlite3.connect('babycare.db')
+                conn = get_db()
                 c = conn.cursor()
                 # Check if is_admin column exists
-                c.execute("PRAGMA table_info('users')")
-                cols = [r[1] for r in c.fetchall()]
-                if 'is_admin' in cols:
+                if db.schema.has_column('users', 'is_admin'):
                     c.execute("SELECT is_admin FROM users WHERE email = ?", (user_email,))
                     row = c.fetchone()
                     if row and int(row[0]) == 1:
-                        conn.close()
                         return f(*args, **kwargs)
-                conn.close()
             except Exception:
                 pass
 
         return redirect(url_for('admin_login'))
     return decorated_admin
 
-# Initialize database
+# Initialize database: apply pending migrations (see migrations.py) and
+# refresh the in-memory schema registry. When the schema is already current
+# this is a single version check.
 def init_db():
-    conn = sqlite3.connect('babycare.db')
-    c = conn.cursor()
-    
-    # Contacts table
-    c.execute('''CREATE TABLE IF NOT EXISTS contacts
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 name TEXT NOT NULL,
-                 email TEXT NOT NULL,
-                 message TEXT NOT NULL,
-                 date TEXT NOT NULL)''')
-    
-    # Users table (for user accounts)
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 email TEXT UNIQUE NOT NULL,
-                 password TEXT NOT NULL,
-                 parent_name TEXT NOT NULL,
-                 baby_name TEXT NOT NULL,
-                 baby_dob TEXT NOT NULL,
-                 baby_age TEXT,
-                 phone TEXT,
-                 address TEXT,
-                 created_at TEXT NOT NULL)''')
-
-    # Ensure is_admin column exists on users table (safe migration)
+    conn = db.connect(app.config['DATABASE'])
     try:
-        c.execute("PRAGMA table_info('users')")
-        cols = [r[1] for r in c.fetchall()]
-        if 'is_admin' not in cols:
-            c.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
-        if 'language' not in cols:
-            c.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'en'")
-        if 'is_subscribed' not in cols:
-            c.execute("ALTER TABLE users ADD COLUMN is_subscribed INTEGER DEFAULT 0")
-        if 'subscription_pending' not in cols:
-            c.execute("ALTER TABLE users ADD COLUMN subscription_pending INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    # Ensure contacts table has columns for admin replies
+        applied = migrations.migrate(conn)
+        db.schema.load(conn)
+    finally:
+        conn.close()
+    return applied
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending database migrations."""
+    applied = init_db()
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    print(f"Database is at schema version {migrations.latest_version()}")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute tracker_daily_stats from the raw baby_tracker rows."""
+    conn = db.connect(app.config['DATABASE'])
     try:
-        c.execute("PRAGMA table_info('contacts')")
-        contact_cols = [r[1] for r in c.fetchall()]
-        if 'admin_reply' not in contact_cols:
-            c.execute("ALTER TABLE contacts ADD COLUMN admin_reply TEXT")
-        if 'replied_at' not in contact_cols:
-            c.execute("ALTER TABLE contacts ADD COLUMN replied_at TEXT")
-        if 'replied_by' not in contact_cols:
-            c.execute("ALTER TABLE contacts ADD COLUMN replied_by TEXT")
-    except Exception:
-        pass
-    
-    # Products table
-    c.execute('''CREATE TABLE IF NOT EXISTS products
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 name TEXT NOT NULL,
-                 description TEXT NOT NULL,
-                 price REAL NOT NULL,
-                 image TEXT NOT NULL,
-                 category TEXT NOT NULL)''')
-    
-    # Cart table (simplified for demo)
-    c.execute('''CREATE TABLE IF NOT EXISTS cart
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 product_id INTEGER NOT NULL,
-                 quantity INTEGER NOT NULL,
-                 session_id TEXT NOT NULL)''')
-    
-    # Baby Tracker table (for feeding, diaper, sleep tracking)
-    c.execute('''CREATE TABLE IF NOT EXISTS baby_tracker
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 user_id TEXT NOT NULL,
-                 activity_type TEXT NOT NULL,
-                 start_time TEXT NOT NULL,
-                 end_time TEXT,
-                 notes TEXT,
-                 created_at TEXT NOT NULL,
-                 FOREIGN KEY(user_id) REFERENCES users(email))''')
-    
-    # Reminders table
-    c.execute('''CREATE TABLE IF NOT EXISTS reminders
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 user_id TEXT NOT NULL,
-                 message TEXT NOT NULL,
-                 remind_time TEXT NOT NULL,
-                 created_at TEXT NOT NULL,
-                 FOREIGN KEY(user_id) REFERENCES users(email))''')
-
-    # Doctors table
-    c.execute('''CREATE TABLE IF NOT EXISTS doctors
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 name TEXT NOT NULL,
-                 specialization TEXT NOT NULL,
-                 email TEXT UNIQUE NOT NULL,
-                 password TEXT NOT NULL,
-                 image TEXT,
-                 phone TEXT,
-                 video_link TEXT,
-                 is_available INTEGER DEFAULT 1)''')
-
-    # Appointments table
-    c.execute('''CREATE TABLE IF NOT EXISTS appointments
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 user_id TEXT NOT NULL,
-                 doctor_id INTEGER NOT NULL,
-                 appointment_time TEXT NOT NULL,
-                 type TEXT NOT NULL,
-                 status TEXT DEFAULT 'Pending',
-                 created_at TEXT NOT NULL,
-                 FOREIGN KEY(user_id) REFERENCES users(email),
-                 FOREIGN KEY(doctor_id) REFERENCES doctors(id))''')
-
-    # Insert sample products if they don't exist
-    sample_products = [
-        ('Diapers - Newborn Size', 'Soft, absorbent diapers for newborns (30 count)', 350.00, 'https://images.unsplash.com/photo-1519689680058-324335c77eba?auto=format&fit=crop&w=500', 'Diapering'),
-        ('Baby Wipes', 'Gentle, hypoallergenic wipes for sensitive skin (80 count)', 150.00, 'https://images.unsplash.com/photo-1556228720-19875c4b84b2?auto=format&fit=crop&w=500', 'Diapering'),
-        ('Baby Bottles Set', 'BPA-free bottles with anti-colic system (3 pack)', 450.00, 'https://images.unsplash.com/photo-1595347097560-69238724e7bd?auto=format&fit=crop&w=500', 'Feeding'),
-        ('Baby Formula', 'Nutritious formula for newborns (400g)', 650.00, 'https://images.unsplash.com/photo-1632053009503-2b28537e3824?auto=format&fit=crop&w=500', 'Feeding'),
-        ('Onesies - 5 Pack', 'Soft cotton onesies in assorted colors (Newborn size)', 999.00, 'https://images.unsplash.com/photo-1522771753035-0a15395031b2?auto=format&fit=crop&w=500', 'Clothing'),
-        ('Baby Blanket', 'Soft, warm blanket for swaddling and comfort', 550.00, 'https://images.unsplash.com/photo-1513159446162-54eb8bdaa79b?auto=format&fit=crop&w=500', 'Bedding'),
-        ('Baby Shampoo & Body Wash', 'Tear-free, gentle cleanser for baby', 250.00, 'https://images.unsplash.com/photo-1556228578-0d85b1a4d571?auto=format&fit=crop&w=500', 'Bathing'),
-        ('Baby Lotion', 'Moisturizing lotion for delicate skin', 220.00, 'https://images.unsplash.com/photo-1608248597279-f99d160bfbc8?auto=format&fit=crop&w=500', 'Bathing'),
-        ('Pacifiers - 2 Pack', 'Orthodontic pacifiers for newborns', 200.00, 'https://images.unsplash.com/photo-1596464716127-f9a0859d0437?auto=format&fit=crop&w=500', 'Comfort'),
-        ('Baby Thermometer', 'Digital thermometer for accurate temperature reading', 300.00, 'https://images.unsplash.com/photo-1584634731339-252c581abfc5?auto=format&fit=crop&w=500', 'Health'),
-    ]
-    
-    # Check if products already exist
-    c.execute("SELECT COUNT(*) FROM products")
-    if c.fetchone()[0] == 0:
-        c.executemany("INSERT INTO products (name, description, price, image, category) VALUES (?, ?, ?, ?, ?)", 
-                     sample_products)
-    else:
-        # Update existing products to use URLs if they are using old filenames
-        updates = {
-            'diapers.jpg': 'https://images.unsplash.com/photo-1519689680058-324335c77eba?auto=format&fit=crop&w=500',
-            'wipes.jpg': 'https://images.unsplash.com/photo-1556228720-19875c4b84b2?auto=format&fit=crop&w=500',
-            'bottles.jpg': 'https://images.unsplash.com/photo-1595347097560-69238724e7bd?auto=format&fit=crop&w=500',
-            'formula.jpg': 'https://images.unsplash.com/photo-1632053009503-2b28537e3824?auto=format&fit=crop&w=500',
-            'onesies.jpg': 'https://images.unsplash.com/photo-1522771753035-0a15395031b2?auto=format&fit=crop&w=500',
-            'blanket.jpg': 'https://images.unsplash.com/photo-1513159446162-54eb8bdaa79b?auto=format&fit=crop&w=500',
-            'shampoo.jpg': 'https://images.unsplash.com/photo-1556228578-0d85b1a4d571?auto=format&fit=crop&w=500',
-            'lotion.jpg': 'https://images.unsplash.com/photo-1608248597279-f99d160bfbc8?auto=format&fit=crop&w=500',
-            'pacifiers.jpg': 'https://images.unsplash.com/photo-1596464716127-f9a0859d0437?auto=format&fit=crop&w=500',
-            'thermometer.jpg': 'https://images.unsplash.com/photo-1584634731339-252c581abfc5?auto=format&fit=crop&w=500'
-        }
-        for old, new in updates.items():
-            c.execute("UPDATE products SET image = ? WHERE image = ?", (new, old))
-    
-    # Insert sample doctors if none exist
-    c.execute("SELECT COUNT(*) FROM doctors")
-    if c.fetchone()[0] == 0:
-        sample_doctors = [
-            ('Dr. Sarah Smith', 'Pediatrician', 'sarah.smith@clinic.com', 'doc123', 'https://images.unsplash.com/photo-1559839734-2b71ea197ec2?auto=format&fit=crop&w=500', '+1234567890', 'https://meet.google.com/abc-defg-hij'),
-            ('Dr. John Doe', 'Child Psychologist', 'john.doe@clinic.com', 'doc123', 'https://images.unsplash.com/photo-1612349317150-e413f6a5b16d?auto=format&fit=crop&w=500', '+1987654321', 'https://meet.google.com/xyz-uvwx-yz')
-        ]
-        c.executemany("INSERT INTO doctors (name, specialization, email, password, image, phone, video_link) VALUES (?, ?, ?, ?, ?, ?, ?)", sample_doctors)
-
-    # Ensure doctors table has email and password columns (migration for existing DB)
+        tracker.rebuild_rollups(conn.cursor(), archive=tracker_archive.get_store(app))
+        conn.commit()
+    finally:
+        conn.close()
+    print("Tracker rollups rebuilt")
+
+@app.cli.command('archive-tracker')
+@click.option('--days', type=int, default=None,
+              help='Archive entries that started more than this many days ago (default TRACKER_ARCHIVE_DAYS).')
+@click.option('--user', 'user_id', default=None, help='Only archive this user.')
+def archive_tracker_command(days, user_id):
+    """Move old baby_tracker rows into per-user monthly archive files."""
+    days = days if days is not None else app.config['TRACKER_ARCHIVE_DAYS']
+    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_ts = tracker.to_epoch(datetime(cutoff.year, cutoff.month, cutoff.day))
+    conn = db.connect(app.config['DATABASE'])
     try:
-        c.execute("PRAGMA table_info('doctors')")
-        cols = [r[1] for r in c.fetchall()]
-        if 'email' not in cols:
-            c.execute("ALTER TABLE doctors ADD COLUMN email TEXT")
-            c.execute("UPDATE doctors SET email = replace(lower(name), ' ', '.') || '@clinic.com' WHERE email IS NULL")
-        if 'password' not in cols:
-            c.execute("ALTER TABLE doctors ADD COLUMN password TEXT DEFAULT 'doc123'")
-        
-        # Ensure appointments table has notes column
-        c.execute("PRAGMA table_info('appointments')")
-        appt_cols = [r[1] for r in c.fetchall()]
-        if 'notes' not in appt_cols:
-            c.execute("ALTER TABLE appointments ADD COLUMN notes TEXT")
-    except Exception:
-        pass
-
-    # Newsletter Subscribers table
-    c.execute('''CREATE TABLE IF NOT EXISTS newsletter_subscribers
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 email TEXT UNIQUE NOT NULL,
-                 subscribed_at TEXT NOT NULL)''')
+        moved = tracker_archive.archive_all(conn, tracker_archive.get_store(app), cutoff_ts, user_id)
+    finally:
+        conn.close()
+    for user, count in moved.items():
+        print(f"Archived {count} entries for {user}")
+    print(f"Archived {sum(moved.values())} tracker entries older than {cutoff.strftime('%Y-%m-%d')}")
 
-    # Ensure products table has sale_price column
-    try:
-        c.execute("PRAGMA table_info('products')")
-        prod_cols = [r[1] for r in c.fetchall()]
-        if 'sale_price' not in prod_cols:
-            c.execute("ALTER TABLE products ADD COLUMN sale_price REAL")
-            # Set some sale prices for demo (approx 15% off for some items)
-            c.execute("UPDATE products SET sale_price = price * 0.85 WHERE id IN (1, 3, 5, 7, 9)")
-    except Exception:
-        pass
+if os.environ.get('MIGRATE_ON_STARTUP', '1') != '0':
+    init_db()
+else:
+    db.schema.refresh(app.config['DATABASE'])
+
+# Import and configure the AI provider clients now rather than on the first question
+ai_providers.registry.providers()
+
+# Provider answers keyed by normalized question + recent history; AI_CACHE_SHARED=1
+# also keeps them in SQLite for the other workers
+answer_cache = ai_cache.AnswerCache(maxsize=int(os.environ.get('AI_CACHE_SIZE', ai_cache.DEFAULT_SIZE)),
+                                    ttl=int(os.environ.get('AI_CACHE_TTL', ai_cache.DEFAULT_TTL)),
+                                    shared=os.environ.get('AI_CACHE_SHARED', '0') == '1')
+# AI history lives server-side; the session only holds the conversation id
+conversation_store = conversations.ConversationStore(
+    maxsize=int(os.environ.get('AI_CONVERSATION_CACHE', conversations.DEFAULT_SIZE)))
+# /ai/ask runs on its own bounded pool; when it is full the request gets a 503 with Retry-After.
+# Request threads per process (WEB_THREADS, shared with gunicorn.conf.py) are split:
+# AI_RESERVED_THREADS (half) always stay free for other pages, SSE_STREAMS (a quarter)
+# can be held by open subscription streams, and running plus queued AI requests get the rest.
+WEB_THREADS = int(os.environ.get('WEB_THREADS', ai_pool.DEFAULT_WEB_THREADS))
+SSE_STREAMS = int(os.environ.get('SSE_STREAMS', ai_pool.stream_share(WEB_THREADS)))
+_ai_workers, _ai_queue = ai_pool.size_for(
+    WEB_THREADS,
+    reserved=int(os.environ['AI_RESERVED_THREADS']) if os.environ.get('AI_RESERVED_THREADS') else None,
+    streams=SSE_STREAMS,
+    workers=int(os.environ.get('AI_WORKERS', ai_pool.DEFAULT_WORKERS)),
+    queue_size=int(os.environ.get('AI_QUEUE', ai_pool.DEFAULT_QUEUE)))
+ai_request_pool = ai_pool.AIPool(workers=_ai_workers, queue_size=_ai_queue,
+                                 deadline=float(os.environ.get('AI_REQUEST_DEADLINE', ai_pool.DEFAULT_DEADLINE)))
+
+# ===== CONDITIONAL GET =====
+# Every ETag includes the deployed templates and schema; endpoints add their own
+# version keys below (see etags.conditional)
+VIDEOS_VERSION = etags.files_version(os.path.join(app.root_path, 'static', 'videos'))
+CATALOG_SCOPE = 'catalog'   # data_versions scope: bump it whenever products change
+app.config['ETAG_VERSION'] = etags.make_etag(migrations.latest_version(),
+                                             etags.files_version(os.path.join(app.root_path, 'templates')))
+
+
+def cart_count():
+    """Items in the visitor's cart, queried once per request (page_state and the template share it)."""
+    if 'cart_count' not in g:
+        g.cart_count = 0
+        if 'session_id' in session:
+            row = get_db().execute("SELECT SUM(quantity) FROM cart WHERE session_id = ?",
+                                   (session['session_id'],)).fetchone()
+            g.cart_count = row[0] or 0
+    return g.cart_count
+
+
+def page_state():
+    """What base.html renders from the session and the cart badge."""
+    return (session.get('user_id'), session.get('user_name'), session.get('doctor_id'),
+            session.get('admin_logged_in'), session.get('is_admin'), session.get('language', 'en'),
+            catalog.get(session.get('language', 'en')).version, cart_count())
+
+
+def catalog_page_key(*args, **kwargs):
+    return page_state() + (db.data_version(get_db(), CATALOG_SCOPE),)
+
+
+def subscription_scope(user_email):
+    """data_versions scope bumped whenever the user's subscription flags change."""
+    return f"user:{user_email}"
+
+# Reminder delivery runs in a background thread per worker, started by the
+# first request so it is not inherited across a pre-fork
+reminder_scheduler = reminders.ReminderScheduler(app.config['DATABASE'])
+
+@reminder_scheduler.on_fire
+def email_reminder(reminder_id, user_id, message, remind_ts):
+    at = tracker.from_epoch(remind_ts).strftime("%I:%M %p")
+    send_email(user_id, f"Reminder: {message}", f"This is your Dream Baby Care reminder for {at}:\n\n{message}")
 
-    conn.commit()
-    conn.close()
+@app.before_request
+def start_reminder_scheduler():
+    if os.environ.get('REMINDER_SCHEDULER', '1') != '0':
+        reminder_scheduler.start()
 
 # Ensure session_id exists for cart operations
 @app.before_request
@@ -287,43 +241,31 @@ def ensure_session_id():
 def load_user_language():
     if 'user_id' in session:
         try:
-            conn = sqlite3.connect('babycare.db')
+            conn = get_db()
             c = conn.cursor()
             c.execute("SELECT language FROM users WHERE email = ?", (session['user_id'],))
             result = c.fetchone()
-            conn.close()
-            if result and result[0]:
+            # assign only on change, so the session is not rewritten on every request
+            if result and result[0] and session.get('language') != result[0]:
                 session['language'] = result[0]
         except Exception:
             pass
 
 @app.context_processor
 def inject_language():
-    lang = session.get('language', 'en')
-    if lang not in translations:
-        lang = 'en'
-    
+    lang_data = catalog.get(session.get('language', 'en'))
+    lang = lang_data.lang
+
     # Inject cart count
-    cart_count = 0
-    if 'session_id' in session:
-        conn = None
-        try:
-            conn = sqlite3.connect('babycare.db')
-            c = conn.cursor()
-            c.execute("SELECT SUM(quantity) FROM cart WHERE session_id = ?", (session['session_id'],))
-            res = c.fetchone()
-            if res and res[0]:
-                cart_count = res[0]
-        except:
-            pass
-        finally:
-            if conn:
-                conn.close()
+    try:
+        count = cart_count()
+    except Exception:
+        count = 0
 
     # Inject logo URL globally (ensure you have a file at static/images/Dream_Baby_Care_Logo (1).jpg)
     logo = 'https://res.cloudinary.com/duucdndfx/image/upload/v1767200335/WhatsApp_Image_2025-11-23_at_10.59.52_PM_nwqgbo.jpg'
 
-    return dict(lang=lang, lang_data=translations.get(lang, {}), cart_count=cart_count, logo=logo)
+    return dict(lang=lang, lang_data=lang_data, cart_count=count, logo=logo)
 
 # Admin actions logging helpers
 def get_client_ip():
@@ -383,9 +325,17 @@ def read_last_admin_action():
 # Helper: send notification email to admin when a user requests subscription
 def send_admin_notification(subject, body):
     # Requires SMTP settings in app.config: SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_USE_TLS (optional), ADMIN_NOTIFICATION_EMAIL
+    admin_email = app.config.get('ADMIN_NOTIFICATION_EMAIL')
+    if not admin_email:
+        return False
+    return send_email(admin_email, subject, body)
+
+
+def send_email(to, subject, body):
+    """Send a plain-text email using the SMTP settings; returns False if unconfigured or it fails."""
     host = app.config.get('SMTP_HOST')
     admin_email = app.config.get('ADMIN_NOTIFICATION_EMAIL')
-    if not host or not admin_email:
+    if not host:
         return False
     try:
         port = app.config.get('SMTP_PORT', 587)
@@ -395,8 +345,8 @@ def send_admin_notification(subject, body):
 
         msg = EmailMessage()
         msg['Subject'] = subject
-        msg['From'] = user if user else admin_email
-        msg['To'] = admin_email
+        msg['From'] = user if user else (admin_email or to)
+        msg['To'] = to
         msg.set_content(body)
 
         if use_tls:
@@ -429,6 +379,7 @@ def home():
 # About page
 @app.route('/about')
 @login_required
+@conditional(page_state)
 def about():
     about_info = {
         'title': 'About Dream Baby Care',
@@ -451,16 +402,15 @@ def about():
 # Set language preference
 @app.route('/set_language/<lang>')
 def set_language(lang):
-    if lang in translations:
+    if catalog.is_supported(lang):
         session['language'] = lang
         # Update user's language preference in database if logged in
         if 'user_id' in session:
             try:
-                conn = sqlite3.connect('babycare.db')
+                conn = get_db()
                 c = conn.cursor()
                 c.execute("UPDATE users SET language = ? WHERE email = ?", (lang, session['user_id']))
                 conn.commit()
-                conn.close()
             except Exception:
                 pass
     return redirect(request.referrer or url_for('home'))
@@ -468,22 +418,12 @@ def set_language(lang):
 # Tips page
 @app.route('/tips')
 @login_required
+@conditional(lambda: page_state() + (tuple(load_subscription_state().values()), VIDEOS_VERSION))
 def tips():
-    # Get user's language preference from database (or session fallback)
-    lang = session.get('language', 'en')
-    
-    if lang not in translations:
-        lang = 'en'
-    
-    # Get translations for current language
-    lang_data = translations[lang]
-    
-    # Tip categories mapping to translation keys
-    tip_keys = ['feeding', 'diapering', 'sleep', 'bathing', 'crying']
-    tips_content = {}
-    for key in tip_keys:
-        if key in lang_data['tips']:
-            tips_content[key] = lang_data['tips'][key]
+    # Get user's language preference (compiled catalog, tips already rendered to HTML)
+    lang_data = catalog.get(session.get('language', 'en'))
+    lang = lang_data.lang
+    tips_content = lang_data.tips
     
     # Look for videos in static/videos/<slug>/
     videos_by_category = {}
@@ -500,9 +440,10 @@ def tips():
                     video_list.append({'filename': fname, 'url': url})
         videos_by_category[cat] = video_list
 
-    # Determine subscription state from session (keeps template simple)
-    is_sub = session.get('is_subscribed', 0)
-    sub_pending = session.get('subscription_pending', 0)
+    # Subscription state from the DB, so an approval shows on the next load
+    state = load_subscription_state()
+    is_sub = state['is_subscribed']
+    sub_pending = state['subscription_pending']
 
     return render_template('tips.html', 
                          lang=lang,
@@ -516,12 +457,12 @@ def tips():
 # Shop page
 @app.route('/shop')
 @login_required
+@conditional(catalog_page_key)
 def shop():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM products")
     products = c.fetchall()
-    conn.close()
     
     # Group products by category
     categories = {}
@@ -542,12 +483,12 @@ def shop():
 
 # Product detail page
 @app.route('/product/<int:product_id>')
+@conditional(catalog_page_key)
 def product_detail(product_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM products WHERE id = ?", (product_id,))
     product = c.fetchone()
-    conn.close()
     
     if product:
         # Convert tuple to list to make it mutable
@@ -564,27 +505,24 @@ def product_detail(product_id):
 # Add to cart functionality
 @app.route('/add_to_cart/<int:product_id>')
 def add_to_cart(product_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM products WHERE id = ?", (product_id,))
     product = c.fetchone()
     
     if product:
-        conn.close()
         # Redirect to Blinkit search page for the product
         return redirect(f"https://blinkit.com/s/?q={quote(product[1])}")
     
-    conn.close()
     return redirect(url_for('shop'))
 
 @app.route('/remove_from_cart/<int:product_id>')
 def remove_from_cart(product_id):
     if 'session_id' in session:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("DELETE FROM cart WHERE product_id = ? AND session_id = ?", (product_id, session['session_id']))
         conn.commit()
-        conn.close()
         flash('Item removed from cart', 'info')
     return redirect(url_for('cart'))
 
@@ -592,12 +530,11 @@ def remove_from_cart(product_id):
 @login_required
 def checkout():
     if 'session_id' in session:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         # In a real app, you would create an order record here
         c.execute("DELETE FROM cart WHERE session_id = ?", (session['session_id'],))
         conn.commit()
-        conn.close()
         flash('Order placed successfully! Thank you for shopping.', 'success')
     return redirect(url_for('shop'))
 
@@ -607,7 +544,7 @@ def cart():
     if 'session_id' not in session:
         return render_template('cart.html', cart_items=[], total=0)
     
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute('''SELECT products.id, products.name, products.price, products.image, cart.quantity 
                  FROM cart 
@@ -626,7 +563,6 @@ def cart():
     
     total = sum(item[2] * item[4] for item in cart_items)  # price * quantity
     
-    conn.close()
     return render_template('cart.html', cart_items=cart_items, total=total)
 
 # Contact page
@@ -634,7 +570,7 @@ def cart():
 @login_required
 def contact():
     # Require subscription to contact
-    if not session.get('is_subscribed'):
+    if not load_subscription_state()['is_subscribed']:
         return redirect(url_for('subscribe'))
 
     if request.method == 'POST':
@@ -644,21 +580,19 @@ def contact():
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # Save to database
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("INSERT INTO contacts (name, email, message, date) VALUES (?, ?, ?, ?)",
                   (name, email, message, date))
         conn.commit()
-        conn.close()
         
         return redirect(url_for('contact_success'))
 
     # Fetch doctors for appointment/call section
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM doctors")
     doctors = c.fetchall()
-    conn.close()
 
     return render_template('contact.html', doctors=doctors)
 
@@ -669,12 +603,11 @@ def book_appointment():
     appt_time = request.form.get('appointment_time')
     appt_type = request.form.get('type') # video or voice
     
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO appointments (user_id, doctor_id, appointment_time, type, created_at) VALUES (?, ?, ?, ?, ?)",
               (session['user_id'], doctor_id, appt_time, appt_type, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
     conn.commit()
-    conn.close()
     
     flash('Appointment request sent successfully!', 'success')
     return redirect(url_for('contact'))
@@ -692,7 +625,7 @@ def subscribe_newsletter():
         return redirect(request.referrer or url_for('home'))
 
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         # Check if already subscribed
         c.execute("SELECT * FROM newsletter_subscribers WHERE email = ?", (email,))
@@ -703,7 +636,6 @@ def subscribe_newsletter():
             c.execute("INSERT INTO newsletter_subscribers (email, subscribed_at) VALUES (?, ?)", (email, subscribed_at))
             conn.commit()
             flash('Thank you for subscribing to our newsletter!', 'success')
-        conn.close()
     except Exception:
         flash('An error occurred while subscribing.', 'danger')
 
@@ -712,12 +644,11 @@ def subscribe_newsletter():
 @app.route('/admin/contacts')
 @admin_required
 def admin_contacts():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     # Select columns including reply info if present
     try:
-        c.execute("PRAGMA table_info('contacts')")
-        cols = [r[1] for r in c.fetchall()]
+        cols = db.schema.columns('contacts')
         if 'admin_reply' in cols:
             c.execute("SELECT id, name, email, message, date, admin_reply, replied_at, replied_by FROM contacts ORDER BY date DESC")
         else:
@@ -725,7 +656,6 @@ def admin_contacts():
         contacts = c.fetchall()
     except Exception:
         contacts = []
-    conn.close()
     return render_template('admin_contacts.html', contacts=contacts)
 
 
@@ -738,7 +668,7 @@ def admin_reply_contact(contact_id):
         return redirect(request.referrer or url_for('admin_contacts'))
 
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         # Update contact with reply, replied_at and replied_by
         replied_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -757,7 +687,6 @@ def admin_reply_contact(contact_id):
                 send_admin_notification(subject, body)
         except Exception:
             pass
-        conn.close()
         flash('Reply saved and user notified (if SMTP configured).', 'success')
     except Exception:
         flash('Failed to save reply.', 'danger')
@@ -767,11 +696,10 @@ def admin_reply_contact(contact_id):
 @app.route('/admin/doctors')
 @admin_required
 def admin_doctors():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM doctors")
     doctors = c.fetchall()
-    conn.close()
     return render_template('admin_doctors.html', doctors=doctors)
 
 @app.route('/admin/doctor/add', methods=['POST'])
@@ -785,29 +713,27 @@ def admin_add_doctor():
     phone = request.form.get('phone')
     video = request.form.get('video_link')
 
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO doctors (name, specialization, email, password, image, phone, video_link) VALUES (?, ?, ?, ?, ?, ?, ?)",
               (name, spec, email, password, image, phone, video))
     conn.commit()
-    conn.close()
     return redirect(url_for('admin_doctors'))
 
 @app.route('/admin/doctor/delete/<int:doctor_id>', methods=['POST'])
 @admin_required
 def admin_delete_doctor(doctor_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM doctors WHERE id = ?", (doctor_id,))
     conn.commit()
-    conn.close()
     return redirect(url_for('admin_doctors'))
 
 @app.route('/admin/appointments')
 @admin_required
 def admin_appointments():
     status_filter = request.args.get('status')
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     query = """
@@ -825,18 +751,16 @@ def admin_appointments():
     
     c.execute(query, tuple(params))
     appointments = c.fetchall()
-    conn.close()
     return render_template('admin_appointments.html', appointments=appointments, current_status=status_filter)
 
 @app.route('/admin/appointment/status/<int:appt_id>', methods=['POST'])
 @admin_required
 def admin_update_appointment_status(appt_id):
     status = request.form.get('status')
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE appointments SET status = ? WHERE id = ?", (status, appt_id))
     conn.commit()
-    conn.close()
     flash(f'Appointment status updated to {status}', 'success')
     return redirect(url_for('admin_appointments'))
 
@@ -848,12 +772,12 @@ def doctor_login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT * FROM doctors WHERE email = ? AND password = ?", (email, password))
         doctor = c.fetchone()
-        conn.close()
         if doctor:
+            sessions.regenerate(session)
             session['doctor_id'] = doctor[0]
             session['doctor_name'] = doctor[1]
             return redirect(url_for('doctor_dashboard'))
@@ -864,7 +788,7 @@ def doctor_login():
 @app.route('/doctor/dashboard')
 @doctor_required
 def doctor_dashboard():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
 
     # Fetch doctor's details
@@ -880,7 +804,6 @@ def doctor_dashboard():
         ORDER BY a.appointment_time ASC
     """, (session['doctor_id'],))
     appointments = c.fetchall()
-    conn.close()
 
     # Calculate stats
     stats = {
@@ -902,7 +825,7 @@ def doctor_logout():
 def doctor_update_appointment_status(appt_id):
     status = request.form.get('status')
     notes = request.form.get('notes')
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     if status == 'Completed' and notes:
@@ -910,7 +833,6 @@ def doctor_update_appointment_status(appt_id):
     else:
         c.execute("UPDATE appointments SET status = ? WHERE id = ? AND doctor_id = ?", (status, appt_id, session['doctor_id']))
     conn.commit()
-    conn.close()
     flash(f'Appointment marked as {status}', 'success')
     return redirect(url_for('doctor_dashboard'))
 
@@ -922,6 +844,7 @@ def admin_login():
         username = request.form.get('username')
         password = request.form.get('password')
         if username == app.config.get('ADMIN_USER') and password == app.config.get('ADMIN_PASS'):
+            sessions.regenerate(session)
             session['admin_logged_in'] = True
             session['admin_user'] = username
             return redirect(url_for('admin_dashboard'))
@@ -966,11 +889,10 @@ def register():
             baby_age = "Unknown"
         
         # Check if email already exists
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT * FROM users WHERE email = ?", (email,))
         if c.fetchone():
-            conn.close()
             return render_template('register.html', error="Email already registered")
         
         # Insert new user
@@ -980,8 +902,8 @@ def register():
                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                   (email, password, parent_name, baby_name, baby_dob, baby_age, phone, address, created_at, language))
         conn.commit()
-        conn.close()
         
+        sessions.regenerate(session)
         session['user_id'] = email
         session['user_name'] = parent_name
         session['language'] = language  # Set language in session
@@ -996,21 +918,20 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
         user = c.fetchone()
-        conn.close()
 
         if user:
+            # new session id at login (no session fixation)
+            sessions.regenerate(session)
             session['user_id'] = email
             session['user_name'] = user[3]
             # Fetch language and subscription status from DB (safe checks)
             try:
-                conn2 = sqlite3.connect('babycare.db')
-                c2 = conn2.cursor()
-                c2.execute("PRAGMA table_info('users')")
-                cols = [r[1] for r in c2.fetchall()]
+                c2 = conn.cursor()
+                cols = db.schema.columns('users')
                 # language
                 if 'language' in cols:
                     c2.execute("SELECT language FROM users WHERE email = ?", (email,))
@@ -1039,7 +960,6 @@ def login():
                     session['subscription_pending'] = 1 if res3 and res3[0] else 0
                 else:
                     session['subscription_pending'] = 0
-                conn2.close()
             except Exception:
                 session['language'] = 'en'
                 session['is_subscribed'] = 0
@@ -1055,20 +975,18 @@ def login():
 @login_required
 def user_dashboard():
     
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM users WHERE email = ?", (session['user_id'],))
     user = c.fetchone()
     
-    # Fetch recent tracking data
-    c.execute("""SELECT * FROM baby_tracker WHERE user_id = ? ORDER BY created_at DESC LIMIT 10""", 
-              (session['user_id'],))
-    tracking_data = c.fetchall()
+    # Fetch recent tracking data (including archived entries for users with little recent activity)
+    tracking_data, _ = tracker.timeline_page(c, session['user_id'], limit=10,
+                                             archive=tracker_archive.get_store())
 
     # Fetch user contact messages and any admin replies
     try:
-        c.execute("PRAGMA table_info('contacts')")
-        contact_cols = [r[1] for r in c.fetchall()]
+        contact_cols = db.schema.columns('contacts')
         if 'admin_reply' in contact_cols:
             c.execute("SELECT id, name, email, message, date, admin_reply, replied_at, replied_by FROM contacts WHERE email = ? ORDER BY date DESC", (session['user_id'],))
         else:
@@ -1090,7 +1008,6 @@ def user_dashboard():
     except Exception:
         appointments = []
 
-    conn.close()
     
     if user:
         user_data = {
@@ -1104,9 +1021,10 @@ def user_dashboard():
             'address': user[8],
             'created_at': user[9]
         }
-        # pass subscription flags explicitly
-        is_sub = session.get('is_subscribed', 0)
-        sub_pending = session.get('subscription_pending', 0)
+        # pass subscription flags explicitly (from the DB, see load_subscription_state)
+        state = load_subscription_state()
+        is_sub = state['is_subscribed']
+        sub_pending = state['subscription_pending']
         return render_template('user_dashboard.html', user=user_data, tracking_data=tracking_data,
                        is_subscribed=is_sub, subscription_pending=sub_pending, user_contacts=user_contacts, appointments=appointments)
     
@@ -1130,18 +1048,21 @@ def add_tracker():
     if not activity_type:
         return jsonify({'error': 'Activity type is required'}), 400
     
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
-    start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    now = datetime.now()
+    start_time = now.strftime(tracker.TIME_FORMAT)
+    created_at = start_time
+    start_ts, _, day_key, type_code = tracker.event_values(activity_type, now)
     
-    c.execute("""INSERT INTO baby_tracker (user_id, activity_type, start_time, created_at, notes)
-                 VALUES (?, ?, ?, ?, ?)""",
-              (session['user_id'], activity_type, start_time, created_at, notes))
+    c.execute("""INSERT INTO baby_tracker (user_id, activity_type, start_time, created_at, notes, start_ts, day_key, type_code)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+              (session['user_id'], activity_type, start_time, created_at, notes, start_ts, day_key, type_code))
+    tracker.rollup_add(c, session['user_id'], day_key, type_code, start_ts)
+    tracker.bump_version(c, session['user_id'])
     
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True, 'message': f'{activity_type} started!'}), 201
 
@@ -1149,47 +1070,96 @@ def add_tracker():
 @app.route('/tracker/end/<int:tracker_id>', methods=['POST'])
 @login_required
 def end_tracker(tracker_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Verify ownership
-    c.execute("SELECT * FROM baby_tracker WHERE id = ? AND user_id = ?", (tracker_id, session['user_id']))
-    tracker = c.fetchone()
+    c.execute("""SELECT activity_type, start_ts, end_ts, day_key, type_code FROM baby_tracker
+                 WHERE id = ? AND user_id = ?""", (tracker_id, session['user_id']))
+    entry = c.fetchone()
     
-    if not tracker:
-        conn.close()
+    if not entry:
         return jsonify({'error': 'Tracker not found'}), 404
     
-    end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("UPDATE baby_tracker SET end_time = ? WHERE id = ?", (end_time, tracker_id))
+    now = datetime.now()
+    end_ts = tracker.to_epoch(now)
+    c.execute("UPDATE baby_tracker SET end_time = ?, end_ts = ? WHERE id = ?",
+              (now.strftime(tracker.TIME_FORMAT), end_ts, tracker_id))
+    # Keep the daily rollup in the same transaction
+    if entry[1] is not None:
+        if entry[2] is None:
+            tracker.rollup_end(c, session['user_id'], entry[3], entry[4], end_ts - entry[1])
+        else:
+            tracker.rollup_recompute(c, session['user_id'], entry[3], entry[4],
+                                     archive=tracker_archive.get_store())
+    tracker.bump_version(c, session['user_id'])
     
     conn.commit()
-    conn.close()
     
-    return jsonify({'success': True, 'message': f'{tracker[2]} ended!'}), 200
+    return jsonify({'success': True, 'message': f'{entry[0]} ended!'}), 200
 
 # Delete tracker entry
 @app.route('/tracker/delete/<int:tracker_id>', methods=['POST'])
 @login_required
 def delete_tracker(tracker_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Verify ownership
-    c.execute("SELECT * FROM baby_tracker WHERE id = ? AND user_id = ?", (tracker_id, session['user_id']))
-    tracker = c.fetchone()
+    c.execute("SELECT day_key, type_code FROM baby_tracker WHERE id = ? AND user_id = ?",
+              (tracker_id, session['user_id']))
+    entry = c.fetchone()
     
-    if not tracker:
-        conn.close()
+    if not entry:
         return jsonify({'error': 'Tracker not found'}), 404
     
     c.execute("DELETE FROM baby_tracker WHERE id = ?", (tracker_id,))
+    if entry[0] is not None:
+        tracker.rollup_recompute(c, session['user_id'], entry[0], entry[1],
+                                 archive=tracker_archive.get_store())
+    tracker.bump_version(c, session['user_id'])
     
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True, 'message': 'Entry deleted!'}), 200
 
+# Bulk ingestion for events logged offline and synced later
+@app.route('/tracker/batch', methods=['POST'])
+@login_required
+def tracker_batch():
+    """Accept a JSON array (or {"events": [...]}) or an NDJSON stream of events.
+
+    Each event needs activity_type, start_time and idempotency_key; end_time
+    and notes are optional. All valid events are inserted in one transaction
+    and the response reports a result per item.
+    """
+    if 'ndjson' in (request.content_type or ''):
+        items = []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) >= tracker.BATCH_LIMIT:
+                return jsonify({'success': False, 'error': f'At most {tracker.BATCH_LIMIT} events per batch'}), 413
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # reported back as an invalid item
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'success': False, 'error': 'Expected a JSON array or NDJSON stream of events'}), 400
+        if len(items) > tracker.BATCH_LIMIT:
+            return jsonify({'success': False, 'error': f'At most {tracker.BATCH_LIMIT} events per batch'}), 413
+
+    results = tracker.ingest_events(get_db(), session['user_id'], items,
+                                    archive=tracker_archive.get_store())
+    counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return jsonify({'success': True, 'results': results, **counts})
+
 # ===== ADMIN PANEL =====
 
 # Reminder Routes
@@ -1202,100 +1172,96 @@ def add_reminder():
     if not message or not remind_time:
         return jsonify({'error': 'Message and time are required'}), 400
 
-    conn = sqlite3.connect('babycare.db')
+    now = datetime.now()
+    try:
+        remind_ts = reminders.next_occurrence(remind_time, now)
+    except ValueError:
+        return jsonify({'error': 'Invalid reminder time'}), 400
+
+    conn = get_db()
     c = conn.cursor()
-    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO reminders (user_id, message, remind_time, created_at) VALUES (?, ?, ?, ?)",
-              (session['user_id'], message, remind_time, created_at))
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    c.execute("INSERT INTO reminders (user_id, message, remind_time, created_at, remind_ts) VALUES (?, ?, ?, ?, ?)",
+              (session['user_id'], message, remind_time, created_at, remind_ts))
     conn.commit()
-    conn.close()
+    reminder_scheduler.schedule(c.lastrowid, remind_ts)
     return jsonify({'success': True, 'message': 'Reminder set!'})
 
 @app.route('/tracker/reminder/delete/<int:reminder_id>', methods=['POST'])
 @login_required
 def delete_reminder(reminder_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM reminders WHERE id = ? AND user_id = ?", (reminder_id, session['user_id']))
     conn.commit()
-    conn.close()
+    if c.rowcount:
+        reminder_scheduler.cancel(reminder_id)
     return jsonify({'success': True, 'message': 'Reminder deleted!'})
 
+ACTIVITY_ICONS = {
+    'Feeding': 'fas fa-baby-bottle',
+    'Sleep': 'fas fa-moon',
+    'Diaper': 'fas fa-baby',
+    'Health': 'fas fa-heartbeat',
+    'Bath': 'fas fa-bath'
+}
+
+def format_activity(row):
+    """Timeline entry for display from a tracker.TIMELINE_COLUMNS row."""
+    # row: id(0), activity_type(1), start_ts(2), end_ts(3), notes(4), type_code(5), day_key(6)
+    start_dt = tracker.from_epoch(row[2])
+    end_dt = tracker.from_epoch(row[3]) if row[3] is not None else None
+    return {
+        'id': row[0],
+        'type': row[1],
+        'start_time': start_dt.strftime("%I:%M %p"),
+        'date': start_dt.strftime("%b %d"),
+        'end_time': end_dt.strftime("%I:%M %p") if end_dt else None,
+        'duration': tracker.format_duration(row[3] - row[2]) if end_dt else "",
+        'notes': row[4],
+        'icon': ACTIVITY_ICONS.get(row[1], 'fas fa-circle'),
+        'is_active': row[3] is None and row[5] == tracker.SLEEP_CODE,
+        # archived entries cannot be ended or deleted
+        'archived': isinstance(row, tracker_archive.ArchivedRow)
+    }
+
+def timeline_range(date_from, date_to):
+    """Epoch [start, end) for inclusive YYYY-MM-DD bounds; either may be empty."""
+    start_ts = tracker.day_key_bounds(tracker.parse_day(date_from))[0] if date_from else None
+    end_ts = tracker.day_key_bounds(tracker.parse_day(date_to))[1] if date_to else None
+    return start_ts, end_ts
+
 # Tracker page (separate full page)
 @app.route('/tracker')
 @login_required
 def tracker_page():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
-    # Optional date filtering
+    # Optional date filtering; without one the timeline is the whole history,
+    # rendered one page at a time (the rest loads from /tracker/timeline on scroll)
     date_filter = request.args.get('date')
-    if date_filter:
-        c.execute("SELECT * FROM baby_tracker WHERE user_id = ? AND start_time LIKE ? ORDER BY created_at DESC", 
-                 (session['user_id'], f"{date_filter}%"))
-    else:
-        c.execute("SELECT * FROM baby_tracker WHERE user_id = ? ORDER BY created_at DESC", (session['user_id'],))
-        
-    raw_data = c.fetchall()
-
-    # Fetch reminders
-    c.execute("SELECT * FROM reminders WHERE user_id = ? ORDER BY remind_time ASC", (session['user_id'],))
-    reminders = c.fetchall()
-    conn.close()
-    
-    # Process data for statistics and better display
     today_str = datetime.now().strftime("%Y-%m-%d")
     display_date = date_filter if date_filter else today_str
+    try:
+        display_key = tracker.parse_day(display_date)
+    except ValueError:
+        display_key = None
+
+    raw_data, next_cursor = [], None
+    if display_key is not None:
+        start_ts, end_ts = timeline_range(date_filter, date_filter)
+        raw_data, next_cursor = tracker.timeline_page(c, session['user_id'], start_ts=start_ts, end_ts=end_ts,
+                                                      archive=tracker_archive.get_store())
+
+    stats = tracker.day_stats(c, session['user_id'], display_key)
+
+    # Fetch reminders that have not fired yet
+    c.execute("""SELECT * FROM reminders WHERE user_id = ? AND delivered_ts IS NULL
+                 ORDER BY remind_ts ASC""", (session['user_id'],))
+    reminders = c.fetchall()
     
-    stats = {
-        'sleep_duration': 0,
-        'feed_count': 0,
-        'diaper_count': 0
-    }
-    
-    formatted_activities = []
-    icons = {
-        'Feeding': 'fas fa-baby-bottle',
-        'Sleep': 'fas fa-moon',
-        'Diaper': 'fas fa-baby',
-        'Health': 'fas fa-heartbeat',
-        'Bath': 'fas fa-bath'
-    }
-    
-    for row in raw_data:
-        # row: id(0), user_id(1), activity_type(2), start_time(3), end_time(4), notes(5), created_at(6)
-        try:
-            start_dt = datetime.strptime(row[3], "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(row[4], "%Y-%m-%d %H:%M:%S") if row[4] else None
-            
-            duration_str = ""
-            if end_dt:
-                diff = end_dt - start_dt
-                total_seconds = diff.total_seconds()
-                hours = int(total_seconds // 3600)
-                minutes = int((total_seconds % 3600) // 60)
-                duration_str = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
-                
-                if start_dt.strftime("%Y-%m-%d") == display_date and row[2] == 'Sleep':
-                    stats['sleep_duration'] += total_seconds
-            
-            if start_dt.strftime("%Y-%m-%d") == display_date:
-                if row[2] == 'Feeding': stats['feed_count'] += 1
-                elif row[2] == 'Diaper': stats['diaper_count'] += 1
-
-            formatted_activities.append({
-                'id': row[0],
-                'type': row[2],
-                'start_time': start_dt.strftime("%I:%M %p"),
-                'date': start_dt.strftime("%b %d"),
-                'end_time': end_dt.strftime("%I:%M %p") if end_dt else None,
-                'duration': duration_str,
-                'notes': row[5],
-                'icon': icons.get(row[2], 'fas fa-circle'),
-                'is_active': row[4] is None and row[2] == 'Sleep'
-            })
-        except Exception:
-            continue
+    formatted_activities = [format_activity(row) for row in raw_data]
 
     # Format sleep duration
     sleep_hours = int(stats['sleep_duration'] // 3600)
@@ -1307,9 +1273,67 @@ def tracker_page():
                          activities=formatted_activities, 
                          stats=stats,
                          current_date=display_date,
+                         timeline_date=date_filter or '',
+                         next_cursor=next_cursor,
                          reminders=reminders)
 
 
+# Timeline API used by the tracker page's infinite scroll
+@app.route('/tracker/timeline', methods=['GET'])
+@login_required
+def tracker_timeline():
+    """Keyset-paginated timeline: ?cursor=&limit=&type=&from=YYYY-MM-DD&to=YYYY-MM-DD"""
+    try:
+        limit = min(max(int(request.args.get('limit', tracker.TIMELINE_PAGE_SIZE)), 1),
+                    tracker.TIMELINE_MAX_PAGE_SIZE)
+        start_ts, end_ts = timeline_range(request.args.get('from'), request.args.get('to'))
+        rows, next_cursor = tracker.timeline_page(get_db().cursor(), session['user_id'],
+                                                  cursor=request.args.get('cursor'),
+                                                  limit=limit,
+                                                  activity_types=request.args.getlist('type'),
+                                                  start_ts=start_ts, end_ts=end_ts,
+                                                  archive=tracker_archive.get_store())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor, limit or date'}), 400
+
+    return jsonify({'success': True,
+                    'items': [format_activity(row) for row in rows],
+                    'next_cursor': next_cursor})
+
+
+# Streaming export: ?format=csv|ndjson&from=&to=&type=&include=reminders,appointments
+@app.route('/tracker/export', methods=['GET'])
+@login_required
+def tracker_export_view():
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in tracker_export.FORMATS:
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    include = {part.strip() for value in request.args.getlist('include') for part in value.split(',')}
+    date_from, date_to = request.args.get('from'), request.args.get('to')
+    try:
+        start_ts, end_ts = timeline_range(date_from, date_to)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date'}), 400
+
+    user_id = session['user_id']
+    activity_types = request.args.getlist('type')
+    include &= set(tracker_export.SECTIONS)
+
+    def stream():
+        # The view's connection goes back to the pool before the body is sent, so the
+        # export reads on its own: get_db() here runs in the context stream_with_context
+        # pushes again, and that context's teardown releases it when the stream ends
+        yield from tracker_export.export_stream(get_db().cursor(), user_id, fmt,
+                                                activity_types=activity_types,
+                                                start_ts=start_ts, end_ts=end_ts,
+                                                date_from=date_from, date_to=date_to,
+                                                include=include, archive=tracker_archive.get_store())
+
+    filename = f"babycare-tracker-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(stream_with_context(stream()), mimetype=tracker_export.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
 # Simple analyzer for activities to produce health insights
 def analyze_activities_for_health(activities, stats):
     """Return a concise analysis dict given today's activities and stats.
@@ -1388,136 +1412,121 @@ def analyze_activities_for_health(activities, stats):
     return {'insights': insights, 'summary': final, 'score': score}
 
 
+# Analysis results per (user, day), tagged with the user's tracker data version
+analysis_cache = LRUCache(maxsize=int(os.environ.get('ANALYSIS_CACHE_SIZE', 2048)))
+
 # Endpoint to analyze activities for a selected date (returns JSON)
 @app.route('/tracker/analyze', methods=['GET'])
 @login_required
+@conditional(lambda: (session['user_id'], tracker.data_version(get_db(), session['user_id']),
+                      request.args.get('date') or tracker.day_key(datetime.now())))
 def tracker_analyze():
     date_filter = request.args.get('date')
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
+    user_id = session['user_id']
     try:
-        if date_filter:
-            c.execute("SELECT * FROM baby_tracker WHERE user_id = ? AND start_time LIKE ? ORDER BY created_at DESC",
-                      (session['user_id'], f"{date_filter}%"))
-        else:
-            today = datetime.now().strftime('%Y-%m-%d')
-            c.execute("SELECT * FROM baby_tracker WHERE user_id = ? AND start_time LIKE ? ORDER BY created_at DESC",
-                      (session['user_id'], f"{today}%"))
+        key = tracker.parse_day(date_filter) if date_filter else tracker.day_key(datetime.now())
+    except ValueError:
+        key = None
+
+    # Any add/end/delete bumps the version, so a cached entry is never stale
+    version = tracker.data_version(c, user_id)
+    analysis = analysis_cache.get((user_id, key), version)
+    if analysis is not None:
+        return jsonify({'success': True, 'analysis': analysis})
+
+    rows = []
+    if key is not None:
+        c.execute("""SELECT activity_type, start_time, end_time, notes
+                     FROM baby_tracker WHERE user_id = ? AND day_key = ?
+                     ORDER BY start_ts DESC, id DESC""",
+                  (user_id, key))
         rows = c.fetchall()
-    except Exception:
-        rows = []
-    finally:
-        conn.close()
+        # Days older than the archive cut-off live in the user's month files
+        for row in tracker_archive.get_store().rows(user_id, *tracker.day_key_bounds(key)):
+            rows.append((row[1], tracker.from_epoch(row[2]).strftime(tracker.TIME_FORMAT),
+                         tracker.from_epoch(row[3]).strftime(tracker.TIME_FORMAT) if row[3] is not None else None,
+                         row[4]))
 
-    # Build activities and stats like tracker_page
-    activities = []
-    stats = {'sleep_duration': 0, 'feed_count': 0, 'diaper_count': 0}
-    for row in rows:
-        try:
-            start_dt = datetime.strptime(row[3], "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(row[4], "%Y-%m-%d %H:%M:%S") if row[4] else None
-            if end_dt and row[2] == 'Sleep':
-                stats['sleep_duration'] += (end_dt - start_dt).total_seconds()
-            if row[2] == 'Feeding': stats['feed_count'] += 1
-            if row[2] == 'Diaper': stats['diaper_count'] += 1
-
-            activities.append({'type': row[2], 'start_time': row[3], 'end_time': row[4], 'notes': row[5]})
-        except Exception:
-            continue
+    # Stats come from the daily rollup; the rows are only needed for their notes
+    stats = tracker.day_stats(c, user_id, key)
+    activities = [{'type': row[0], 'start_time': row[1], 'end_time': row[2], 'notes': row[3]} for row in rows]
 
     analysis = analyze_activities_for_health(activities, stats)
+    analysis_cache.set((user_id, key), analysis, version)
     return jsonify({'success': True, 'analysis': analysis})
 
 
+# Multi-day trends: ?days=7|30|90 (vectorized in tracker_trends)
+@app.route('/tracker/trends', methods=['GET'])
+@login_required
+def tracker_trends_view():
+    try:
+        days = int(request.args.get('days', tracker_trends.WINDOWS[0]))
+    except ValueError:
+        days = 0
+    if days not in tracker_trends.WINDOWS:
+        return jsonify({'success': False,
+                        'error': f"days must be one of {', '.join(map(str, tracker_trends.WINDOWS))}"}), 400
+
+    trends = tracker_trends.user_trends(get_db().cursor(), session['user_id'], days,
+                                        archive=tracker_archive.get_store())
+    return jsonify({'success': True, 'trends': trends})
+
+
 def _user_is_subscribed(user_email):
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
-        c.execute("PRAGMA table_info('users')")
-        cols = [r[1] for r in c.fetchall()]
+        cols = db.schema.columns('users')
         if 'is_subscribed' in cols:
             c.execute("SELECT is_subscribed FROM users WHERE email = ?", (user_email,))
             r = c.fetchone()
-            conn.close()
             return bool(r and int(r[0]) == 1)
-        conn.close()
     except Exception:
         pass
     return False
 
 
-def generate_ai_answer(question, user_email=None, history=None):
+TIP_PASSAGES = 3
+
+
+def tip_passages(question, lang=None):
+    """The tips passages most relevant to the question, in its language (BM25, see tips_index),
+    from the tips on its topic when it has one (ai_fallback.topics)."""
+    index = tips_index.get_index(catalog.source(), catalog.version())
+    found = index.search(question, lang, k=TIP_PASSAGES, topics=ai_fallback.topics(question))
+    return [passage for _, passage in found]
+
+
+def generate_ai_answer(question, user_email=None, history=None, conversation_id=None, lang=None):
     """Advanced AI Responder.
-    1. Tries Google Gemini API (if GEMINI_API_KEY env var is set)
-    2. Tries OpenAI API (if OPENAI_API_KEY env var is set)
-    3. Falls back to Advanced Local Heuristics (Regex based)
+    1. Tries the configured LLM providers in order (see ai_providers: Gemini, then OpenAI)
+    2. Falls back to local keyword matching in any supported language (see ai_fallback)
+    Both are given the most relevant passages from the tips. Without an
+    explicit history, the recent turns of conversation_id are used.
     """
-    q = (question or '').strip().lower()
+    if history is None and conversation_id:
+        history = conversation_store.window(get_db(), conversation_id, user_email, ai_providers.HISTORY_TURNS)
     history = history or []
-    
-    # Build context string for APIs
-    context_str = "You are Dream Baby AI, a helpful, warm, and evidence-based pediatric assistant. Keep answers concise (max 3-4 sentences) and supportive. Always advise seeing a doctor for emergencies.\n\nConversation History:\n"
-    for turn in history[-5:]: # Keep last 5 turns for context
-        context_str += f"User: {turn['user']}\nAI: {turn['ai']}\n"
-    
-    full_prompt = f"{context_str}\nUser: {question}\nAI:"
-
-    # 1. Try Google Gemini
-    try:
-        import google.generativeai as genai
-        gemini_key = os.environ.get('GEMINI_API_KEY')
-        if gemini_key:
-            genai.configure(api_key=gemini_key)
-            model = genai.GenerativeModel('gemini-pro')
-            response = model.generate_content(full_prompt)
-            if response.text:
-                return response.text.strip()
-    except Exception:
-        pass
-
-    # 2. Try OpenAI
-    try:
-        import os
-        openai_key = os.environ.get('OPENAI_API_KEY')
-        if openai_key:
-            try:
-                import openai
-                openai.api_key = openai_key
-                messages = [{"role": "system", "content": "You are a helpful pediatric assistant."}]
-                for turn in history[-5:]:
-                    messages.append({"role": "user", "content": turn['user']})
-                    messages.append({"role": "assistant", "content": turn['ai']})
-                messages.append({"role": "user", "content": question})
-                
-                resp = openai.ChatCompletion.create(model='gpt-3.5-turbo', messages=messages, max_tokens=300)
-                text = resp.choices[0].message.content.strip()
-                return text
-            except Exception:
-                pass
-    except Exception:
-        pass
+    passages = tip_passages(question, lang)
 
-    # 3. Advanced Local Heuristics (Regex based fallback)
-    import re
-    patterns = {
-        r'fever|temp|hot|warm': "For babies <3 months, a temp >100.4°F (38°C) is an emergency—call a doctor. For older babies, monitor behavior. If they are playing and drinking, they may just need rest. Keep them hydrated.",
-        r'vomit|puke|throw up': "Spit-up is normal. Projectile vomiting or green/bloody vomit requires a doctor. Keep baby upright after feeds. If vomiting persists, watch for dehydration (dry lips, no tears).",
-        r'sleep|nap|awake|night': "Newborns sleep 14-17h/day. Establish a 'Bath, Book, Bed' routine. Ensure the room is cool and dark. If baby wakes often, check hunger/diaper, but try to let them self-soothe.",
-        r'feed|milk|breast|bottle|hungry': "Newborns feed every 2-3 hours. Look for hunger cues like rooting. 6+ wet diapers/day means they are getting enough. If latching hurts, consult a lactation expert.",
-        r'poop|constipat|diarrhea|stool': "Breastfed poop is yellow/seedy; formula is tan. Hard pellets mean constipation—consult a doctor. Watery diarrhea risks dehydration. Call a doctor if there's blood in stool.",
-        r'cry|colic|fuss|scream': "Check the basics: Hunger, Diaper, Sleep. Try the 5 S's: Swaddle, Side-position, Shush, Swing, Suck. If crying is inconsolable for hours, it might be colic.",
-        r'rash|skin|acne|red': "Baby acne usually clears up alone. For diaper rash, use zinc cream and air time. If a rash doesn't fade when pressed or comes with fever, seek medical help.",
-        r'cough|cold|sneeze|nose': "Saline drops and a bulb syringe help with congestion. A cool-mist humidifier can ease breathing. Watch for rapid breathing or chest retractions—that's urgent.",
-        r'solid|food|eat': "Start solids around 6 months when baby can sit up. Start with single-ingredient purees (sweet potato, avocado) or soft finger foods. Introduce allergens one by one.",
-        r'hello|hi|hey': "Hello! I'm Dream Baby AI. I can help with sleep, feeding, health, and development. What's on your mind?",
-        r'thank': "You're very welcome! You're doing a great job. Let me know if you need anything else."
-    }
-    
-    for pattern, response in patterns.items():
-        if re.search(pattern, q):
-            return response
+    # 1. Configured providers; clients are built once per worker. Repeated
+    # questions are answered from the cache without a paid round trip. The
+    # registry bounds the wait (deadline, hedging, circuit breakers).
+    providers = ai_providers.registry.providers()
+    if providers:
+        cached = answer_cache.get(question, history, conn=get_db())
+        if cached is not None:
+            return cached
+        text = ai_providers.registry.ask(question, history, [tips_index.quote(p) for p in passages])
+        if text:
+            answer_cache.put(question, history, text, conn=get_db())
+            return text
 
-    return "I can help with general baby care (sleep, feeding, health). Since I'm an AI, for specific medical diagnoses, please see your pediatrician. Could you rephrase your question?"
+    # 2. Local keyword fallback: one precompiled matcher over every language's keywords
+    return ai_fallback.answer(question, passages)
 
 
 @app.route('/ai')
@@ -1528,10 +1537,71 @@ def ai_page():
     if not user or not _user_is_subscribed(user):
         flash('AI Assistant is available to subscribed users only. Please subscribe to access this feature.', 'warning')
         return redirect(url_for('subscribe'))
-    history = session.get('ai_history', [])
+    conn = get_db()
+    legacy = session.pop('ai_history', None)
+    conv_id = conversation_store.active(conn, user, legacy) if legacy else conversation_store.latest(conn, user)
+    history = conversation_store.get(conn, conv_id, user)
     return render_template('ai_assistant.html', history=history)
 
 
+def stream_ai_answer(question, user_email=None, history=None, conversation_id=None, lang=None):
+    """Like generate_ai_answer, but yields the answer in pieces as the provider streams it.
+
+    Providers are tried one after another (no hedging: text already shown
+    cannot be swapped for a faster provider's), skipping open circuits. A
+    provider that fails before sending anything is skipped; once text has gone
+    out, a failure is raised, since the partial answer cannot be taken back.
+    """
+    if history is None and conversation_id:
+        history = conversation_store.window(get_db(), conversation_id, user_email, ai_providers.HISTORY_TURNS)
+    history = history or []
+    passages = tip_passages(question, lang)
+    context = [tips_index.quote(p) for p in passages]
+    providers = ai_providers.registry.providers()
+    if providers:
+        cached = answer_cache.get(question, history, conn=get_db())
+        if cached is not None:
+            yield cached
+            return
+    for provider in providers:
+        if not provider.breaker.allow():
+            continue
+        parts = []
+        started = time.monotonic()
+        try:
+            for piece in provider.stream(question, history, context):
+                if piece:
+                    if not parts:
+                        provider.ttft.record(time.monotonic() - started, True)
+                    parts.append(piece)
+                    yield piece
+        except GeneratorExit:
+            # the client went away: no outcome, but free a half-open trial
+            provider.breaker.release()
+            raise
+        except Exception:
+            app.logger.warning("AI provider %s failed", provider.name, exc_info=True)
+            provider.breaker.record_failure()
+            provider.stats.record(time.monotonic() - started, False)
+            if parts:
+                raise
+            provider.ttft.record(time.monotonic() - started, False)
+            continue
+        text = ''.join(parts).strip()
+        provider.stats.record(time.monotonic() - started, bool(text))
+        if text:
+            provider.breaker.record_success()
+            answer_cache.put(question, history, text, conn=get_db())
+            return
+        provider.breaker.record_failure()
+
+    yield ai_fallback.answer(question, passages)
+
+
+def wants_stream(data):
+    return bool(data.get('stream')) or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
 @app.route('/ai/ask', methods=['POST'])
 @login_required
 def ai_ask():
@@ -1539,62 +1609,187 @@ def ai_ask():
     if not user or not _user_is_subscribed(user):
         return jsonify({'success': False, 'error': 'Subscription required'}), 403
 
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     question = data.get('question') or data.get('q') or request.form.get('question')
     if not question:
         return jsonify({'success': False, 'error': 'Question is required'}), 400
 
-    # Get history
-    history = session.get('ai_history', [])
+    # The conversation (the user's active one, see conversations) is only looked up
+    # or created once the pool has accepted the question, on the pool thread, which
+    # reads its history window; the turn is appended here, once, with the answer the
+    # user actually got. History kept in the session by older versions moves into it.
+    legacy = session.get('ai_history') or ()
+    lang = session.get('language')
+
+    def conversation():
+        return conversation_store.active(get_db(), user, legacy)
+
+    if wants_stream(data):
+        def pieces():
+            with app.app_context():
+                yield from stream_ai_answer(question, user_email=user, conversation_id=conversation(), lang=lang)
+
+        try:
+            stream = ai_request_pool.stream(pieces)
+        except ai_pool.PoolFull as e:
+            return ai_busy(e)
+        session.pop('ai_history', None)
+
+        # One JSON object per line: {"delta": ...} pieces, then {"done": true, ...} or {"error": ...}
+        def generate():
+            parts = []
+            try:
+                for piece in stream:
+                    parts.append(piece)
+                    yield json.dumps({'delta': piece}) + '\n'
+            except ai_pool.TimeoutError:
+                yield json.dumps({'success': False, 'error': 'The assistant took too long, please try again.'}) + '\n'
+                return
+            except Exception as e:
+                yield json.dumps({'success': False, 'error': str(e)}) + '\n'
+                return
+            answer = ''.join(parts).strip()
+            conversation_store.append(get_db(), conversation_store.active(get_db(), user), user, question, answer)
+            yield json.dumps({'success': True, 'done': True, 'answer': answer}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def compute():
+        with app.app_context():
+            return generate_ai_answer(question, user_email=user, conversation_id=conversation(), lang=lang)
 
     try:
-        answer = generate_ai_answer(question, user_email=user, history=history)
-        
-        # Update history
-        history.append({'user': question, 'ai': answer})
-        if len(history) > 20: # Keep last 20 turns
-            history.pop(0)
-        session['ai_history'] = history
-        session.modified = True
-
-        return jsonify({'success': True, 'answer': answer})
+        answer = ai_request_pool.run(compute)
+    except ai_pool.PoolFull as e:
+        return ai_busy(e)
+    except ai_pool.TimeoutError:
+        # the abandoned compute() may still finish, but its answer is not stored
+        answer = ai_fallback.answer(question, tip_passages(question, lang))
     except Exception as e:
+        session.pop('ai_history', None)
         return jsonify({'success': False, 'error': str(e)}), 500
+    session.pop('ai_history', None)
+    conversation_store.append(get_db(), conversation_store.active(get_db(), user), user, question, answer)
+    return jsonify({'success': True, 'answer': answer})
+
+
+def ai_busy(e):
+    response = jsonify({'success': False, 'error': 'The assistant is busy right now, please try again shortly.',
+                        'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@app.route('/admin/ai_stats')
+@admin_required
+def admin_ai_stats():
+    """Per-provider latency percentiles and circuit state, plus the AI caches and request pool."""
+    return jsonify({'providers': ai_providers.registry.stats(), 'answer_cache': answer_cache.stats(),
+                    'request_pool': ai_request_pool.stats(), 'conversations': conversation_store.stats()})
+
 
 @app.route('/ai/clear', methods=['POST'])
 @login_required
 def ai_clear():
-    session['ai_history'] = []
+    session.pop('ai_history', None)
+    conv_id = conversation_store.latest(get_db(), session.get('user_id'))
+    if conv_id:
+        conversation_store.clear(get_db(), conv_id, session.get('user_id'))
     return jsonify({'success': True})
 
 
-# API to check subscription status for current user (used by client polling)
+# Subscription state changes are pushed to waiting pages over server-sent events
+event_broker = events.EventBroker(app.config['DATABASE'])
+sse_slots = events.StreamSlots(SSE_STREAMS)     # open streams per process, see WEB_THREADS above
+SSE_STREAM_TIMEOUT = int(os.environ.get('SSE_STREAM_TIMEOUT', 55))   # seconds before the client reconnects
+SSE_KEEPALIVE = 15
+
+
+def publish_subscription_state(c, user_email, is_subscribed, subscription_pending):
+    """Queue a 'subscription' event for the user; delivered when the caller commits."""
+    if user_email:
+        db.bump_data_version(c, subscription_scope(user_email))
+        events.publish(c, user_email, 'subscription',
+                       {'is_subscribed': int(is_subscribed), 'subscription_pending': int(subscription_pending)})
+
+
+def read_subscription_state(c, user_email):
+    cols = db.schema.columns('users')
+    is_sub_col = 'is_subscribed' if 'is_subscribed' in cols else '0'
+    pending_col = 'subscription_pending' if 'subscription_pending' in cols else '0'
+    c.execute(f"SELECT {is_sub_col}, {pending_col} FROM users WHERE email = ?", (user_email,))
+    r = c.fetchone()
+    return {'is_subscribed': 1 if r and r[0] else 0,
+            'subscription_pending': 1 if r and r[1] else 0}
+
+
+def load_subscription_state():
+    """The user's subscription flags from the DB (read once per request); the session copy follows them."""
+    if 'subscription_state' not in g:
+        state = read_subscription_state(get_db().cursor(), session['user_id'])
+        # keep session in sync, only writing it when an admin changed something
+        for key, value in state.items():
+            if session.get(key) != value:
+                session[key] = value
+        g.subscription_state = state
+    return g.subscription_state
+
+
+# API to check subscription status for current user
 @app.route('/subscription_status')
 @login_required
+@conditional(lambda: (session['user_id'], db.data_version(get_db(), subscription_scope(session['user_id']))))
 def subscription_status():
     try:
-        conn = sqlite3.connect('babycare.db')
-        c = conn.cursor()
-        c.execute("PRAGMA table_info('users')")
-        cols = [r[1] for r in c.fetchall()]
-        is_subscribed = 0
-        subscription_pending = 0
-        if 'is_subscribed' in cols:
-            c.execute("SELECT is_subscribed FROM users WHERE email = ?", (session['user_id'],))
-            r = c.fetchone()
-            is_subscribed = 1 if r and r[0] else 0
-        if 'subscription_pending' in cols:
-            c.execute("SELECT subscription_pending FROM users WHERE email = ?", (session['user_id'],))
-            r2 = c.fetchone()
-            subscription_pending = 1 if r2 and r2[0] else 0
-        conn.close()
-        # keep session in sync
-        session['is_subscribed'] = is_subscribed
-        session['subscription_pending'] = subscription_pending
-        return jsonify({'is_subscribed': is_subscribed, 'subscription_pending': subscription_pending})
+        state = load_subscription_state()
+        return jsonify(state)
+    except Exception:
+        return jsonify({'error': 'Unable to determine status'}), 500
+
+
+# Server-sent events: the current state first, then, while a request is pending,
+# every change until the stream times out and EventSource reconnects. When all
+# sse_slots are taken the client only gets the state and polls again shortly.
+@app.route('/subscription_status/stream')
+@login_required
+def subscription_status_stream():
+    sub = event_broker.subscribe(session['user_id'], get_db())
+    try:
+        state = load_subscription_state()
     except Exception:
+        event_broker.unsubscribe(sub)
         return jsonify({'error': 'Unable to determine status'}), 500
 
+    def generate():
+        # the slot is taken and released in here: a generator that never starts never releases
+        slot = bool(state['subscription_pending']) and sse_slots.acquire()
+        try:
+            retry = 3000 if slot or not state['subscription_pending'] else events.SHORT_RETRY
+            yield f"retry: {retry}\n" + events.format_sse(sub.after, 'subscription', state)
+            if not slot:
+                # nothing to wait for, or no free slot; ending here frees the worker instead of
+                # holding it until the next keepalive shows the client went away
+                return
+            deadline = time.monotonic() + SSE_STREAM_TIMEOUT
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = sub.get(timeout=min(remaining, SSE_KEEPALIVE))
+                if event is not None:
+                    yield events.format_sse(event.id, event.kind, event.data)
+                elif time.monotonic() < deadline:
+                    yield ": keepalive\n\n"
+        finally:
+            if slot:
+                sse_slots.release()
+            event_broker.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 
 # Protected video endpoint: checks subscription before serving files from static/videos
 @app.route('/protected_video/<path:filename>')
@@ -1609,11 +1804,10 @@ def protected_video(filename):
         return abort(404)
 
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT is_subscribed FROM users WHERE email = ?", (session['user_id'],))
         row = c.fetchone()
-        conn.close()
         if not row or int(row[0]) != 1:
             flash('You must be subscribed to access this content.', 'warning')
             return redirect(url_for('subscribe'))
@@ -1632,12 +1826,12 @@ def subscribe():
     if request.method == 'POST':
         # Ensure user is logged in (login_required decorator handles this)
         try:
-            conn = sqlite3.connect('babycare.db')
+            conn = get_db()
             c = conn.cursor()
             # Mark subscription request as pending; admin will approve manually
             c.execute("UPDATE users SET subscription_pending = 1 WHERE email = ?", (session['user_id'],))
+            db.bump_data_version(c, subscription_scope(session['user_id']))
             conn.commit()
-            conn.close()
             session['subscription_pending'] = 1
         except Exception:
             pass
@@ -1659,7 +1853,7 @@ def subscribe():
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Get all users
@@ -1683,7 +1877,6 @@ def admin_dashboard():
     c.execute("SELECT name, email, message, date FROM contacts ORDER BY date DESC LIMIT 5")
     recent_contacts = c.fetchall()
 
-    conn.close()
     
     users_list = []
     pending_count = 0
@@ -1741,11 +1934,10 @@ def admin_dashboard():
 @app.route('/admin/users')
 @admin_required
 def admin_manage_users():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT id, email, parent_name, baby_name, baby_dob, baby_age, phone, address, created_at, is_admin FROM users ORDER BY created_at DESC")
     rows = c.fetchall()
-    conn.close()
 
     users = []
     for r in rows:
@@ -1769,11 +1961,10 @@ def admin_manage_users():
 @app.route('/admin/promote/<int:user_id>', methods=['POST'])
 @admin_required
 def admin_promote_user(user_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE users SET is_admin = 1 WHERE id = ?", (user_id,))
     conn.commit()
-    conn.close()
     return redirect(url_for('admin_manage_users'))
 
 
@@ -1781,11 +1972,10 @@ def admin_promote_user(user_id):
 @app.route('/admin/demote/<int:user_id>', methods=['POST'])
 @admin_required
 def admin_demote_user(user_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE users SET is_admin = 0 WHERE id = ?", (user_id,))
     conn.commit()
-    conn.close()
     return redirect(url_for('admin_manage_users'))
 
 
@@ -1793,7 +1983,7 @@ def admin_demote_user(user_id):
 @app.route('/admin/subscriptions')
 @admin_required
 def admin_subscriptions():
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     # Fetch users who have a pending subscription request
     try:
@@ -1801,14 +1991,13 @@ def admin_subscriptions():
         requests = c.fetchall()
     except Exception:
         requests = []
-    conn.close()
     return render_template('admin_subscriptions.html', requests=requests)
 
 
 @app.route('/admin/approve_subscription/<int:user_id>', methods=['POST'])
 @admin_required
 def admin_approve_subscription(user_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     # Get current state for logging
     try:
@@ -1827,7 +2016,9 @@ def admin_approve_subscription(user_id):
         new_is_sub = 1
         new_pending = 0
         c.execute("UPDATE users SET is_subscribed = ?, subscription_pending = ? WHERE id = ?", (new_is_sub, new_pending, user_id))
+        publish_subscription_state(c, user_email, new_is_sub, new_pending)
         conn.commit()
+        event_broker.notify()
         flash(f"Approved subscription for {user_email}", 'success')
         try:
             log_admin_action('approve', user_id, user_email, prev_is_sub, prev_pending, new_is_sub, new_pending)
@@ -1835,8 +2026,6 @@ def admin_approve_subscription(user_id):
             pass
     except Exception:
         flash(f"Failed to approve subscription for {user_email}", 'danger')
-    finally:
-        conn.close()
 
     # Redirect back to referring page if possible, else to manage_subscriptions
     ref = request.referrer
@@ -1846,7 +2035,7 @@ def admin_approve_subscription(user_id):
 @app.route('/admin/reject_subscription/<int:user_id>', methods=['POST'])
 @admin_required
 def admin_reject_subscription(user_id):
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute("SELECT email, is_subscribed, subscription_pending FROM users WHERE id = ?", (user_id,))
@@ -1863,7 +2052,9 @@ def admin_reject_subscription(user_id):
         new_is_sub = 0
         new_pending = 0
         c.execute("UPDATE users SET subscription_pending = ?, is_subscribed = ? WHERE id = ?", (new_pending, new_is_sub, user_id))
+        publish_subscription_state(c, user_email, new_is_sub, new_pending)
         conn.commit()
+        event_broker.notify()
         flash(f"Rejected subscription request for {user_email}", 'warning')
         try:
             log_admin_action('reject', user_id, user_email, prev_is_sub, prev_pending, new_is_sub, new_pending)
@@ -1871,8 +2062,6 @@ def admin_reject_subscription(user_id):
             pass
     except Exception:
         flash(f"Failed to reject subscription for {user_email}", 'danger')
-    finally:
-        conn.close()
 
     ref = request.referrer
     return redirect(ref or url_for('admin_manage_subscriptions'))
@@ -1883,7 +2072,7 @@ def admin_reject_subscription(user_id):
 @admin_required
 def admin_manage_subscriptions():
     """Admin page to manage all user subscriptions: grant, revoke, approve pending requests."""
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Pending requests
@@ -1935,7 +2124,6 @@ def admin_manage_subscriptions():
     except Exception:
         all_users = []
     
-    conn.close()
     
     pending_count = len(pending_requests)
     subscribed_count = len(subscribed_users)
@@ -1960,11 +2148,12 @@ def admin_undo_last_action():
     prev_is_sub = int(last.get('prev_is_subscribed', 0))
     prev_pending = int(last.get('prev_subscription_pending', 0))
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("UPDATE users SET is_subscribed = ?, subscription_pending = ? WHERE id = ?", (prev_is_sub, prev_pending, user_id))
+        publish_subscription_state(c, last.get('user_email'), prev_is_sub, prev_pending)
         conn.commit()
-        conn.close()
+        event_broker.notify()
         flash(f"Reverted last admin action for user ID {user_id}", 'success')
         # Log the undo as an action referencing the original
         try:
@@ -1981,7 +2170,7 @@ def admin_undo_last_action():
 @admin_required
 def admin_grant_subscription(user_id):
     """Grant subscription access to a user (manually by admin)."""
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute("SELECT email, is_subscribed, subscription_pending FROM users WHERE id = ?", (user_id,))
@@ -1998,7 +2187,9 @@ def admin_grant_subscription(user_id):
         new_is_sub = 1
         new_pending = 0
         c.execute("UPDATE users SET is_subscribed = ?, subscription_pending = ? WHERE id = ?", (new_is_sub, new_pending, user_id))
+        publish_subscription_state(c, user_email, new_is_sub, new_pending)
         conn.commit()
+        event_broker.notify()
         flash(f"Granted subscription access to {user_email}", 'success')
         try:
             log_admin_action('grant', user_id, user_email, prev_is_sub, prev_pending, new_is_sub, new_pending)
@@ -2006,8 +2197,6 @@ def admin_grant_subscription(user_id):
             pass
     except Exception:
         flash(f"Failed to grant subscription to {user_email}", 'danger')
-    finally:
-        conn.close()
 
     return redirect(url_for('admin_manage_subscriptions'))
 
@@ -2016,7 +2205,7 @@ def admin_grant_subscription(user_id):
 @admin_required
 def admin_revoke_subscription(user_id):
     """Revoke subscription access from a user."""
-    conn = sqlite3.connect('babycare.db')
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute("SELECT email, is_subscribed, subscription_pending FROM users WHERE id = ?", (user_id,))
@@ -2033,7 +2222,9 @@ def admin_revoke_subscription(user_id):
         new_is_sub = 0
         new_pending = 0
         c.execute("UPDATE users SET is_subscribed = ?, subscription_pending = ? WHERE id = ?", (new_is_sub, new_pending, user_id))
+        publish_subscription_state(c, user_email, new_is_sub, new_pending)
         conn.commit()
+        event_broker.notify()
         flash(f"Revoked subscription access from {user_email}", 'warning')
         try:
             log_admin_action('revoke', user_id, user_email, prev_is_sub, prev_pending, new_is_sub, new_pending)
@@ -2041,8 +2232,6 @@ def admin_revoke_subscription(user_id):
             pass
     except Exception:
         flash(f"Failed to revoke subscription for {user_email}", 'danger')
-    finally:
-        conn.close()
 
     return redirect(url_for('admin_manage_subscriptions'))
 
@@ -2073,11 +2262,12 @@ def admin_undo_action(log_index):
     prev_pending = int(target.get('prev_subscription_pending', 0))
 
     try:
-        conn = sqlite3.connect('babycare.db')
+        conn = get_db()
         c = conn.cursor()
         c.execute("UPDATE users SET is_subscribed = ?, subscription_pending = ? WHERE id = ?", (prev_is_sub, prev_pending, user_id))
+        publish_subscription_state(c, target.get('user_email'), prev_is_sub, prev_pending)
         conn.commit()
-        conn.close()
+        event_broker.notify()
         flash(f"Reverted action on user ID {user_id}: {target.get('action')}", 'success')
         try:
             log_admin_action('undo', user_id, target.get('user_email', ''), target.get('new_is_subscribed', 0), target.get('new_subscription_pending', 0), prev_is_sub, prev_pending)
@@ -0,0 +1,131 @@
+"""Compiled translation catalogs.
+
+translations.py is the source: one nested dict per language. A language is
+compiled the first time it is asked for into a Catalog, a read-only flat map
+of dotted keys ("page_title", "tips.sleep.title", ...) to strings. Keys the
+language lacks are filled from English at compile time, and the long tip
+bodies are rendered to HTML once, so a request only does dictionary lookups.
+
+Each catalog has a version hash of its strings for ETags and other cache
+keys; version() covers the whole source.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from markupsafe import Markup, escape
+
+DEFAULT_LANGUAGE = 'en'
+TIP_KEYS = ('feeding', 'diapering', 'sleep', 'bathing', 'crying')
+
+Tip = namedtuple('Tip', 'key title content html')
+
+_catalogs = {}
+_lock = threading.Lock()
+_version = None
+
+
+def source():
+    """The raw nested translations, imported on first use."""
+    from translations import translations
+    return translations
+
+
+def languages():
+    return tuple(source())
+
+
+def is_supported(lang):
+    return lang in source()
+
+
+def flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = tuple(value) if isinstance(value, list) else value
+    return flat
+
+
+def render_tip_html(content):
+    """Tip body as HTML: paragraphs, section headings and bullet lists."""
+    html = []
+    for block in re.split(r"\n\s*\n", content.strip()):
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        items = []
+        for line in lines:
+            if line.startswith('-'):
+                label, sep, rest = line[1:].strip().partition(': ')
+                item = f"<strong>{escape(label)}:</strong> {escape(rest)}" if sep and len(label) <= 40 \
+                    else escape(line[1:].strip())
+                items.append(f"<li>{item}</li>")
+                continue
+            if items:
+                html.append(f"<ul class=\"mb-2\">{''.join(items)}</ul>")
+                items = []
+            if len(line) <= 60 and not line.endswith(('.', '।', ':', '?', '!')):
+                html.append(f"<h6 class=\"fw-bold mt-3 mb-2\">{escape(line)}</h6>")
+            else:
+                html.append(f"<p class=\"mb-2\">{escape(line)}</p>")
+        if items:
+            html.append(f"<ul class=\"mb-2\">{''.join(items)}</ul>")
+    return Markup(''.join(html))
+
+
+class Catalog(Mapping):
+    """One compiled language. Templates can use it like the old dict (lang_data.page_title)."""
+
+    def __init__(self, lang, strings, tips, version):
+        self.lang = lang
+        self.strings = MappingProxyType(strings)
+        self.tips = MappingProxyType(tips)      # key -> Tip, in TIP_KEYS order
+        self.version = version
+
+    def __getitem__(self, key):
+        return self.strings[key]
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+
+def compile_language(lang, translations):
+    strings = flatten(translations[DEFAULT_LANGUAGE])
+    strings.update(flatten(translations[lang]))
+    tips = {}
+    for key in TIP_KEYS:
+        title, content = strings.get(f"tips.{key}.title"), strings.get(f"tips.{key}.content")
+        if title is not None and content is not None:
+            tips[key] = Tip(key, title, content, render_tip_html(content))
+    version = hashlib.sha1(json.dumps(sorted(strings.items()), ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+    return Catalog(lang, strings, tips, version)
+
+
+def get(lang):
+    """The compiled catalog for lang; unsupported languages get English."""
+    catalog = _catalogs.get(lang)
+    if catalog is not None:
+        return catalog
+    translations = source()
+    if lang not in translations:
+        return get(DEFAULT_LANGUAGE)
+    with _lock:
+        if lang not in _catalogs:
+            _catalogs[lang] = compile_language(lang, translations)
+        return _catalogs[lang]
+
+
+def version():
+    """Hash of the whole source, for caches that span languages (the tips index)."""
+    global _version
+    if _version is None:
+        _version = hashlib.sha1(json.dumps(source(), sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return _version
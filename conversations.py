@@ -0,0 +1,129 @@
+"""Server-side store for AI assistant conversations.
+
+Conversations are not kept in the session; the turns live in the
+ai_conversations table (migration 12) as zlib-compressed JSON, one row per
+conversation. Hot conversations are kept decoded in an LRU tagged with the
+row's version, so reading one costs a primary-key lookup of the version and
+only a changed conversation (say, appended to by another worker) is read and
+decompressed again.
+
+Each user has one active conversation, their most recently updated one,
+shared by their sessions and devices. active() looks it up and creates it in
+a single write transaction, so concurrent first questions all land in the
+same conversation.
+"""
+import json
+import secrets
+import time
+import zlib
+
+from cache import LRUCache
+
+MAX_TURNS = 20              # turns kept per conversation
+RETENTION = 30 * 24 * 3600  # a user's idle conversations are dropped after this
+DEFAULT_SIZE = 1024
+
+
+def encode(turns):
+    return zlib.compress(json.dumps(turns, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class ConversationStore:
+
+    def __init__(self, maxsize=DEFAULT_SIZE, max_turns=MAX_TURNS, retention=RETENTION):
+        self.max_turns = max_turns
+        self.retention = retention
+        self.memory = LRUCache(maxsize=maxsize)
+
+    def _insert(self, conn, user_id, turns):
+        conv_id = secrets.token_urlsafe(12)
+        now = int(time.time())
+        turns = list(turns)[-self.max_turns:]
+        conn.execute("DELETE FROM ai_conversations WHERE user_id = ? AND updated_ts < ?",
+                     (user_id, now - self.retention))
+        conn.execute("INSERT INTO ai_conversations (id, user_id, turns, version, updated_ts) VALUES (?, ?, ?, 0, ?)",
+                     (conv_id, user_id, encode(turns), now))
+        return conv_id, turns
+
+    def latest(self, conn, user_id):
+        """Id of the user's active (most recently updated) conversation, or None."""
+        row = conn.execute("""SELECT id FROM ai_conversations WHERE user_id = ? AND updated_ts >= ?
+                              ORDER BY updated_ts DESC LIMIT 1""",
+                           (user_id, int(time.time()) - self.retention)).fetchone()
+        return row[0] if row else None
+
+    def active(self, conn, user_id, turns=()):
+        """The user's active conversation, created on first use; turns (from older
+        versions' session history) are added to it."""
+        conv_id = self.latest(conn, user_id)
+        if conv_id is None:
+            # look up again inside the write lock: only one concurrent caller creates it
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conv_id = self.latest(conn, user_id)
+                if conv_id is None:
+                    conv_id, turns = self._insert(conn, user_id, turns)
+                    conn.commit()
+                    self.memory.set(conv_id, (user_id, turns), version=0)
+                    return conv_id
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        for turn in turns:
+            self.append(conn, conv_id, user_id, turn['user'], turn['ai'])
+        return conv_id
+
+    def get(self, conn, conv_id, user_id):
+        """All turns of the conversation, or [] if it does not exist or belongs to someone else."""
+        if not conv_id:
+            return []
+        row = conn.execute("SELECT version FROM ai_conversations WHERE id = ?", (conv_id,)).fetchone()
+        if row is None:
+            self.memory.pop(conv_id)
+            return []
+        cached = self.memory.get(conv_id, version=row[0])
+        if cached is None:
+            row = conn.execute("SELECT user_id, turns, version FROM ai_conversations WHERE id = ?",
+                               (conv_id,)).fetchone()
+            if row is None:
+                return []
+            cached = (row[0], decode(row[1]))
+            self.memory.set(conv_id, cached, version=row[2])
+        owner, turns = cached
+        return list(turns) if owner == user_id else []
+
+    def window(self, conn, conv_id, user_id, turns):
+        """The last `turns` turns, the history the providers see."""
+        return self.get(conn, conv_id, user_id)[-turns:]
+
+    def append(self, conn, conv_id, user_id, question, answer):
+        """Add a turn; returns False if the conversation is gone or not the user's."""
+        for _ in range(3):
+            row = conn.execute("SELECT user_id, turns, version FROM ai_conversations WHERE id = ?",
+                               (conv_id,)).fetchone()
+            if row is None or row[0] != user_id:
+                return False
+            turns = (decode(row[1]) + [{'user': question, 'ai': answer}])[-self.max_turns:]
+            # compare-and-set on the version, so concurrent appends from two workers are not lost
+            cur = conn.execute("""UPDATE ai_conversations SET turns = ?, version = version + 1, updated_ts = ?
+                                  WHERE id = ? AND version = ?""",
+                               (encode(turns), int(time.time()), conv_id, row[2]))
+            conn.commit()
+            if cur.rowcount:
+                self.memory.set(conv_id, (user_id, turns), version=row[2] + 1)
+                return True
+        return False
+
+    def clear(self, conn, conv_id, user_id):
+        conn.execute("""UPDATE ai_conversations SET turns = ?, version = version + 1, updated_ts = ?
+                        WHERE id = ? AND user_id = ?""", (encode([]), int(time.time()), conv_id, user_id))
+        conn.commit()
+        self.memory.pop(conv_id)
+
+    def stats(self):
+        return self.memory.stats()
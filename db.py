@@ -0,0 +1,166 @@
+"""SQLite connection handling for Dream Baby Care.
+
+Every request gets exactly one connection, stored on flask.g and shared by the
+before_request hooks, the context processors and the view itself. Connections
+come from a small per-worker pool and are configured once, when they are first
+opened: WAL journaling, a busy timeout, synchronous=NORMAL and a statement
+cache. The connection goes back to the pool when the app context is torn down.
+"""
+import os
+import sqlite3
+from queue import LifoQueue, Empty, Full
+
+from flask import g, current_app
+
+DEFAULT_DATABASE = 'babycare.db'
+
+
+def configure_connection(conn, busy_timeout_ms=5000):
+    """Apply the PRAGMAs every connection should run with."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def connect(path=None, timeout=5.0, cached_statements=256):
+    """Open a standalone, fully configured connection.
+
+    Used outside of requests (init_db, CLI commands, background threads).
+    """
+    conn = sqlite3.connect(path or DEFAULT_DATABASE, timeout=timeout,
+                           check_same_thread=False,
+                           cached_statements=cached_statements)
+    return configure_connection(conn, busy_timeout_ms=timeout * 1000)
+
+
+class ConnectionPool:
+    """A per-worker pool of configured SQLite connections.
+
+    The pool is keyed to the process that created it, so a pool inherited
+    through fork() (gunicorn --preload) is discarded instead of sharing file
+    handles between workers.
+    """
+
+    def __init__(self, path, size=8, timeout=5.0, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._pid = os.getpid()
+        self._idle = LifoQueue(maxsize=size)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = LifoQueue(maxsize=self.size)
+
+    def acquire(self):
+        self._check_pid()
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return connect(self.path, timeout=self.timeout,
+                           cached_statements=self.cached_statements)
+
+    def release(self, conn):
+        self._check_pid()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            conn.close()
+
+
+class SchemaRegistry:
+    """In-memory snapshot of table -> column names.
+
+    Built once at startup and rebuilt after migrations, so request code can
+    ask whether a migration-added column exists without a PRAGMA round trip.
+    """
+
+    def __init__(self):
+        self._tables = {}
+
+    def load(self, conn):
+        tables = {}
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        for (name,) in rows:
+            cols = conn.execute(f"PRAGMA table_info('{name}')").fetchall()
+            tables[name] = frozenset(r[1] for r in cols)
+        self._tables = tables
+        return self
+
+    def refresh(self, path=None):
+        conn = connect(path)
+        try:
+            self.load(conn)
+        finally:
+            conn.close()
+        return self
+
+    def has_table(self, table):
+        return table in self._tables
+
+    def columns(self, table):
+        return self._tables.get(table, frozenset())
+
+    def has_column(self, table, column):
+        return column in self._tables.get(table, ())
+
+
+schema = SchemaRegistry()
+
+
+def data_version(conn, scope):
+    """Current version of a data scope (0 if it was never bumped).
+
+    Scopes are strings such as "tracker:<user_id>". Writers bump the scope in
+    the same transaction as the change, so every worker sees the new version
+    as soon as the change is committed.
+    """
+    row = conn.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(conn, scope):
+    conn.execute("""INSERT INTO data_versions (scope, version) VALUES (?, 1)
+                    ON CONFLICT(scope) DO UPDATE SET version = version + 1""", (scope,))
+
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        pool = ConnectionPool(app.config['DATABASE'],
+                              size=app.config.get('DATABASE_POOL_SIZE', 8),
+                              timeout=app.config.get('DATABASE_TIMEOUT', 5.0))
+        app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_db():
+    """Return the connection bound to the current request, checking one out if needed."""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', os.environ.get('DATABASE_PATH', DEFAULT_DATABASE))
+    app.teardown_appcontext(close_db)
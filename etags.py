@@ -0,0 +1,63 @@
+"""Conditional GET for pages and JSON endpoints.
+
+A view decorated with @conditional(version_key) declares what its response
+depends on: version_key(*view_args) returns a cheap tuple (a data version, the
+catalog version, the language, ...) or None to opt out for that request. The
+ETag is a hash of that tuple together with the endpoint, the URL and the
+application version (templates, translations, schema), so a matching
+If-None-Match gets a 304 before the view runs at all.
+
+Responses that depend on one-off state are never tagged: requests with
+pending flash messages and anything that is not a 200 GET/HEAD.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, request, session, make_response
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def files_version(*folders):
+    """Hash of the names, sizes and mtimes of every file under folders."""
+    stats = []
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                stats.append((os.path.relpath(os.path.join(root, name), folder), st.st_size, st.st_mtime_ns))
+    return make_etag(*sorted(stats))
+
+
+def conditional(version_key):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            key = version_key(*args, **kwargs)
+            if key is None:
+                return view(*args, **kwargs)
+
+            tag = make_etag(current_app.config.get('ETAG_VERSION', ''), request.endpoint,
+                            request.full_path, key)
+            if request.if_none_match.contains(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.headers.setdefault('Cache-Control', CACHE_CONTROL)
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+"""Per-user event notifications for server-sent event streams.
+
+Writers call publish() inside the transaction that changes the user's state,
+which appends a row to user_events (migration 10). Each worker runs one tail
+thread that reads new rows by primary key and hands them to the streams
+subscribed to that user, so clients wait on a queue instead of polling.
+Because events go through the table, an admin action served by one worker
+reaches a stream held open by another. The tail thread only queries while
+the worker has subscribers, and a local publish wakes it at once.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+from queue import Queue, Empty
+
+import db
+
+POLL_INTERVAL = 1.0       # seconds between reads of user_events while someone is subscribed
+SHORT_RETRY = 5000        # ms before a client turned away by StreamSlots reconnects
+RETENTION = 24 * 3600     # events older than this are pruned
+PRUNE_INTERVAL = 3600
+
+Event = namedtuple('Event', 'id user_id kind data')
+
+log = logging.getLogger(__name__)
+
+
+def publish(c, user_id, kind, data):
+    """Record an event for user_id; it is delivered once the caller commits."""
+    c.execute("INSERT INTO user_events (user_id, kind, payload, created_ts) VALUES (?, ?, ?, ?)",
+              (user_id, kind, json.dumps(data), int(time.time())))
+
+
+def format_sse(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+
+    def __init__(self, user_id, after):
+        self.user_id = user_id
+        self.after = after
+        self.queue = Queue()
+
+    def get(self, timeout=None):
+        """Next Event, or None if none arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class StreamSlots:
+    """At most `limit` open streams per process.
+
+    An open stream holds a request thread for its whole life, so like the AI
+    request pool the streams get a fixed share of the server's threads. A
+    client over the limit gets the current state and a short retry instead,
+    which turns its EventSource into a long poll.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.refused = 0
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._open >= self.limit:
+                self.refused += 1
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open -= 1
+
+    def stats(self):
+        return {'limit': self.limit, 'open': self._open, 'refused': self.refused}
+
+
+class EventBroker:
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL, retention=RETENTION):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._subscribers = defaultdict(set)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._last_id = None
+
+    def notify(self):
+        """Wake the tail thread after a local commit instead of waiting for the next poll."""
+        with self._cond:
+            self._cond.notify()
+
+    def subscribe(self, user_id, conn):
+        """Start receiving events committed after this call; conn reads the current position."""
+        self._start()
+        after = conn.execute("SELECT COALESCE(MAX(id), 0) FROM user_events").fetchone()[0]
+        sub = Subscription(user_id, after)
+        with self._cond:
+            if self._last_id is None or not any(self._subscribers.values()):
+                self._last_id = after
+            else:
+                self._last_id = min(self._last_id, after)
+            self._subscribers[user_id].add(sub)
+            self._cond.notify()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def _start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._subscribers = defaultdict(set)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+            self._thread.start()
+
+    def _dispatch(self, rows):
+        with self._cond:
+            for event_id, user_id, kind, payload in rows:
+                for sub in self._subscribers.get(user_id, ()):
+                    if event_id > sub.after:
+                        sub.queue.put(Event(event_id, user_id, kind, json.loads(payload)))
+            self._last_id = rows[-1][0]
+
+    def prune(self, conn, now=None):
+        cutoff = int(now if now is not None else time.time()) - self.retention
+        # ids grow with time, so everything before the first recent row is old
+        row = conn.execute("SELECT id FROM user_events WHERE created_ts >= ? ORDER BY id LIMIT 1",
+                           (cutoff,)).fetchone()
+        if row is None:
+            conn.execute("DELETE FROM user_events WHERE created_ts < ?", (cutoff,))
+        else:
+            conn.execute("DELETE FROM user_events WHERE id < ?", (row[0],))
+        conn.commit()
+
+    def _run(self):
+        conn = db.connect(self.path)
+        next_prune = 0
+        try:
+            while True:
+                with self._cond:
+                    while not any(self._subscribers.values()):
+                        self._cond.wait()
+                    last_id = self._last_id
+                try:
+                    rows = conn.execute("""SELECT id, user_id, kind, payload FROM user_events
+                                           WHERE id > ? ORDER BY id LIMIT 500""", (last_id,)).fetchall()
+                    if rows:
+                        self._dispatch(rows)
+                        continue
+                    if time.time() >= next_prune:
+                        self.prune(conn)
+                        next_prune = time.time() + PRUNE_INTERVAL
+                except Exception:
+                    log.exception("Could not read user events")
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+        finally:
+            conn.close()
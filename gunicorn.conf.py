@@ -0,0 +1,11 @@
+# gunicorn settings (read automatically from the working directory).
+# WEB_THREADS is also read by app.py, which splits each process's threads:
+#   half (AI_RESERVED_THREADS) always free for the tracker, shop and other pages,
+#   a quarter (SSE_STREAMS) for open subscription event streams,
+#   the rest for running plus queued AI requests (ai_pool.size_for).
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+timeout = 60
@@ -0,0 +1,397 @@
+"""Versioned schema migrations for babycare.db.
+
+Each migration is a numbered function registered with @migration. Applied
+versions are recorded in the schema_version table, so bringing a current
+database up to date costs a single SELECT. Migrations run in order, each in
+its own IMMEDIATE transaction, which also keeps two workers starting at the
+same time from applying the same step twice.
+
+Add new migrations at the bottom with the next free version number; never
+renumber or edit one that has shipped.
+"""
+from datetime import datetime
+
+import sqlite3
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration up to target (default: latest).
+
+    Returns the list of (version, description) tuples that were applied.
+    """
+    if current_version(conn) >= (target or latest_version()):
+        return []
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TEXT NOT NULL)''')
+    conn.commit()
+
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another worker may have got here first
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            fn(conn.cursor())
+            conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                         (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info('{table}')")
+    return [r[1] for r in c.fetchall()]
+
+
+def _add_column(c, table, column, decl):
+    """Add a column unless an older init_db already did. Returns True if added."""
+    if column in _columns(c, table):
+        return False
+    c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+@migration(1, 'base schema')
+def _base_schema(c):
+    # Contacts table
+    c.execute('''CREATE TABLE IF NOT EXISTS contacts
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT NOT NULL,
+                 email TEXT NOT NULL,
+                 message TEXT NOT NULL,
+                 date TEXT NOT NULL)''')
+
+    # Users table (for user accounts)
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 email TEXT UNIQUE NOT NULL,
+                 password TEXT NOT NULL,
+                 parent_name TEXT NOT NULL,
+                 baby_name TEXT NOT NULL,
+                 baby_dob TEXT NOT NULL,
+                 baby_age TEXT,
+                 phone TEXT,
+                 address TEXT,
+                 created_at TEXT NOT NULL)''')
+    _add_column(c, 'users', 'is_admin', "INTEGER DEFAULT 0")
+    _add_column(c, 'users', 'language', "TEXT DEFAULT 'en'")
+    _add_column(c, 'users', 'is_subscribed', "INTEGER DEFAULT 0")
+    _add_column(c, 'users', 'subscription_pending', "INTEGER DEFAULT 0")
+
+    # Admin replies on contact messages
+    _add_column(c, 'contacts', 'admin_reply', "TEXT")
+    _add_column(c, 'contacts', 'replied_at', "TEXT")
+    _add_column(c, 'contacts', 'replied_by', "TEXT")
+
+    # Products table
+    c.execute('''CREATE TABLE IF NOT EXISTS products
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT NOT NULL,
+                 description TEXT NOT NULL,
+                 price REAL NOT NULL,
+                 image TEXT NOT NULL,
+                 category TEXT NOT NULL)''')
+
+    # Cart table (simplified for demo)
+    c.execute('''CREATE TABLE IF NOT EXISTS cart
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 product_id INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 session_id TEXT NOT NULL)''')
+
+    # Baby Tracker table (for feeding, diaper, sleep tracking)
+    c.execute('''CREATE TABLE IF NOT EXISTS baby_tracker
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id TEXT NOT NULL,
+                 activity_type TEXT NOT NULL,
+                 start_time TEXT NOT NULL,
+                 end_time TEXT,
+                 notes TEXT,
+                 created_at TEXT NOT NULL,
+                 FOREIGN KEY(user_id) REFERENCES users(email))''')
+
+    # Reminders table
+    c.execute('''CREATE TABLE IF NOT EXISTS reminders
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id TEXT NOT NULL,
+                 message TEXT NOT NULL,
+                 remind_time TEXT NOT NULL,
+                 created_at TEXT NOT NULL,
+                 FOREIGN KEY(user_id) REFERENCES users(email))''')
+
+    # Doctors table
+    c.execute('''CREATE TABLE IF NOT EXISTS doctors
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT NOT NULL,
+                 specialization TEXT NOT NULL,
+                 email TEXT UNIQUE NOT NULL,
+                 password TEXT NOT NULL,
+                 image TEXT,
+                 phone TEXT,
+                 video_link TEXT,
+                 is_available INTEGER DEFAULT 1)''')
+    if _add_column(c, 'doctors', 'email', "TEXT"):
+        c.execute("UPDATE doctors SET email = replace(lower(name), ' ', '.') || '@clinic.com' WHERE email IS NULL")
+    _add_column(c, 'doctors', 'password', "TEXT DEFAULT 'doc123'")
+
+    # Appointments table
+    c.execute('''CREATE TABLE IF NOT EXISTS appointments
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id TEXT NOT NULL,
+                 doctor_id INTEGER NOT NULL,
+                 appointment_time TEXT NOT NULL,
+                 type TEXT NOT NULL,
+                 status TEXT DEFAULT 'Pending',
+                 created_at TEXT NOT NULL,
+                 FOREIGN KEY(user_id) REFERENCES users(email),
+                 FOREIGN KEY(doctor_id) REFERENCES doctors(id))''')
+    _add_column(c, 'appointments', 'notes', "TEXT")
+
+    # Newsletter Subscribers table
+    c.execute('''CREATE TABLE IF NOT EXISTS newsletter_subscribers
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 email TEXT UNIQUE NOT NULL,
+                 subscribed_at TEXT NOT NULL)''')
+
+
+@migration(2, 'seed sample products and doctors')
+def _seed_catalog(c):
+    sample_products = [
+        ('Diapers - Newborn Size', 'Soft, absorbent diapers for newborns (30 count)', 350.00, 'https://images.unsplash.com/photo-1519689680058-324335c77eba?auto=format&fit=crop&w=500', 'Diapering'),
+        ('Baby Wipes', 'Gentle, hypoallergenic wipes for sensitive skin (80 count)', 150.00, 'https://images.unsplash.com/photo-1556228720-19875c4b84b2?auto=format&fit=crop&w=500', 'Diapering'),
+        ('Baby Bottles Set', 'BPA-free bottles with anti-colic system (3 pack)', 450.00, 'https://images.unsplash.com/photo-1595347097560-69238724e7bd?auto=format&fit=crop&w=500', 'Feeding'),
+        ('Baby Formula', 'Nutritious formula for newborns (400g)', 650.00, 'https://images.unsplash.com/photo-1632053009503-2b28537e3824?auto=format&fit=crop&w=500', 'Feeding'),
+        ('Onesies - 5 Pack', 'Soft cotton onesies in assorted colors (Newborn size)', 999.00, 'https://images.unsplash.com/photo-1522771753035-0a15395031b2?auto=format&fit=crop&w=500', 'Clothing'),
+        ('Baby Blanket', 'Soft, warm blanket for swaddling and comfort', 550.00, 'https://images.unsplash.com/photo-1513159446162-54eb8bdaa79b?auto=format&fit=crop&w=500', 'Bedding'),
+        ('Baby Shampoo & Body Wash', 'Tear-free, gentle cleanser for baby', 250.00, 'https://images.unsplash.com/photo-1556228578-0d85b1a4d571?auto=format&fit=crop&w=500', 'Bathing'),
+        ('Baby Lotion', 'Moisturizing lotion for delicate skin', 220.00, 'https://images.unsplash.com/photo-1608248597279-f99d160bfbc8?auto=format&fit=crop&w=500', 'Bathing'),
+        ('Pacifiers - 2 Pack', 'Orthodontic pacifiers for newborns', 200.00, 'https://images.unsplash.com/photo-1596464716127-f9a0859d0437?auto=format&fit=crop&w=500', 'Comfort'),
+        ('Baby Thermometer', 'Digital thermometer for accurate temperature reading', 300.00, 'https://images.unsplash.com/photo-1584634731339-252c581abfc5?auto=format&fit=crop&w=500', 'Health'),
+    ]
+
+    c.execute("SELECT COUNT(*) FROM products")
+    if c.fetchone()[0] == 0:
+        c.executemany("INSERT INTO products (name, description, price, image, category) VALUES (?, ?, ?, ?, ?)",
+                      sample_products)
+    else:
+        # Older databases stored local image filenames; point them at the hosted URLs
+        updates = {
+            'diapers.jpg': 'https://images.unsplash.com/photo-1519689680058-324335c77eba?auto=format&fit=crop&w=500',
+            'wipes.jpg': 'https://images.unsplash.com/photo-1556228720-19875c4b84b2?auto=format&fit=crop&w=500',
+            'bottles.jpg': 'https://images.unsplash.com/photo-1595347097560-69238724e7bd?auto=format&fit=crop&w=500',
+            'formula.jpg': 'https://images.unsplash.com/photo-1632053009503-2b28537e3824?auto=format&fit=crop&w=500',
+            'onesies.jpg': 'https://images.unsplash.com/photo-1522771753035-0a15395031b2?auto=format&fit=crop&w=500',
+            'blanket.jpg': 'https://images.unsplash.com/photo-1513159446162-54eb8bdaa79b?auto=format&fit=crop&w=500',
+            'shampoo.jpg': 'https://images.unsplash.com/photo-1556228578-0d85b1a4d571?auto=format&fit=crop&w=500',
+            'lotion.jpg': 'https://images.unsplash.com/photo-1608248597279-f99d160bfbc8?auto=format&fit=crop&w=500',
+            'pacifiers.jpg': 'https://images.unsplash.com/photo-1596464716127-f9a0859d0437?auto=format&fit=crop&w=500',
+            'thermometer.jpg': 'https://images.unsplash.com/photo-1584634731339-252c581abfc5?auto=format&fit=crop&w=500'
+        }
+        c.executemany("UPDATE products SET image = ? WHERE image = ?",
+                      [(new, old) for old, new in updates.items()])
+
+    c.execute("SELECT COUNT(*) FROM doctors")
+    if c.fetchone()[0] == 0:
+        sample_doctors = [
+            ('Dr. Sarah Smith', 'Pediatrician', 'sarah.smith@clinic.com', 'doc123', 'https://images.unsplash.com/photo-1559839734-2b71ea197ec2?auto=format&fit=crop&w=500', '+1234567890', 'https://meet.google.com/abc-defg-hij'),
+            ('Dr. John Doe', 'Child Psychologist', 'john.doe@clinic.com', 'doc123', 'https://images.unsplash.com/photo-1612349317150-e413f6a5b16d?auto=format&fit=crop&w=500', '+1987654321', 'https://meet.google.com/xyz-uvwx-yz')
+        ]
+        c.executemany("INSERT INTO doctors (name, specialization, email, password, image, phone, video_link) VALUES (?, ?, ?, ?, ?, ?, ?)", sample_doctors)
+
+
+@migration(3, 'product sale prices')
+def _product_sale_price(c):
+    if _add_column(c, 'products', 'sale_price', "REAL"):
+        # Set some sale prices for demo (approx 15% off for some items)
+        c.execute("UPDATE products SET sale_price = price * 0.85 WHERE id IN (1, 3, 5, 7, 9)")
+
+
+@migration(4, 'hot-path indexes')
+def _hot_path_indexes(c):
+    # Tracker day views (range scan on start_time) and recent-history lists
+    c.execute("CREATE INDEX IF NOT EXISTS idx_baby_tracker_user_start ON baby_tracker(user_id, start_time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_baby_tracker_user_created ON baby_tracker(user_id, created_at)")
+    # Cart badge in every page render: covering index for SUM(quantity)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cart_session ON cart(session_id, quantity)")
+    # Doctor dashboard, admin status filter and user dashboard appointment lists
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_status ON appointments(doctor_id, status, appointment_time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status, appointment_time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments(user_id, appointment_time)")
+    # User dashboard messages
+    c.execute("CREATE INDEX IF NOT EXISTS idx_contacts_email_date ON contacts(email, date)")
+    # Tracker page reminder list
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, remind_time)")
+    # Admin subscription queues only ever look at the flagged minority of users
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_pending ON users(created_at) WHERE subscription_pending = 1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_subscribed ON users(created_at) WHERE is_subscribed = 1")
+    c.execute("ANALYZE")
+
+
+@migration(5, 'integer epoch, day key and type code columns on baby_tracker')
+def _tracker_epoch_columns(c):
+    import tracker
+
+    _add_column(c, 'baby_tracker', 'start_ts', "INTEGER")
+    _add_column(c, 'baby_tracker', 'end_ts', "INTEGER")
+    _add_column(c, 'baby_tracker', 'day_key', "INTEGER")
+    _add_column(c, 'baby_tracker', 'type_code', "INTEGER")
+
+    # Backfill existing rows in chunks; rows whose text times do not parse keep NULLs
+    last_id = 0
+    while True:
+        c.execute("""SELECT id, activity_type, start_time, end_time FROM baby_tracker
+                     WHERE id > ? ORDER BY id LIMIT 1000""", (last_id,))
+        rows = c.fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, activity_type, start_time, end_time in rows:
+            try:
+                start_dt = datetime.strptime(start_time, tracker.TIME_FORMAT)
+                end_dt = datetime.strptime(end_time, tracker.TIME_FORMAT) if end_time else None
+            except (TypeError, ValueError):
+                continue
+            updates.append(tracker.event_values(activity_type, start_dt, end_dt) + (row_id,))
+        c.executemany("UPDATE baby_tracker SET start_ts = ?, end_ts = ?, day_key = ?, type_code = ? WHERE id = ?",
+                      updates)
+        last_id = rows[-1][0]
+
+    # Day views and history lists now read the integer columns
+    c.execute("CREATE INDEX IF NOT EXISTS idx_baby_tracker_user_day ON baby_tracker(user_id, day_key, start_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_baby_tracker_user_ts ON baby_tracker(user_id, start_ts)")
+    c.execute("DROP INDEX IF EXISTS idx_baby_tracker_user_start")
+    c.execute("DROP INDEX IF EXISTS idx_baby_tracker_user_created")
+
+
+@migration(6, 'daily tracker rollups')
+def _tracker_daily_stats(c):
+    import tracker
+
+    c.execute('''CREATE TABLE IF NOT EXISTS tracker_daily_stats
+                 (user_id TEXT NOT NULL,
+                 day_key INTEGER NOT NULL,
+                 type_code INTEGER NOT NULL,
+                 event_count INTEGER NOT NULL DEFAULT 0,
+                 total_seconds INTEGER NOT NULL DEFAULT 0,
+                 first_ts INTEGER,
+                 last_ts INTEGER,
+                 longest_seconds INTEGER NOT NULL DEFAULT 0,
+                 PRIMARY KEY (user_id, day_key, type_code)) WITHOUT ROWID''')
+    tracker.rebuild_rollups(c)
+
+
+@migration(7, 'idempotency keys for batch-ingested tracker events')
+def _tracker_client_keys(c):
+    _add_column(c, 'baby_tracker', 'client_key', "TEXT")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_baby_tracker_client_key
+                 ON baby_tracker(user_id, client_key) WHERE client_key IS NOT NULL""")
+
+
+@migration(8, 'data versions for cache invalidation')
+def _data_versions(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                 (scope TEXT PRIMARY KEY,
+                 version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID''')
+
+
+@migration(9, 'reminder fire times and delivery state')
+def _reminder_schedule(c):
+    import reminders
+
+    _add_column(c, 'reminders', 'remind_ts', "INTEGER")
+    _add_column(c, 'reminders', 'delivered_ts', "INTEGER")
+    c.execute("SELECT id, remind_time, created_at FROM reminders WHERE remind_ts IS NULL")
+    updates = []
+    for reminder_id, remind_time, created_at in c.fetchall():
+        try:
+            created = datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S")
+            updates.append((reminders.next_occurrence(remind_time, created), reminder_id))
+        except (TypeError, ValueError):
+            continue
+    c.executemany("UPDATE reminders SET remind_ts = ? WHERE id = ?", updates)
+    # Only undelivered reminders are indexed, so the scheduler never reads delivered ones
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_reminders_pending
+                 ON reminders(remind_ts) WHERE delivered_ts IS NULL""")
+
+
+@migration(10, 'user events for server-sent notifications')
+def _user_events(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS user_events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 user_id TEXT NOT NULL,
+                 kind TEXT NOT NULL,
+                 payload TEXT NOT NULL,
+                 created_ts INTEGER NOT NULL)''')
+
+
+@migration(11, 'shared AI answer cache')
+def _ai_answer_cache(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_answer_cache
+                 (key TEXT PRIMARY KEY,
+                 answer TEXT NOT NULL,
+                 expires_ts INTEGER NOT NULL) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ai_answer_cache_expires ON ai_answer_cache(expires_ts)")
+
+
+@migration(12, 'server-side AI conversations')
+def _ai_conversations(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_conversations
+                 (id TEXT PRIMARY KEY,
+                 user_id TEXT NOT NULL,
+                 turns BLOB NOT NULL,
+                 version INTEGER NOT NULL DEFAULT 0,
+                 updated_ts INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ai_conversations_user ON ai_conversations(user_id, updated_ts)")
+
+
+@migration(13, 'server-side sessions')
+def _sessions(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions
+                 (id TEXT PRIMARY KEY,
+                 data TEXT NOT NULL,
+                 version INTEGER NOT NULL DEFAULT 0,
+                 expires_ts INTEGER NOT NULL) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_ts)")
@@ -0,0 +1,203 @@
+"""Reminder scheduling.
+
+Reminders keep their original remind_time text (what the user typed, usually
+"HH:MM" from the tracker form) and, since migration 9, the moment they fire as
+remind_ts (local epoch seconds) plus delivered_ts once they have fired. Pending
+reminders are indexed by idx_reminders_pending (remind_ts WHERE delivered_ts IS
+NULL), so only undelivered rows are ever read.
+
+Each worker runs one ReminderScheduler thread. It keeps a min-heap of
+(remind_ts, id) for reminders due within HORIZON and sleeps until the earliest
+one. Every REFRESH seconds it tops the heap up from the partial index, which
+also picks up reminders added by other workers. A reminder fires only if
+the worker can claim it (UPDATE ... WHERE delivered_ts IS NULL), so several
+workers never deliver it twice.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+import tracker
+
+HORIZON = 6 * 3600        # seconds of upcoming reminders kept in the heap
+REFRESH = 60              # seconds between top-ups from the index
+MISFIRE_GRACE = 3600      # reminders overdue by more than this are marked delivered silently
+
+log = logging.getLogger(__name__)
+
+
+def next_occurrence(remind_time, now=None):
+    """Epoch seconds a remind_time should fire at.
+
+    "HH:MM" (or "HH:MM:SS") is the next time that clock time comes round;
+    a full "YYYY-MM-DD HH:MM" / "YYYY-MM-DDTHH:MM" is taken as is. Raises
+    ValueError for anything else.
+    """
+    now = now or datetime.now()
+    value = (remind_time or '').strip()
+    for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return tracker.to_epoch(datetime.strptime(value, fmt))
+        except ValueError:
+            pass
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            clock = datetime.strptime(value, fmt).time()
+            break
+        except ValueError:
+            pass
+    else:
+        raise ValueError(f"Invalid reminder time: {remind_time!r}")
+    at = datetime.combine(now.date(), clock)
+    if at <= now:
+        at += timedelta(days=1)
+    return tracker.to_epoch(at)
+
+
+class ReminderScheduler:
+
+    def __init__(self, path, horizon=HORIZON, refresh=REFRESH, misfire_grace=MISFIRE_GRACE):
+        self.path = path
+        self.horizon = horizon
+        self.refresh = refresh
+        self.misfire_grace = misfire_grace
+        self.handlers = []
+        self._heap = []
+        self._pending = {}      # id -> remind_ts of live heap entries; stale entries are skipped
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stop = False
+        self._loaded_until = 0
+
+    # ----- API used by the request handlers -----
+
+    def on_fire(self, handler):
+        """Register handler(reminder_id, user_id, message, remind_ts), called once per delivery."""
+        self.handlers.append(handler)
+        return handler
+
+    def schedule(self, reminder_id, remind_ts):
+        """Track a new or rescheduled reminder if it is due before the next top-up horizon."""
+        with self._cond:
+            if remind_ts >= self._loaded_until:
+                return
+            self._pending[reminder_id] = remind_ts
+            heapq.heappush(self._heap, (remind_ts, reminder_id))
+            if self._heap[0][1] == reminder_id:
+                self._cond.notify()
+
+    def cancel(self, reminder_id):
+        with self._cond:
+            self._pending.pop(reminder_id, None)
+
+    def __len__(self):
+        return len(self._pending)
+
+    # ----- lifecycle -----
+
+    def start(self):
+        """Start the worker thread; safe to call on every request and after fork."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._heap, self._pending, self._loaded_until = [], {}, 0
+            self._stop = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ----- worker -----
+
+    def load(self, conn, now=None):
+        """Top the heap up with every pending reminder due before now + horizon."""
+        now = int(now if now is not None else time.time())
+        until = now + self.horizon
+        rows = conn.execute("""SELECT id, remind_ts FROM reminders
+                               WHERE delivered_ts IS NULL AND remind_ts < ?
+                               ORDER BY remind_ts""", (until,)).fetchall()
+        with self._cond:
+            for reminder_id, remind_ts in rows:
+                if self._pending.get(reminder_id) != remind_ts:
+                    self._pending[reminder_id] = remind_ts
+                    heapq.heappush(self._heap, (remind_ts, reminder_id))
+            self._loaded_until = until
+            self._cond.notify()
+        return len(rows)
+
+    def _due(self, now):
+        """Pop the reminders due at now; returns [(id, remind_ts)]."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            remind_ts, reminder_id = heapq.heappop(self._heap)
+            if self._pending.get(reminder_id) == remind_ts:
+                del self._pending[reminder_id]
+                due.append((reminder_id, remind_ts))
+        return due
+
+    def fire(self, conn, due, now=None):
+        """Claim and deliver due reminders. Returns the number delivered to handlers."""
+        now = int(now if now is not None else time.time())
+        delivered = 0
+        for reminder_id, remind_ts in due:
+            cur = conn.execute("""UPDATE reminders SET delivered_ts = ?
+                                  WHERE id = ? AND remind_ts = ? AND delivered_ts IS NULL""",
+                               (now, reminder_id, remind_ts))
+            conn.commit()
+            if cur.rowcount != 1:
+                continue  # deleted, rescheduled or claimed by another worker
+            if now - remind_ts > self.misfire_grace:
+                continue
+            row = conn.execute("SELECT user_id, message FROM reminders WHERE id = ?",
+                               (reminder_id,)).fetchone()
+            if row is None:
+                continue
+            for handler in self.handlers:
+                try:
+                    handler(reminder_id, row[0], row[1], remind_ts)
+                except Exception:
+                    log.exception("Reminder handler failed for reminder %s", reminder_id)
+            delivered += 1
+        return delivered
+
+    def _run(self):
+        conn = db.connect(self.path)
+        next_refresh = 0
+        try:
+            while True:
+                now = time.time()
+                if now >= next_refresh:
+                    try:
+                        self.load(conn, now)
+                    except Exception:
+                        log.exception("Could not load pending reminders")
+                    next_refresh = now + self.refresh
+                with self._cond:
+                    if self._stop:
+                        return
+                    due = self._due(int(time.time()))
+                    if not due:
+                        wake = next_refresh
+                        if self._heap:
+                            wake = min(wake, self._heap[0][0])
+                        self._cond.wait(max(0.0, wake - time.time()))
+                        continue
+                try:
+                    self.fire(conn, due)
+                except Exception:
+                    log.exception("Could not deliver reminders")
+        finally:
+            conn.close()
@@ -0,0 +1,260 @@
+"""Server-side sessions.
+
+The cookie carries only an opaque random session id; the session data lives
+in the sessions table (migration 13), so every worker sees the same session
+and requests no longer upload, verify and re-sign the whole session.
+
+Reads go through a per-worker LRU of serialized sessions tagged with the
+row version: opening a session costs one primary-key lookup, and the data
+itself is only read again after another request changed it. Changes are
+written through when the response is saved. Keeping an idle session alive
+only moves its expiry, so those touches are written behind, in batches, by a
+background thread that also deletes expired sessions.
+
+A session cookie from the old signed-cookie sessions is read once and moved
+to the server, so nobody is logged out by the switch. SESSION_BACKEND=cookie
+keeps Flask's default cookie sessions.
+"""
+import logging
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from werkzeug.datastructures import CallbackDict
+
+import db
+from cache import LRUCache
+
+DEFAULT_SIZE = 4096
+IDLE_TIMEOUT = 7 * 24 * 3600    # seconds a non-permanent session survives without requests
+TOUCH_INTERVAL = 300            # expiry is only moved once it is this much out of date
+SWEEP_INTERVAL = 60             # seconds between write-behind flushes and expiry sweeps
+
+log = logging.getLogger(__name__)
+
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, new=False, version=0, expires_ts=0):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid or new_sid()
+        self.new = new
+        self.version = version
+        self.expires_ts = expires_ts
+        self.replaced = None
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Keep the data under a fresh id; the old row and cookie are dropped when the response is saved."""
+        if not self.new:
+            self.replaced = self.sid
+            self.sid = new_sid()
+            self.new = True
+        self.modified = True
+
+    def clear(self):
+        # logout and the like: whatever is stored next goes under a fresh id
+        super().clear()
+        self.regenerate()
+
+
+class SQLiteSessionInterface(SessionInterface):
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, path, maxsize=DEFAULT_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 touch_interval=TOUCH_INTERVAL, sweep_interval=SWEEP_INTERVAL):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.memory = LRUCache(maxsize=maxsize)
+        self._touches = {}      # sid -> expires_ts waiting for the next flush
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._legacy = SecureCookieSessionInterface()
+
+    def ttl(self, app, session):
+        if session.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return self.idle_timeout
+
+    # ----- request side -----
+
+    def open_session(self, app, request):
+        self._start()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession(new=True)
+        if '.' in sid:
+            # a signed cookie from the cookie-session days: move its contents to the server
+            legacy = self._legacy.open_session(app, request)
+            session = ServerSession(dict(legacy or {}), new=True)
+            session.modified = bool(session)
+            return session
+
+        conn = db.get_db()
+        if sid in self.memory:
+            row = conn.execute("SELECT version, expires_ts FROM sessions WHERE id = ?", (sid,)).fetchone()
+            payload = self.memory.get(sid, version=row[0]) if row else None
+            if row is not None and payload is None:
+                row = conn.execute("SELECT version, expires_ts, data FROM sessions WHERE id = ?", (sid,)).fetchone()
+        else:
+            row = conn.execute("SELECT version, expires_ts, data FROM sessions WHERE id = ?", (sid,)).fetchone()
+            payload = None
+        if row is None:
+            return ServerSession(new=True)
+        expires_ts = max(row[1], self._touches.get(sid, 0))
+        if expires_ts <= time.time():
+            return ServerSession(new=True)
+        if payload is None:
+            payload = row[2]
+            self.memory.set(sid, payload, version=row[0])
+        return ServerSession(self.serializer.loads(payload), sid=sid, version=row[0], expires_ts=expires_ts)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.replaced:
+            self.delete(self._connection(), session.replaced)
+        if not session:
+            if not session.new or session.replaced:
+                if not session.new:
+                    self.delete(self._connection(), session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        now = int(time.time())
+        expires_ts = now + self.ttl(app, session)
+        if session.new or session.modified:
+            payload = self.serializer.dumps(dict(session))
+            conn = self._connection()
+            conn.execute("""INSERT INTO sessions (id, data, version, expires_ts) VALUES (?, ?, 0, ?)
+                            ON CONFLICT(id) DO UPDATE SET data = excluded.data, version = version + 1,
+                                                          expires_ts = excluded.expires_ts""",
+                         (session.sid, payload, expires_ts))
+            conn.commit()
+            self._touches.pop(session.sid, None)
+            if session.new:
+                self.memory.set(session.sid, payload, version=0)
+            else:
+                # the new version is read back on the next request; another worker may have written too
+                self.memory.pop(session.sid)
+        elif expires_ts - session.expires_ts >= self.touch_interval:
+            with self._lock:
+                self._touches[session.sid] = expires_ts
+        else:
+            return
+
+        if session.new or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                                partitioned=self.get_cookie_partitioned(app))
+            response.vary.add('Cookie')
+
+    def _connection(self):
+        """The request's connection, for writing the session.
+
+        Committing the session must not commit what the view left uncommitted
+        (a write it gave up on after an error). Teardown rolls that back when
+        the connection goes back to the pool, so it is rolled back here, first.
+        A separate connection would instead wait on the view's write lock.
+        """
+        conn = db.get_db()
+        if conn.in_transaction:
+            log.warning("Rolling back a transaction the view left open before saving the session")
+            conn.rollback()
+        return conn
+
+    def delete(self, conn, sid):
+        conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        conn.commit()
+        self.memory.pop(sid)
+        with self._lock:
+            self._touches.pop(sid, None)
+
+    # ----- write-behind and expiry -----
+
+    def _start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._touches = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+            self._thread.start()
+
+    def flush(self, conn, now=None):
+        """Write pending expiry touches, then delete expired sessions."""
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        if touches:
+            conn.executemany("UPDATE sessions SET expires_ts = ? WHERE id = ? AND expires_ts < ?",
+                             [(expires_ts, sid, expires_ts) for sid, expires_ts in touches.items()])
+        conn.execute("DELETE FROM sessions WHERE expires_ts <= ?", (int(now if now is not None else time.time()),))
+        conn.commit()
+
+    def _run(self):
+        conn = db.connect(self.path)
+        try:
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.flush(conn)
+                except Exception:
+                    log.exception("Could not flush sessions")
+        finally:
+            conn.close()
+
+
+def regenerate(session):
+    """Move the session to a new id, as at login, so an id planted before login is useless after it.
+
+    Cookie sessions carry no id and need nothing.
+    """
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+def init_app(app):
+    app.config.setdefault('SESSION_BACKEND', os.environ.get('SESSION_BACKEND', 'server'))
+    app.config.setdefault('SESSION_IDLE_TIMEOUT', int(os.environ.get('SESSION_IDLE_TIMEOUT', IDLE_TIMEOUT)))
+    if app.config['SESSION_BACKEND'] == 'server':
+        app.session_interface = SQLiteSessionInterface(
+            app.config['DATABASE'], maxsize=int(os.environ.get('SESSION_CACHE_SIZE', DEFAULT_SIZE)),
+            idle_timeout=app.config['SESSION_IDLE_TIMEOUT'])
@@ -0,0 +1,104 @@
+"""
+AI PROVIDER REGISTRY - deadlines, hedging and circuit breakers with stub providers
+"""
+import time
+
+from ai_providers import CircuitBreaker, FakeProvider, ProviderRegistry
+
+
+def make_registry(*providers, hedge_after=None, deadline=2.0):
+    registry = ProviderRegistry(factory=lambda: list(providers), hedge_after=hedge_after, deadline=deadline)
+    registry.set(providers)
+    return registry
+
+
+def test_hedge_answers_from_the_faster_provider():
+    slow = FakeProvider({'q': 'slow'}, delay=0.5, timeout=2.0)
+    fast = FakeProvider({'q': 'fast'})
+    registry = make_registry(slow, fast, hedge_after=0.05)
+
+    started = time.monotonic()
+    assert registry.ask('q', []) == 'fast'
+    assert time.monotonic() - started < 0.4
+
+    time.sleep(0.6)   # the slow answer arrives after the hedge was won
+    assert slow.stats.snapshot()['calls'] == 0
+    assert slow.breaker.consecutive == 0
+    assert fast.stats.snapshot()['calls'] == 1
+
+
+def test_late_answer_counts_as_one_timeout():
+    late = FakeProvider({'q': 'late'}, delay=0.2, timeout=0.05)
+    registry = make_registry(late)
+
+    started = time.monotonic()
+    assert registry.ask('q', []) is None
+    assert time.monotonic() - started < 0.15
+
+    time.sleep(0.3)   # the answer arrives after ask() gave up on it
+    stats = late.stats.snapshot()
+    assert stats['calls'] == 1 and stats['errors'] == 1
+    assert late.breaker.consecutive == 1
+
+
+def test_hung_provider_that_raises_counts_once():
+    hung = FakeProvider(delay=0.2, fail=True, timeout=0.05)
+    registry = make_registry(hung)
+
+    assert registry.ask('q', []) is None
+    time.sleep(0.3)
+    assert hung.stats.snapshot()['calls'] == 1
+    assert hung.breaker.consecutive == 1
+
+
+def test_breaker_opens_after_repeated_timeouts():
+    late = FakeProvider(delay=0.1, timeout=0.02)
+    backup = FakeProvider({'q': 'backup'})
+    registry = make_registry(late, backup)
+
+    for _ in range(3):
+        assert registry.ask('q', []) == 'backup'
+    assert late.breaker.state == 'open'
+
+    started = time.monotonic()
+    assert registry.ask('q', []) == 'backup'
+    assert time.monotonic() - started < 0.02   # skipped, not waited for
+    assert late.calls == 3
+    assert late.stats.snapshot()['error_rate'] == 1.0
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()   # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()            # trial ended without an outcome
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_provider_recovers():
+    flaky = FakeProvider({'q': 'ok'}, fail=True)
+    flaky.breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    registry = make_registry(flaky)
+
+    assert registry.ask('q', []) is None
+    assert flaky.breaker.state == 'open'
+    assert registry.ask('q', []) is None and flaky.calls == 1
+
+    time.sleep(0.06)
+    flaky.fail = False
+    assert registry.ask('q', []) == 'ok'
+    assert flaky.breaker.state == 'closed'
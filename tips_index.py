@@ -0,0 +1,202 @@
+"""BM25 retrieval over the baby care tips in translations.py.
+
+Every tip is split into passages (a paragraph, with a section heading such as
+"BREASTFEEDING" folded into the paragraph after it) and indexed per language.
+Tokenization follows the language: English is lowercased, stopword-filtered
+and suffix-stripped ("feeding", "feeds" -> "feed"); Hindi words are kept
+whole, since its case endings are separate words ("बच्चे को"); Marathi,
+Bengali, Gujarati, Kannada, Tamil and Telugu glue suffixes on ("झोपत", "ঘুমাচ্ছে"),
+so their words are cut to a short prefix, indexed at two lengths
+("தூக்கத்தில்" -> "தூக்", "தூக்க").
+
+A passage is only returned when it matched at least one term that is rare in
+its language (idf >= MIN_IDF) and scored at least MIN_SCORE, so a query that
+only shares "baby" or "do" with the tips finds nothing rather than the first
+tip that happens to say "baby" most often.
+
+The BM25 term weights are computed when the index is built, so a search is a
+few dictionary lookups and additions (well under a millisecond). get_index()
+rebuilds the index only when the catalog version changes.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+
+from ai_cache import STOPWORDS
+
+K1 = 1.2
+B = 0.75
+PASSAGE_CHARS = 500     # passages are cut to this length when quoted
+MIN_IDF = 1.0           # a term in more than about a third of a language's passages is not a match on its own
+MIN_SCORE = 1.0
+
+Passage = namedtuple('Passage', 'lang topic title text')
+
+_TOKEN = re.compile(r"[\wऀ-෿‌‍]+")
+# Unicode blocks of the supported scripts, mapped to the language that uses them
+SCRIPTS = (
+    ('ऀ', 'ॿ', ('hi', 'mr')),
+    ('ঀ', '৿', ('bn',)),
+    ('઀', '૿', ('gu',)),
+    ('஀', '௿', ('ta',)),
+    ('ఀ', '౿', ('te',)),
+    ('ಀ', '೿', ('kn',)),
+)
+PREFIX_STEM = {lang: (3, 5) for lang in ('mr', 'bn', 'gu', 'kn', 'ta', 'te')}   # short prefix for recall, longer for precision
+STOPWORDS_BY_LANG = {
+    'en': STOPWORDS,
+    'hi': frozenset('का की के को में से और है हैं पर यह वह एक भी तो ही या लिए कि जो कर करें'.split()),
+    'mr': frozenset('आणि आहे आहेत च्या ची चा चे ला ने हे ते एक किंवा साठी मध्ये करा'.split()),
+    'bn': frozenset('এবং ও এর কে যে এই সে একটি হয় করে না জন্য থেকে'.split()),
+    'gu': frozenset('અને છે ના ની નું ને માં થી એ આ એક કે માટે કરો'.split()),
+}
+_SUFFIXES = (('ies', 'y'), ('ied', 'y'), ('ing', ''), ('ed', ''), ('es', ''), ('ly', ''), ('s', ''))
+
+
+def stem_en(word):
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            break
+    if word.endswith('e') and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text, lang):
+    stopwords = STOPWORDS_BY_LANG.get(lang, ())
+    tokens = []
+    for word in _TOKEN.findall(text.lower()):
+        if word in stopwords or word.isdigit():
+            continue
+        if word.isascii():
+            word = stem_en(word)
+        elif lang in PREFIX_STEM:
+            tokens.extend({word[:n] for n in PREFIX_STEM[lang]})
+            continue
+        tokens.append(word)
+    return tokens
+
+
+def detect_language(text, hint=None):
+    """Language of text by script; hint picks between languages sharing one (Hindi/Marathi)."""
+    counts = Counter()
+    for ch in text:
+        if ch.isascii():
+            if ch.isalpha():
+                counts['en'] += 1
+            continue
+        for low, high, langs in SCRIPTS:
+            if low <= ch <= high:
+                counts[langs] += 1
+                break
+    if not counts:
+        return hint or 'en'
+    script = counts.most_common(1)[0][0]
+    if script == 'en':
+        return 'en'
+    return hint if hint in script else script[0]
+
+
+def candidate_languages(text, hint=None):
+    """Languages to search for text: the detected one, or without a hint every language of its script."""
+    lang = detect_language(text, hint)
+    if hint is None:
+        for _, _, langs in SCRIPTS:
+            if lang in langs:
+                return langs
+    return (lang,)
+
+
+def split_passages(lang, topic, title, content):
+    """Paragraphs of a tip; a one-line heading is folded into the paragraph after it."""
+    passages = []
+    heading = None
+    for block in re.split(r"\n\s*\n", content.strip()):
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        if not lines:
+            continue
+        if len(lines[0]) <= 60 and not lines[0].startswith('-') and not lines[0].endswith(('.', '।', ':')):
+            if len(lines) == 1:
+                heading = lines[0]
+                continue
+            if lines[1].startswith('-'):
+                heading, lines = lines[0], lines[1:]
+        text = ' '.join('• ' + line[1:].strip() if line.startswith('-') else line for line in lines)
+        passages.append(Passage(lang, topic, f"{title} – {heading.title()}" if heading else title, text))
+        heading = None
+    return passages
+
+
+class TipsIndex:
+
+    def __init__(self, passages):
+        self.passages = passages
+        self.postings = {}      # lang -> {term: [(passage index, bm25 tf weight)]}
+        self.sizes = Counter()  # lang -> passages
+        by_lang = defaultdict(list)
+        for i, passage in enumerate(passages):
+            by_lang[passage.lang].append((i, tokenize(f"{passage.title} {passage.text}", passage.lang)))
+        for lang, docs in by_lang.items():
+            avgdl = sum(len(tokens) for _, tokens in docs) / len(docs)
+            postings = defaultdict(list)
+            for i, tokens in docs:
+                norm = K1 * (1 - B + B * len(tokens) / avgdl)
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((i, tf * (K1 + 1) / (tf + norm)))
+            self.postings[lang] = dict(postings)
+            self.sizes[lang] = len(docs)
+
+    @classmethod
+    def build(cls, catalog):
+        passages = []
+        for lang, lang_data in catalog.items():
+            for topic, tip in lang_data.get('tips', {}).items():
+                passages.extend(split_passages(lang, topic, tip['title'], tip['content']))
+        return cls(passages)
+
+    def search(self, query, lang=None, k=3, topics=None):
+        """Top k (score, Passage) for query, in the query's language (lang is a hint;
+        without one, Hindi and Marathi are both searched for Devanagari).
+
+        topics, when given, restricts the results to passages of those tips.
+        """
+        scores = defaultdict(float)
+        anchored = set()
+        for lang in candidate_languages(query, lang):
+            postings = self.postings.get(lang)
+            if not postings:
+                continue
+            n = self.sizes[lang]
+            for term in set(tokenize(query, lang)):
+                plist = postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                for i, weight in plist:
+                    scores[i] += idf * weight
+                    if idf >= MIN_IDF:
+                        anchored.add(i)
+        candidates = ((i, score) for i, score in scores.items()
+                      if i in anchored and score >= MIN_SCORE
+                      and (topics is None or self.passages[i].topic in topics))
+        best = heapq.nlargest(k, candidates, key=lambda item: item[1])
+        return [(round(score, 4), self.passages[i]) for i, score in best]
+
+
+def quote(passage, limit=PASSAGE_CHARS):
+    text = passage.text if len(passage.text) <= limit else passage.text[:limit].rsplit(' ', 1)[0] + '…'
+    return f"{passage.title}: {text}"
+
+
+_index = None
+_index_version = None
+
+
+def get_index(catalog, version):
+    """The index for this catalog version, built on first use and after the catalog changes."""
+    global _index, _index_version
+    if _index is None or _index_version != version:
+        _index, _index_version = TipsIndex.build(catalog), version
+    return _index
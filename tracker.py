@@ -0,0 +1,436 @@
+"""Baby tracker storage helpers.
+
+baby_tracker rows keep their original text columns (start_time, end_time,
+created_at as "%Y-%m-%d %H:%M:%S") for older code and exports, but reads go
+through the integer columns added by migration 5:
+
+    start_ts / end_ts  local wall-clock time as Unix epoch seconds
+    day_key            local day of start_ts as YYYYMMDD, e.g. 20260111
+    type_code          small integer code for activity_type (see ACTIVITY_TYPES)
+
+Day views are then an index range scan on (user_id, day_key) and no row has
+to be parsed with strptime.
+"""
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+
+import db
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Codes are stored in the database: only ever append, never renumber.
+OTHER = 0
+ACTIVITY_TYPES = {
+    'Feeding': 1,
+    'Diaper Change': 2,
+    'Sleep': 3,
+    'Crying': 4,
+    'Bath': 5,
+    'Playtime': 6,
+    'Medicine': 7,
+    'Solid Food': 8,
+    'Diaper': 9,
+    'Health': 10,
+}
+TYPE_NAMES = {code: name for name, code in ACTIVITY_TYPES.items()}
+
+FEEDING_CODES = (ACTIVITY_TYPES['Feeding'],)
+DIAPER_CODES = (ACTIVITY_TYPES['Diaper Change'], ACTIVITY_TYPES['Diaper'])
+SLEEP_CODE = ACTIVITY_TYPES['Sleep']
+
+
+def type_code(activity_type):
+    return ACTIVITY_TYPES.get(activity_type, OTHER)
+
+
+def to_epoch(dt):
+    return int(dt.timestamp())
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts)
+
+
+def day_key(dt):
+    return dt.year * 10000 + dt.month * 100 + dt.day
+
+
+def parse_day(date_str):
+    """YYYY-MM-DD -> day_key. Raises ValueError for a bad date."""
+    return day_key(datetime.strptime(date_str, "%Y-%m-%d"))
+
+
+def day_key_bounds(key):
+    """Epoch [start, end) of the local day identified by day_key."""
+    day = datetime(key // 10000, key // 100 % 100, key % 100)
+    return to_epoch(day), to_epoch(day + timedelta(days=1))
+
+
+def event_values(activity_type, start_dt, end_dt=None):
+    """Integer column values for an event: (start_ts, end_ts, day_key, type_code)."""
+    return (to_epoch(start_dt),
+            to_epoch(end_dt) if end_dt else None,
+            day_key(start_dt),
+            type_code(activity_type))
+
+
+def format_duration(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
+
+
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 200
+TIMELINE_COLUMNS = "id, activity_type, start_ts, end_ts, notes, type_code, day_key"
+
+
+def encode_cursor(start_ts, row_id):
+    return f"{start_ts}.{row_id}"
+
+
+def decode_cursor(cursor):
+    """Parse a timeline cursor. Raises ValueError if it is malformed."""
+    start_ts, row_id = cursor.split('.', 1)
+    return int(start_ts), int(row_id)
+
+
+def merge_rows(live, archived, descending=False):
+    """Merge two (start_ts, id)-ordered TIMELINE_COLUMNS row iterables.
+
+    A row that is in both (the archive job is moving it) is yielded once.
+    """
+    last_id = None
+    for row in heapq.merge(live, archived, key=lambda row: (row[2], row[0]), reverse=descending):
+        if row[0] != last_id:
+            yield row
+        last_id = row[0]
+
+
+def timeline_page(c, user_id, cursor=None, limit=TIMELINE_PAGE_SIZE, activity_types=None,
+                  start_ts=None, end_ts=None, archive=None):
+    """One page of a user's events, newest first, keyset-paginated on (start_ts, id).
+
+    Returns (rows, next_cursor); rows follow TIMELINE_COLUMNS and next_cursor
+    is None on the last page. Each page is a bounded range scan on
+    idx_baby_tracker_user_ts no matter how deep into the history it is. With
+    an archive (tracker_archive.ArchiveStore) archived rows are merged in.
+    """
+    where = ["user_id = ?", "start_ts IS NOT NULL"]
+    params = [user_id]
+    if activity_types:
+        where.append(f"activity_type IN ({', '.join('?' * len(activity_types))})")
+        params.extend(activity_types)
+    if start_ts is not None:
+        where.append("start_ts >= ?")
+        params.append(start_ts)
+    if end_ts is not None:
+        where.append("start_ts < ?")
+        params.append(end_ts)
+    before = None
+    if cursor:
+        before = decode_cursor(cursor)
+        where.append("(start_ts < ? OR (start_ts = ? AND id < ?))")
+        params.extend([before[0], before[0], before[1]])
+
+    c.execute(f"""SELECT {TIMELINE_COLUMNS} FROM baby_tracker WHERE {' AND '.join(where)}
+                  ORDER BY start_ts DESC, id DESC LIMIT ?""", params + [limit + 1])
+    rows = c.fetchall()
+    if archive is not None:
+        upper = end_ts
+        if before is not None:
+            upper = before[0] + 1 if end_ts is None else min(end_ts, before[0] + 1)
+        archived = archive.rows(user_id, start_ts, upper, activity_types, descending=True)
+        if before is not None:
+            archived = (row for row in archived if (row[2], row[0]) < before)
+        rows = list(islice(merge_rows(rows, archived, descending=True), limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][2], rows[-1][0])
+    return rows, next_cursor
+
+
+# ---------------------------------------------------------------------------
+# Daily rollups
+#
+# tracker_daily_stats keeps one row per (user_id, day_key, type_code) with the
+# event count, total ended duration, first/last start time and the longest
+# single duration. It is updated in the same transaction as every write to
+# baby_tracker, so day stats are a short primary-key read. Durations count
+# towards the day the event started, like the original per-row stats.
+# ---------------------------------------------------------------------------
+
+_ROLLUP_AGGREGATE = """SELECT user_id, day_key, type_code, COUNT(*),
+                              CAST(TOTAL(end_ts - start_ts) AS INTEGER),
+                              MIN(start_ts), MAX(start_ts),
+                              COALESCE(MAX(end_ts - start_ts), 0)
+                       FROM baby_tracker"""
+
+
+_ROLLUP_ADD = """INSERT INTO tracker_daily_stats
+                 (user_id, day_key, type_code, event_count, total_seconds, first_ts, last_ts, longest_seconds)
+                 VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                 ON CONFLICT(user_id, day_key, type_code) DO UPDATE SET
+                     event_count = event_count + 1,
+                     total_seconds = total_seconds + excluded.total_seconds,
+                     first_ts = MIN(first_ts, excluded.first_ts),
+                     last_ts = MAX(last_ts, excluded.last_ts),
+                     longest_seconds = MAX(longest_seconds, excluded.longest_seconds)"""
+
+
+def _rollup_add_params(user_id, key, code, start_ts, end_ts):
+    seconds = end_ts - start_ts if end_ts is not None else 0
+    return (user_id, key, code, seconds, start_ts, start_ts, seconds)
+
+
+def rollup_add(c, user_id, key, code, start_ts, end_ts=None):
+    """Count a newly inserted event."""
+    c.execute(_ROLLUP_ADD, _rollup_add_params(user_id, key, code, start_ts, end_ts))
+
+
+def rollup_add_many(c, user_id, events):
+    """Count many inserted events; events are (day_key, type_code, start_ts, end_ts)."""
+    c.executemany(_ROLLUP_ADD, [_rollup_add_params(user_id, key, code, start_ts, end_ts)
+                                for key, code, start_ts, end_ts in events])
+
+
+def rollup_end(c, user_id, key, code, seconds):
+    """Add the duration of an event that has just been ended for the first time."""
+    c.execute("""UPDATE tracker_daily_stats
+                 SET total_seconds = total_seconds + ?, longest_seconds = MAX(longest_seconds, ?)
+                 WHERE user_id = ? AND day_key = ? AND type_code = ?""",
+              (seconds, seconds, user_id, key, code))
+
+
+def rollup_recompute(c, user_id, key, code, archive=None):
+    """Recompute one (user, day, type) row from raw events.
+
+    Used where an increment cannot be undone exactly (deleting the first,
+    last or longest event, or re-ending one); it only reads that user-day,
+    including its archived rows when an archive is given.
+    """
+    c.execute("DELETE FROM tracker_daily_stats WHERE user_id = ? AND day_key = ? AND type_code = ?",
+              (user_id, key, code))
+    c.execute(f"""INSERT INTO tracker_daily_stats
+                  (user_id, day_key, type_code, event_count, total_seconds, first_ts, last_ts, longest_seconds)
+                  {_ROLLUP_AGGREGATE}
+                  WHERE user_id = ? AND day_key = ? AND type_code = ? AND start_ts IS NOT NULL
+                  GROUP BY user_id, day_key, type_code""",
+              (user_id, key, code))
+    if archive is not None:
+        rollup_add_many(c, user_id, archive.rollup_events(user_id, key, code))
+
+
+def rebuild_rollups(c, user_id=None, archive=None):
+    """Recompute every rollup row (optionally for one user) from raw events.
+
+    Archived rows are only counted when an archive is given.
+    """
+    if user_id is None:
+        c.execute("DELETE FROM tracker_daily_stats")
+        where, params = "", ()
+    else:
+        c.execute("DELETE FROM tracker_daily_stats WHERE user_id = ?", (user_id,))
+        where, params = "AND user_id = ?", (user_id,)
+    c.execute(f"""INSERT INTO tracker_daily_stats
+                  (user_id, day_key, type_code, event_count, total_seconds, first_ts, last_ts, longest_seconds)
+                  {_ROLLUP_AGGREGATE}
+                  WHERE start_ts IS NOT NULL AND day_key IS NOT NULL {where}
+                  GROUP BY user_id, day_key, type_code""", params)
+    if archive is not None:
+        if user_id is None:
+            c.execute("SELECT email FROM users")
+            users = [row[0] for row in c.fetchall()]
+        else:
+            users = [user_id]
+        for user in users:
+            rollup_add_many(c, user, archive.rollup_events(user))
+
+
+def day_stats(c, user_id, key):
+    """Stats for one user-day, read from tracker_daily_stats.
+
+    Keeps the original keys (sleep_duration, feed_count, diaper_count) and
+    adds per-type counts and durations, the first/last event times and the
+    longest sleep.
+    """
+    stats = {'sleep_duration': 0, 'feed_count': 0, 'diaper_count': 0,
+             'event_count': 0, 'total_duration': 0, 'type_counts': {}, 'type_durations': {},
+             'first_ts': None, 'last_ts': None, 'longest_sleep': 0}
+    if key is None:
+        return stats
+    c.execute("""SELECT type_code, event_count, total_seconds, first_ts, last_ts, longest_seconds
+                 FROM tracker_daily_stats WHERE user_id = ? AND day_key = ?""", (user_id, key))
+    for code, count, seconds, first_ts, last_ts, longest in c.fetchall():
+        name = TYPE_NAMES.get(code, 'Other')
+        stats['type_counts'][name] = stats['type_counts'].get(name, 0) + count
+        stats['type_durations'][name] = stats['type_durations'].get(name, 0) + seconds
+        stats['event_count'] += count
+        stats['total_duration'] += seconds
+        stats['first_ts'] = first_ts if stats['first_ts'] is None else min(stats['first_ts'], first_ts)
+        stats['last_ts'] = last_ts if stats['last_ts'] is None else max(stats['last_ts'], last_ts)
+        if code == SLEEP_CODE:
+            stats['sleep_duration'] += seconds
+            stats['longest_sleep'] = max(stats['longest_sleep'], longest)
+        elif code in FEEDING_CODES:
+            stats['feed_count'] += count
+        elif code in DIAPER_CODES:
+            stats['diaper_count'] += count
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Batch ingestion of events logged offline
+# ---------------------------------------------------------------------------
+
+BATCH_LIMIT = 500
+MAX_ACTIVITY_TYPE_LENGTH = 50
+MAX_NOTES_LENGTH = 1000
+MAX_KEY_LENGTH = 100
+# Phones' clocks drift; allow client timestamps slightly in the future
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_client_time(value):
+    """Parse a client timestamp into a naive local datetime.
+
+    Accepts epoch seconds or ISO 8601 ("2026-01-11T12:35:26", with or without
+    seconds or a UTC offset, or the "%Y-%m-%d %H:%M:%S" storage format).
+    Raises ValueError.
+    """
+    if isinstance(value, bool):
+        raise ValueError("invalid timestamp")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(int(value))
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("invalid timestamp")
+    dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.replace(microsecond=0)
+
+
+def validate_event(item, now):
+    """Check one client-submitted event.
+
+    Returns (idempotency_key, activity_type, start_dt, end_dt, notes) or
+    raises ValueError with a message suitable for the per-item result.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("event must be an object")
+    key = item.get('idempotency_key')
+    if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise ValueError("idempotency_key is required")
+    activity_type = item.get('activity_type')
+    if not isinstance(activity_type, str) or not activity_type.strip() or len(activity_type) > MAX_ACTIVITY_TYPE_LENGTH:
+        raise ValueError("activity_type is required")
+    if item.get('start_time') is None:
+        raise ValueError("start_time is required")
+    start_dt = parse_client_time(item['start_time'])
+    end_dt = parse_client_time(item['end_time']) if item.get('end_time') is not None else None
+    if start_dt > now + CLOCK_SKEW:
+        raise ValueError("start_time is in the future")
+    if end_dt is not None and end_dt < start_dt:
+        raise ValueError("end_time is before start_time")
+    notes = item.get('notes') or ''
+    if not isinstance(notes, str) or len(notes) > MAX_NOTES_LENGTH:
+        raise ValueError("notes must be a string of at most %d characters" % MAX_NOTES_LENGTH)
+    return key.strip(), activity_type.strip(), start_dt, end_dt, notes
+
+
+def _chunks(seq, size=500):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def version_scope(user_id):
+    """data_versions scope bumped by every write to the user's tracker rows."""
+    return f"tracker:{user_id}"
+
+
+def bump_version(c, user_id):
+    db.bump_data_version(c, version_scope(user_id))
+
+
+def data_version(c, user_id):
+    return db.data_version(c, version_scope(user_id))
+
+
+def ingest_events(conn, user_id, items, now=None, archive=None):
+    """Validate and insert a batch of events in one transaction.
+
+    Returns one result dict per item, in order, with status 'created',
+    'duplicate' (idempotency key already stored, or repeated in the batch)
+    or 'invalid'. Rows go in with a single executemany, and the daily
+    rollups are updated in the same transaction.
+    """
+    now = now or datetime.now()
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        try:
+            event = validate_event(item, now)
+        except (ValueError, TypeError, OverflowError, OSError) as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e) or 'invalid event'}
+            continue
+        if event[0] in valid:
+            results[index] = {'index': index, 'status': 'duplicate', 'idempotency_key': event[0]}
+            continue
+        valid[event[0]] = (index, event)
+
+    c = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        keys = list(valid)
+        existing = {}
+        for chunk in _chunks(keys):
+            c.execute(f"""SELECT client_key, id FROM baby_tracker
+                          WHERE user_id = ? AND client_key IS NOT NULL
+                          AND client_key IN ({', '.join('?' * len(chunk))})""",
+                      [user_id] + chunk)
+            existing.update(c.fetchall())
+        if archive is not None:
+            # keys of events that were ingested and have since been archived
+            months = {event[2].year * 100 + event[2].month for _, event in valid.values()}
+            existing.update(archive.client_keys(user_id, months))
+
+        rows = []
+        rollups = []
+        for key, (index, (_, activity_type, start_dt, end_dt, notes)) in valid.items():
+            if key in existing:
+                results[index] = {'index': index, 'status': 'duplicate', 'idempotency_key': key,
+                                  'id': existing[key]}
+                continue
+            start_ts, end_ts, day, code = event_values(activity_type, start_dt, end_dt)
+            rows.append((user_id, activity_type, start_dt.strftime(TIME_FORMAT),
+                         end_dt.strftime(TIME_FORMAT) if end_dt else None, notes,
+                         now.strftime(TIME_FORMAT), start_ts, end_ts, day, code, key))
+            rollups.append((day, code, start_ts, end_ts))
+
+        c.executemany("""INSERT INTO baby_tracker
+                         (user_id, activity_type, start_time, end_time, notes, created_at,
+                          start_ts, end_ts, day_key, type_code, client_key)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        rollup_add_many(c, user_id, rollups)
+        if rows:
+            bump_version(c, user_id)
+
+        created = {}
+        new_keys = [row[-1] for row in rows]
+        for chunk in _chunks(new_keys):
+            c.execute(f"""SELECT client_key, id FROM baby_tracker
+                          WHERE user_id = ? AND client_key IS NOT NULL
+                          AND client_key IN ({', '.join('?' * len(chunk))})""",
+                      [user_id] + chunk)
+            created.update(c.fetchall())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for key in new_keys:
+        index = valid[key][0]
+        results[index] = {'index': index, 'status': 'created', 'idempotency_key': key, 'id': created.get(key)}
+    return results
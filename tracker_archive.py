@@ -0,0 +1,384 @@
+"""Cold storage for old baby_tracker rows.
+
+The archive job (flask archive-tracker) moves rows older than a cut-off out
+of SQLite into one file per user and month:
+
+    <TRACKER_ARCHIVE_DIR>/<sha1(user_id)[:20]>/<YYYYMM>.tca
+
+Each file is a small columnar block: a fixed header, then packed little-endian
+integer columns (sorted by start_ts, id) and two string dictionaries, one for
+activity names and one for notes and idempotency keys:
+
+    header   magic, format version, row count, dictionary sizes
+    int64    id, start_ts, end_ts (-1 = never ended), created_ts (-1 = unknown)
+    int32    day_key, type_ref, text_ref (notes, -1 = NULL), key_ref (client_key, -1 = NULL)
+    int16    type_code
+    dicts    uint32 offsets[count + 1] followed by the UTF-8 blob, for each dictionary
+
+Files are read through mmap and np.frombuffer, so opening one costs a page
+fault rather than a parse, and are cached per worker until they change on
+disk. The live table only keeps recent rows; the tracker readers merge in
+archived rows through an ArchiveStore passed as ``archive=``. Archived rows are
+read-only: they can no longer be ended or deleted, so open sleeps are never
+archived. Their daily rollups stay in tracker_daily_stats.
+"""
+import hashlib
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+import tracker
+from cache import LRUCache
+
+MAGIC = b'DBTA'
+FORMAT_VERSION = 1
+SUFFIX = '.tca'
+DEFAULT_ARCHIVE_DAYS = 180
+
+_HEADER = struct.Struct('<4sHHIIIII')
+_HEADER_SIZE = 32
+COLUMNS = (
+    ('id', '<i8'), ('start_ts', '<i8'), ('end_ts', '<i8'), ('created_ts', '<i8'),
+    ('day_key', '<i4'), ('type_ref', '<i4'), ('text_ref', '<i4'), ('key_ref', '<i4'),
+    ('type_code', '<i2'),
+)
+
+# Row shape used by the archive job: the columns it reads from baby_tracker
+ARCHIVE_SELECT = """SELECT id, activity_type, start_ts, end_ts, notes, created_at, day_key,
+                           type_code, client_key FROM baby_tracker"""
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+def month_of(ts):
+    """YYYYMM of the local day an epoch falls on."""
+    return tracker.day_key(tracker.from_epoch(ts)) // 100
+
+
+def month_bounds(month):
+    """Epoch [start, end) of a YYYYMM month."""
+    first = datetime(month // 100, month % 100, 1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return tracker.to_epoch(first), tracker.to_epoch(following)
+
+
+def _pack_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return offsets.tobytes(), b''.join(encoded)
+
+
+class _Dictionary:
+    """Assigns consecutive ids to distinct strings."""
+
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def ref(self, value):
+        if value is None:
+            return -1
+        ref = self.index.get(value)
+        if ref is None:
+            ref = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return ref
+
+
+def encode(rows):
+    """Serialize ARCHIVE_SELECT rows (any order, unique ids) into file bytes."""
+    rows = sorted(rows, key=lambda r: (r[2], r[0]))
+    n = len(rows)
+    types, texts = _Dictionary(), _Dictionary()
+    columns = {name: np.empty(n, dtype=dtype) for name, dtype in COLUMNS}
+    for i, (id_, activity_type, start_ts, end_ts, notes, created_at, day, code, key) in enumerate(rows):
+        try:
+            created_ts = tracker.to_epoch(datetime.strptime(created_at, tracker.TIME_FORMAT))
+        except (TypeError, ValueError):
+            created_ts = -1
+        columns['id'][i] = id_
+        columns['start_ts'][i] = start_ts
+        columns['end_ts'][i] = -1 if end_ts is None else end_ts
+        columns['created_ts'][i] = created_ts
+        columns['day_key'][i] = day
+        columns['type_ref'][i] = types.ref(activity_type)
+        columns['text_ref'][i] = texts.ref(notes)
+        columns['key_ref'][i] = texts.ref(key)
+        columns['type_code'][i] = code or tracker.OTHER
+
+    type_offsets, type_blob = _pack_strings(types.strings)
+    text_offsets, text_blob = _pack_strings(texts.strings)
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, n, len(types.strings), len(type_blob),
+                                 len(texts.strings), len(text_blob)))
+    out.extend(b'\0' * (_HEADER_SIZE - len(out)))
+    for name, _ in COLUMNS:
+        out.extend(columns[name].tobytes())
+        out.extend(b'\0' * (_align(len(out)) - len(out)))
+    for chunk in (type_offsets, type_blob, text_offsets, text_blob):
+        out.extend(chunk)
+    return bytes(out)
+
+
+class ArchiveFile:
+    """Read-only view of one archive file; the columns are arrays over the mmap."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, n, n_types, types_len, n_texts, texts_len = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a tracker archive")
+        self.path = path
+        self.rows = n
+        offset = _HEADER_SIZE
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.frombuffer(self._map, dtype=dtype, count=n, offset=offset))
+            offset = _align(offset + n * np.dtype(dtype).itemsize)
+        self._types, offset = self._dictionary(offset, n_types, types_len)
+        self._texts, _ = self._dictionary(offset, n_texts, texts_len)
+        self._type_names = [self._string(self._types, i) for i in range(n_types)]
+
+    def _dictionary(self, offset, count, blob_len):
+        offsets = np.frombuffer(self._map, dtype='<u4', count=count + 1, offset=offset)
+        start = offset + offsets.nbytes
+        return (offsets, start), start + blob_len
+
+    def _string(self, dictionary, ref):
+        if ref < 0:
+            return None
+        offsets, start = dictionary
+        return self._map[start + int(offsets[ref]):start + int(offsets[ref + 1])].decode('utf-8')
+
+    def activity_type(self, i):
+        return self._type_names[self.type_ref[i]]
+
+    def notes(self, i):
+        return self._string(self._texts, int(self.text_ref[i]))
+
+    def client_key(self, i):
+        return self._string(self._texts, int(self.key_ref[i]))
+
+    def select(self, start_ts=None, end_ts=None, activity_types=None):
+        """Indices of rows with start_ts in [start_ts, end_ts), in (start_ts, id) order."""
+        lo = 0 if start_ts is None else int(np.searchsorted(self.start_ts, start_ts, side='left'))
+        hi = self.rows if end_ts is None else int(np.searchsorted(self.start_ts, end_ts, side='left'))
+        indices = np.arange(lo, hi)
+        if activity_types:
+            refs = [i for i, name in enumerate(self._type_names) if name in activity_types]
+            indices = indices[np.isin(self.type_ref[lo:hi], refs)]
+        return indices
+
+    def timeline_row(self, i):
+        """A tracker.TIMELINE_COLUMNS tuple (an ArchivedRow)."""
+        end_ts = int(self.end_ts[i])
+        return ArchivedRow((int(self.id[i]), self.activity_type(i), int(self.start_ts[i]),
+                            None if end_ts < 0 else end_ts, self.notes(i),
+                            int(self.type_code[i]), int(self.day_key[i])))
+
+    def archive_row(self, i):
+        """An ARCHIVE_SELECT tuple, used when a month file is rewritten."""
+        end_ts, created_ts = int(self.end_ts[i]), int(self.created_ts[i])
+        created_at = tracker.from_epoch(created_ts).strftime(tracker.TIME_FORMAT) if created_ts >= 0 else None
+        return (int(self.id[i]), self.activity_type(i), int(self.start_ts[i]),
+                None if end_ts < 0 else end_ts, self.notes(i), created_at,
+                int(self.day_key[i]), int(self.type_code[i]), self.client_key(i))
+
+
+class ArchivedRow(tuple):
+    """A timeline row read from an archive file; the UI shows it read-only."""
+    __slots__ = ()
+
+
+class ArchiveStore:
+    """The archive directory, with a per-worker cache of opened files."""
+
+    def __init__(self, root, cache_size=64):
+        self.root = root
+        self._files = LRUCache(maxsize=cache_size)
+
+    def user_dir(self, user_id):
+        return os.path.join(self.root, hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:20])
+
+    def path(self, user_id, month):
+        return os.path.join(self.user_dir(user_id), f"{month}{SUFFIX}")
+
+    def months(self, user_id, start_ts=None, end_ts=None):
+        """Archived YYYYMM months for a user, ascending, limited to those overlapping [start_ts, end_ts)."""
+        try:
+            names = os.listdir(self.user_dir(user_id))
+        except FileNotFoundError:
+            return []
+        months = sorted(int(name[:-len(SUFFIX)]) for name in names
+                        if name.endswith(SUFFIX) and name[:-len(SUFFIX)].isdigit())
+        if start_ts is not None:
+            months = [m for m in months if m >= month_of(start_ts)]
+        if end_ts is not None:
+            months = [m for m in months if m <= month_of(end_ts - 1)]
+        return months
+
+    def open(self, user_id, month):
+        path = self.path(user_id, month)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (st.st_mtime_ns, st.st_size)
+        archive = self._files.get(path, version)
+        if archive is None:
+            archive = ArchiveFile(path)
+            self._files.set(path, archive, version)
+        return archive
+
+    def write(self, user_id, month, rows):
+        """Atomically replace a month file with rows (ARCHIVE_SELECT tuples)."""
+        os.makedirs(self.user_dir(user_id), exist_ok=True)
+        path = self.path(user_id, month)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(encode(rows))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._files.pop(path)
+
+    # ----- readers -----
+
+    def rows(self, user_id, start_ts=None, end_ts=None, activity_types=None, descending=False):
+        """TIMELINE_COLUMNS tuples in (start_ts, id) order, one month file at a time."""
+        months = self.months(user_id, start_ts, end_ts)
+        for month in (reversed(months) if descending else months):
+            archive = self.open(user_id, month)
+            if archive is None:
+                continue
+            indices = archive.select(start_ts, end_ts, activity_types)
+            for i in (indices[::-1] if descending else indices):
+                yield archive.timeline_row(i)
+
+    def arrays(self, user_id, start_ts=None, end_ts=None):
+        """Concatenated (start_ts, end_ts, type_code) int64 arrays; end_ts is -1 when not ended."""
+        parts = []
+        for month in self.months(user_id, start_ts, end_ts):
+            archive = self.open(user_id, month)
+            if archive is None:
+                continue
+            indices = archive.select(start_ts, end_ts)
+            parts.append((archive.start_ts[indices], archive.end_ts[indices],
+                          archive.type_code[indices].astype(np.int64)))
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def client_keys(self, user_id, months):
+        """{client_key: id} for the archived rows of the given months."""
+        keys = {}
+        for month in set(months) & set(self.months(user_id)):
+            archive = self.open(user_id, month)
+            if archive is None:
+                continue
+            for i in np.flatnonzero(archive.key_ref >= 0):
+                keys[archive.client_key(i)] = int(archive.id[i])
+        return keys
+
+    def rollup_events(self, user_id, key=None, code=None):
+        """(day_key, type_code, start_ts, end_ts) for archived rows, optionally one day and type."""
+        if key is None:
+            months, start_ts, end_ts = self.months(user_id), None, None
+        else:
+            start_ts, end_ts = tracker.day_key_bounds(key)
+            months = self.months(user_id, start_ts, end_ts)
+        events = []
+        for month in months:
+            archive = self.open(user_id, month)
+            if archive is None:
+                continue
+            for i in archive.select(start_ts, end_ts):
+                if key is not None and (archive.day_key[i] != key or archive.type_code[i] != code):
+                    continue
+                end = int(archive.end_ts[i])
+                events.append((int(archive.day_key[i]), int(archive.type_code[i]),
+                               int(archive.start_ts[i]), None if end < 0 else end))
+        return events
+
+
+# ----- archive job -----
+
+def archive_user(conn, store, user_id, cutoff_ts):
+    """Move a user's rows with start_ts < cutoff_ts into month files. Returns the row count.
+
+    Each month is handled in its own write transaction: the file is rewritten
+    with the existing archived rows plus the new ones, then the rows are
+    deleted from baby_tracker and the transaction commits. Sleeps that are
+    still open are left in baby_tracker, since archived rows cannot be ended.
+    """
+    c = conn.cursor()
+    c.execute("""SELECT DISTINCT day_key / 100 FROM baby_tracker
+                 WHERE user_id = ? AND start_ts < ? AND day_key IS NOT NULL""", (user_id, cutoff_ts))
+    months = sorted(row[0] for row in c.fetchall())
+    moved = 0
+    for month in months:
+        start_ts, end_ts = month_bounds(month)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # a sleep that was never ended stays live, where it can still be ended
+            c.execute(f"""{ARCHIVE_SELECT}
+                          WHERE user_id = ? AND start_ts >= ? AND start_ts < ? AND start_ts < ?
+                          AND day_key IS NOT NULL AND (end_ts IS NOT NULL OR type_code != ?)""",
+                      (user_id, start_ts, end_ts, cutoff_ts, tracker.SLEEP_CODE))
+            rows = {row[0]: row for row in c.fetchall()}
+            if rows:
+                existing = store.open(user_id, month)
+                if existing is not None:
+                    for i in range(existing.rows):
+                        row = existing.archive_row(i)
+                        rows.setdefault(row[0], row)
+                store.write(user_id, month, rows.values())
+                ids = [row[0] for row in rows.values()]
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    c.execute(f"DELETE FROM baby_tracker WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+                    moved += c.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return moved
+
+
+def archive_all(conn, store, cutoff_ts, user_id=None):
+    """Archive every user (or one). Returns {user_id: rows moved} for users with rows moved."""
+    if user_id is None:
+        users = [row[0] for row in conn.execute(
+            "SELECT DISTINCT user_id FROM baby_tracker WHERE start_ts < ?", (cutoff_ts,)).fetchall()]
+    else:
+        users = [user_id]
+    moved = {}
+    for user in users:
+        count = archive_user(conn, store, user, cutoff_ts)
+        if count:
+            moved[user] = count
+    return moved
+
+
+def get_store(app=None):
+    app = app or current_app
+    store = app.extensions.get('tracker_archive')
+    if store is None:
+        store = ArchiveStore(app.config['TRACKER_ARCHIVE_DIR'])
+        app.extensions['tracker_archive'] = store
+    return store
+
+
+def init_app(app):
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE'])), 'tracker_archive')
+    app.config.setdefault('TRACKER_ARCHIVE_DIR', os.environ.get('TRACKER_ARCHIVE_DIR', default_dir))
+    app.config.setdefault('TRACKER_ARCHIVE_DAYS',
+                          int(os.environ.get('TRACKER_ARCHIVE_DAYS', DEFAULT_ARCHIVE_DAYS)))
@@ -0,0 +1,128 @@
+"""Streaming export of a user's tracker history.
+
+Rows are read with fetchmany in fixed-size chunks and written out as CSV or
+NDJSON as they arrive, so an export of years of entries holds at most one
+chunk in memory. The generators are wrapped in a streaming Response by the
+/tracker/export view.
+"""
+import csv
+import io
+import json
+
+import tracker
+
+EXPORT_CHUNK = 500
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+SECTIONS = ('reminders', 'appointments')
+
+EVENT_FIELDS = ('id', 'activity_type', 'start_time', 'end_time', 'duration_seconds', 'notes')
+REMINDER_FIELDS = ('id', 'message', 'remind_time', 'created_at')
+APPOINTMENT_FIELDS = ('id', 'doctor', 'specialization', 'appointment_time', 'type', 'status',
+                      'notes', 'created_at')
+
+
+def iter_rows(c, sql, params, chunk=EXPORT_CHUNK):
+    c.execute(sql, params)
+    while True:
+        rows = c.fetchmany(chunk)
+        if not rows:
+            break
+        yield from rows
+
+
+def event_rows(c, user_id, activity_types=None, start_ts=None, end_ts=None, archive=None):
+    """Tracker events, oldest first, as EVENT_FIELDS tuples.
+
+    With an archive, archived rows are merged in one month file at a time.
+    """
+    where = ["user_id = ?", "start_ts IS NOT NULL"]
+    params = [user_id]
+    if activity_types:
+        where.append(f"activity_type IN ({', '.join('?' * len(activity_types))})")
+        params.extend(activity_types)
+    if start_ts is not None:
+        where.append("start_ts >= ?")
+        params.append(start_ts)
+    if end_ts is not None:
+        where.append("start_ts < ?")
+        params.append(end_ts)
+    sql = f"""SELECT id, activity_type, start_ts, end_ts, notes FROM baby_tracker
+              WHERE {' AND '.join(where)} ORDER BY start_ts, id"""
+    rows = iter_rows(c, sql, params)
+    if archive is not None:
+        rows = tracker.merge_rows(rows, archive.rows(user_id, start_ts, end_ts, activity_types))
+    for id_, activity_type, start, end, notes, *_ in rows:
+        yield (id_, activity_type,
+               tracker.from_epoch(start).strftime(tracker.TIME_FORMAT),
+               tracker.from_epoch(end).strftime(tracker.TIME_FORMAT) if end is not None else None,
+               end - start if end is not None else None,
+               notes)
+
+
+def reminder_rows(c, user_id):
+    return iter_rows(c, """SELECT id, message, remind_time, created_at FROM reminders
+                           WHERE user_id = ? ORDER BY id""", (user_id,))
+
+
+def appointment_rows(c, user_id, date_from=None, date_to=None):
+    """Appointments, optionally limited to inclusive YYYY-MM-DD bounds."""
+    where = ["a.user_id = ?"]
+    params = [user_id]
+    if date_from:
+        where.append("a.appointment_time >= ?")
+        params.append(date_from)
+    if date_to:
+        # appointment_time starts with the date, so compare against the next character
+        where.append("a.appointment_time < ?")
+        params.append(date_to + '~')
+    sql = f"""SELECT a.id, d.name, d.specialization, a.appointment_time, a.type, a.status,
+                     a.notes, a.created_at
+              FROM appointments a LEFT JOIN doctors d ON a.doctor_id = d.id
+              WHERE {' AND '.join(where)} ORDER BY a.appointment_time, a.id"""
+    return iter_rows(c, sql, params)
+
+
+def csv_stream(sections):
+    """CSV with a leading "section" column; each section starts with its own header row."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for name, fields, rows in sections:
+        writer.writerow(('section',) + fields)
+        for count, row in enumerate(rows, 1):
+            writer.writerow((name,) + tuple(row))
+            if count % EXPORT_CHUNK == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def ndjson_stream(sections):
+    """One JSON object per line, tagged with its section."""
+    for name, fields, rows in sections:
+        lines = []
+        for row in rows:
+            lines.append(json.dumps({'section': name, **dict(zip(fields, row))}, ensure_ascii=False))
+            if len(lines) >= EXPORT_CHUNK:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+
+def export_stream(c, user_id, fmt, activity_types=None, start_ts=None, end_ts=None,
+                  date_from=None, date_to=None, include=(), archive=None):
+    """Generator for the whole export; each section's query only runs when it is reached."""
+    sections = [('tracker', EVENT_FIELDS,
+                 event_rows(c, user_id, activity_types, start_ts, end_ts, archive))]
+    if 'reminders' in include:
+        sections.append(('reminders', REMINDER_FIELDS, reminder_rows(c, user_id)))
+    if 'appointments' in include:
+        sections.append(('appointments', APPOINTMENT_FIELDS,
+                         appointment_rows(c, user_id, date_from, date_to)))
+    return csv_stream(sections) if fmt == 'csv' else ndjson_stream(sections)
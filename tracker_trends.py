@@ -0,0 +1,142 @@
+"""Multi-day trend analytics for the baby tracker.
+
+analyze_activities_for_health in app.py looks at a single day. This module
+looks at a window of 7, 30 or 90 days: the window is loaded with one indexed
+query into NumPy arrays and every statistic is computed in vectorized form,
+so the cost does not grow with Python per-row loops.
+
+Imported at startup like tracker_archive, which needs NumPy to read the
+archive files anyway.
+"""
+from datetime import datetime, timedelta
+from itertools import chain
+
+import numpy as np
+
+import tracker
+
+WINDOWS = (7, 30, 90)
+ROLLING_DAYS = 7
+PERCENTILES = (10, 25, 50, 75, 90)
+# Sleep bout histogram edges in minutes
+SLEEP_BOUT_EDGES = (0, 30, 60, 120, 180, 240, 360, 24 * 60)
+
+
+def window_bounds(days, today=None):
+    """Local midnights for the window's days plus the end bound (days + 1 values)."""
+    today = today or datetime.now()
+    first = datetime(today.year, today.month, today.day) - timedelta(days=days - 1)
+    return [first + timedelta(days=i) for i in range(days + 1)]
+
+
+def load_window(c, user_id, start_ts, end_ts, archive=None):
+    """(start_ts, end_ts, type_code) arrays for the user's events in [start_ts, end_ts).
+
+    end_ts is -1 for events that have not been ended. Archived rows in the
+    window are appended straight from the archive's column arrays.
+    """
+    c.execute("""SELECT start_ts, COALESCE(end_ts, -1), COALESCE(type_code, 0) FROM baby_tracker
+                 WHERE user_id = ? AND start_ts >= ? AND start_ts < ?""",
+              (user_id, start_ts, end_ts))
+    rows = c.fetchall()
+    data = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 3)
+    data = data.reshape(-1, 3)
+    start, end, codes = data[:, 0], data[:, 1], data[:, 2]
+    if archive is not None:
+        archived = archive.arrays(user_id, start_ts, end_ts)
+        if archived[0].size:
+            start, end, codes = (np.concatenate(pair) for pair in zip((start, end, codes), archived))
+    return start, end, codes
+
+
+def _rolling_mean(series, width):
+    """Trailing mean; the first days average over what is available."""
+    sums = np.cumsum(series, dtype=np.float64)
+    sums[width:] = sums[width:] - sums[:-width]
+    counts = np.minimum(np.arange(1, len(series) + 1), width)
+    return sums / counts
+
+
+def _deltas(series):
+    return [None] + np.round(np.diff(series), 2).tolist()
+
+
+def _percentiles(values):
+    if values.size == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def compute_trends(start, end, codes, bounds):
+    """Vectorized trend statistics.
+
+    start/end/codes are the arrays from load_window; bounds are the epoch
+    seconds of each local midnight in the window plus the end bound.
+    """
+    days = len(bounds) - 1
+    bounds = np.asarray(bounds, dtype=np.int64)
+    day_idx = np.searchsorted(bounds, start, side='right') - 1
+    hour = np.clip((start - bounds[day_idx]) // 3600, 0, 23)
+
+    is_feed = np.isin(codes, tracker.FEEDING_CODES)
+    is_diaper = np.isin(codes, tracker.DIAPER_CODES)
+    is_sleep = codes == tracker.SLEEP_CODE
+    is_crying = codes == tracker.ACTIVITY_TYPES['Crying']
+    ended_sleep = is_sleep & (end >= start)
+    sleep_minutes = (end[ended_sleep] - start[ended_sleep]) / 60.0
+
+    daily = {
+        'feeds': np.bincount(day_idx[is_feed], minlength=days),
+        'diapers': np.bincount(day_idx[is_diaper], minlength=days),
+        'sleep_hours': np.bincount(day_idx[ended_sleep], weights=sleep_minutes / 60.0, minlength=days),
+        'crying': np.bincount(day_idx[is_crying], minlength=days),
+    }
+    width = min(ROLLING_DAYS, days)
+
+    feed_times = np.sort(start[is_feed])
+    feed_intervals = np.diff(feed_times) / 60.0
+
+    bout_counts, _ = np.histogram(sleep_minutes, bins=SLEEP_BOUT_EDGES)
+    edges = SLEEP_BOUT_EDGES
+    bout_labels = [f"{edges[i]}-{edges[i + 1]}m" for i in range(len(edges) - 1)]
+
+    return {
+        'events': int(start.size),
+        'daily': {name: np.round(series, 2).tolist() for name, series in daily.items()},
+        'rolling_avg': {name: np.round(_rolling_mean(series, width), 2).tolist()
+                        for name, series in daily.items()},
+        'rolling_days': width,
+        'day_over_day': {name: _deltas(series) for name, series in daily.items()},
+        'hourly': {
+            'feeds': np.bincount(hour[is_feed], minlength=24).tolist(),
+            'diapers': np.bincount(hour[is_diaper], minlength=24).tolist(),
+            'sleep_starts': np.bincount(hour[is_sleep], minlength=24).tolist(),
+            'crying': np.bincount(hour[is_crying], minlength=24).tolist(),
+        },
+        'feeding_intervals_minutes': {
+            'count': int(feed_intervals.size),
+            'mean': round(float(feed_intervals.mean()), 1) if feed_intervals.size else None,
+            **_percentiles(feed_intervals),
+        },
+        'sleep_bouts_minutes': {
+            'count': int(sleep_minutes.size),
+            'mean': round(float(sleep_minutes.mean()), 1) if sleep_minutes.size else None,
+            'longest': round(float(sleep_minutes.max()), 1) if sleep_minutes.size else None,
+            **_percentiles(sleep_minutes),
+            'histogram': dict(zip(bout_labels, bout_counts.tolist())),
+        },
+    }
+
+
+def user_trends(c, user_id, days, today=None, archive=None):
+    midnights = window_bounds(days, today)
+    bounds = [tracker.to_epoch(dt) for dt in midnights]
+    start, end, codes = load_window(c, user_id, bounds[0], bounds[-1], archive)
+    result = compute_trends(start, end, codes, bounds)
+    result['window'] = {
+        'days': days,
+        'start': midnights[0].strftime('%Y-%m-%d'),
+        'end': midnights[-2].strftime('%Y-%m-%d'),
+    }
+    result['dates'] = [dt.strftime('%Y-%m-%d') for dt in midnights[:-1]]
+    return result
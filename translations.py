@@ -1,5 +1,7 @@
 # Translations for baby care tips
 # Supported languages: en (English), hi (Hindi), kn (Kannada), ta (Tamil), te (Telugu), mr (Marathi), gu (Gujarati), bn (Bengali)
+# ai_keywords: per-intent keywords for the AI assistant fallback. English entries
+# ending in * match as prefixes; other scripts match anywhere in the question.
 
 translations = {
     'en': {
@@ -12,6 +14,20 @@ translations = {
         'subscribe_required': 'Subscribe to watch',
         'premium_banner': 'Premium videos: To watch all expert video guides, please subscribe for just ₹99/month',
         'subscribe_button': 'Subscribe ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['fever*', 'temp*', 'hot', 'warm'],
+            'vomit': ['vomit*', 'puke*', 'throw up', 'throwing up', 'spit up', 'spitting up'],
+            'sleep': ['sleep*', 'slept', 'nap*', 'awake', 'night*', 'bedtime'],
+            'feeding': ['feed*', 'fed', 'milk', 'breast*', 'bottle*', 'hungry', 'latch*', 'formula'],
+            'stool': ['poop*', 'constipat*', 'diarrh*', 'stool*', 'bowel*'],
+            'crying': ['cry', 'cries', 'crying', 'colic*', 'fuss*', 'scream*'],
+            'rash': ['rash*', 'skin', 'acne', 'red', 'eczema', 'itch*'],
+            'cold': ['cough*', 'cold', 'sneez*', 'nose', 'congest*', 'runny'],
+            'solids': ['solid*', 'food*', 'eat*', 'puree*', 'weaning'],
+            'greeting': ['hello', 'hi', 'hey'],
+            'thanks': ['thank*', 'thx'],
+        },
         'tips': {
             'feeding': {
                 'title': 'Feeding Your Newborn',
@@ -45,6 +61,20 @@ translations = {
         'subscribe_required': 'देखने के लिए सब्सक्राइब करें',
         'premium_banner': 'प्रीमियम वीडियो: सभी विशेषज्ञ वीडियो गाइड देखने के लिए, कृपया बस ₹99/माह में सब्सक्राइब करें',
         'subscribe_button': 'सब्सक्राइब ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['बुखार', 'तापमान', 'bukhar'],
+            'vomit': ['उल्टी', 'उलटी'],
+            'sleep': ['नींद', 'सुला', 'सोता', 'सोती', 'सो नहीं'],
+            'feeding': ['दूध', 'स्तनपान', 'खिला', 'भूख'],
+            'stool': ['पॉटी', 'कब्ज', 'दस्त', 'मल त्याग'],
+            'crying': ['रोना', 'रोता', 'रोती', 'रो रहा', 'रो रही', 'चिड़चिड़'],
+            'rash': ['दाने', 'चकत्ते', 'रैश', 'खुजली'],
+            'cold': ['खांसी', 'खाँसी', 'सर्दी', 'जुकाम', 'छींक', 'नाक बंद'],
+            'solids': ['ठोस', 'खाना', 'आहार'],
+            'greeting': ['नमस्ते', 'नमस्कार'],
+            'thanks': ['धन्यवाद', 'शुक्रिया'],
+        },
         'tips': {
             'feeding': {
                 'title': 'अपने नवजात शिशु को खिलाना',
@@ -78,6 +108,20 @@ translations = {
         'subscribe_required': 'ವೀಕ್ಷಿಸಲು ಚಂದಾದಾರರಾಗಿ',
         'premium_banner': 'ಪ್ರೀಮಿಯಂ ವೀಡಿಯೊಗಳು: ಎಲ್ಲಾ ತಜ್ಞ ವೀಡಿಯೊ ಮಾರ್ಗದರ್ಶಿಗಳನ್ನು ವೀಕ್ಷಿಸಲು, ದಯವಿಟ್ಟು ತಿಂಗಳಿಗೆ ₹99 ಕ್ಕೆ ಚಂದಾದಾರರಾಗಿ',
         'subscribe_button': 'ಚಂದಾದಾರರಾಗಿ ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['ಜ್ವರ', 'ತಾಪಮಾನ'],
+            'vomit': ['ವಾಂತಿ'],
+            'sleep': ['ನಿದ್ರೆ', 'ನಿದ್ದೆ', 'ಮಲಗ'],
+            'feeding': ['ಹಾಲು', 'ಸ್ತನ್ಯಪಾನ', 'ಹಸಿವು', 'ಉಣಿಸ'],
+            'stool': ['ಮಲಬದ್ಧತೆ', 'ಭೇದಿ', 'ಅತಿಸಾರ', 'ಮಲವಿಸರ್ಜನೆ'],
+            'crying': ['ಅಳು', 'ಅಳುತ್ತ'],
+            'rash': ['ದದ್ದು', 'ತುರಿಕೆ', 'ಗುಳ್ಳೆ'],
+            'cold': ['ಕೆಮ್ಮು', 'ನೆಗಡಿ', 'ಶೀತ', 'ಸೀನು'],
+            'solids': ['ಘನ ಆಹಾರ', 'ಆಹಾರ'],
+            'greeting': ['ನಮಸ್ಕಾರ', 'ಹಲೋ'],
+            'thanks': ['ಧನ್ಯವಾದ'],
+        },
         'tips': {
             'feeding': {
                 'title': 'ನಿಮ್ಮ ನವಜಾತ ಶಿಶುವನ್ನು ಆಹಾರ ನೀಡುವುದು',
@@ -111,6 +155,20 @@ translations = {
         'subscribe_required': 'பார்க்க சந்தா செலுத்துங்கள்',
         'premium_banner': 'பிரீமியம் வீடியோக்கள்: அனைத்து நிபுணர் வீடியோ வழிகாட்டிகளையும் பார்க்க, மாதம் ₹99க்கு சந்தா செலுத்துங்கள்',
         'subscribe_button': 'சந்தா ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['காய்ச்சல்', 'ஜுரம்', 'வெப்பநிலை'],
+            'vomit': ['வாந்தி'],
+            'sleep': ['தூக்கம்', 'தூங்க'],
+            'feeding': ['பால்', 'தாய்ப்பால்', 'பசி', 'உணவளி'],
+            'stool': ['மலம்', 'மலச்சிக்கல்', 'வயிற்றுப்போக்கு'],
+            'crying': ['அழு', 'அழுகை'],
+            'rash': ['தடிப்பு', 'அரிப்பு', 'வேனல்'],
+            'cold': ['இருமல்', 'சளி', 'தும்மல்'],
+            'solids': ['திட உணவு', 'உணவு'],
+            'greeting': ['வணக்கம்'],
+            'thanks': ['நன்றி'],
+        },
         'tips': {
             'feeding': {
                 'title': 'உங்கள் பிறந்த குழந்தைக்கு தாய் பாலுண்ணை',
@@ -144,6 +202,20 @@ translations = {
         'subscribe_required': 'చూడటానికి సబ్స్క్రయిబ్ చేయండి',
         'premium_banner': 'ప్రీమియం వీడియోలు: అన్ని నిపుణుల వీడియో గైడ్‌లను చూడటానికి, దయచేసి నెలకు ₹99తో సబ్స్క్రయిబ్ చేయండి',
         'subscribe_button': 'సబ్స్క్రయిబ్ ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['జ్వరం', 'ఉష్ణోగ్రత'],
+            'vomit': ['వాంతి', 'వాంతులు'],
+            'sleep': ['నిద్ర', 'పడుకో'],
+            'feeding': ['పాలు', 'తల్లిపాలు', 'ఆకలి'],
+            'stool': ['మలం', 'మలబద్ధకం', 'విరేచనాలు'],
+            'crying': ['ఏడుపు', 'ఏడుస్త'],
+            'rash': ['దద్దుర్లు', 'దురద'],
+            'cold': ['దగ్గు', 'జలుబు', 'తుమ్ము'],
+            'solids': ['ఘన ఆహారం', 'ఆహారం'],
+            'greeting': ['నమస్కారం', 'హలో'],
+            'thanks': ['ధన్యవాదాలు'],
+        },
         'tips': {
             'feeding': {
                 'title': 'మీ నవజాత శిశువుకు పోషణ ఇవ్వడం',
@@ -177,6 +249,20 @@ translations = {
         'subscribe_required': 'पाहण्यासाठी सबस्क्राईब करा',
         'premium_banner': 'प्रीमियम व्हिडिओ: सर्व तज्ञ व्हिडिओ मार्गदर्शक पाहण्यासाठी, कृपया फक्त ₹99/महिना सबस्क्राईब करा',
         'subscribe_button': 'सबस्क्राईब ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['ताप', 'ज्वर', 'तापमान'],
+            'vomit': ['उलटी', 'ओकारी'],
+            'sleep': ['झोप'],
+            'feeding': ['दूध', 'स्तनपान', 'भूक', 'पाज'],
+            'stool': ['शौच', 'बद्धकोष्ठ', 'जुलाब'],
+            'crying': ['रडत', 'रडणे', 'रडतो', 'रडते'],
+            'rash': ['पुरळ', 'खाज'],
+            'cold': ['खोकला', 'सर्दी', 'शिंक'],
+            'solids': ['घन आहार', 'अन्न'],
+            'greeting': ['नमस्कार'],
+            'thanks': ['धन्यवाद', 'आभार'],
+        },
         'tips': {
             'feeding': {
                 'title': 'आपल्या नवजात बाळाला खाना देणे',
@@ -210,6 +296,20 @@ translations = {
         'subscribe_required': 'જોવા માટે સબ્સ્ક્રાઇબ કરો',
         'premium_banner': 'પ્રીમિયમ વિડિઓઝ: તમામ નિષ્ણાત વિડિઓ માર્ગદર્શિકાઓ જોવા માટે, કૃપા કરીને માત્ર ₹99/મહિને સબ્સ્ક્રાઇબ કરો',
         'subscribe_button': 'સબ્સ્ક્રાઇબ ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['તાવ', 'તાપમાન'],
+            'vomit': ['ઉલટી'],
+            'sleep': ['ઊંઘ', 'સૂવ'],
+            'feeding': ['દૂધ', 'સ્તનપાન', 'ભૂખ', 'ખવડાવ'],
+            'stool': ['કબજિયાત', 'ઝાડા', 'સંડાસ'],
+            'crying': ['રડ'],
+            'rash': ['ફોલ્લી', 'ચકામા', 'ખંજવાળ'],
+            'cold': ['ખાંસી', 'શરદી', 'છીંક'],
+            'solids': ['ઘન ખોરાક', 'ખોરાક'],
+            'greeting': ['નમસ્તે'],
+            'thanks': ['આભાર', 'ધન્યવાદ'],
+        },
         'tips': {
             'feeding': {
                 'title': 'તમારા નવજાત બાળકને ખવડાવવું',
@@ -243,6 +343,20 @@ translations = {
         'subscribe_required': 'দেখতে সাবস্ক্রাইব করুন',
         'premium_banner': 'প্রিমিয়াম ভিডিও: সমস্ত বিশেষজ্ঞ ভিডিও গাইড দেখতে, অনুগ্রহ করে মাসে মাত্র ₹99 টাকায় সাবস্ক্রাইব করুন',
         'subscribe_button': 'সাবস্ক্রাইব ₹99',
+        # Keywords the local AI fallback matches, per intent (see ai_fallback.py)
+        'ai_keywords': {
+            'fever': ['জ্বর', 'তাপমাত্রা'],
+            'vomit': ['বমি'],
+            'sleep': ['ঘুম'],
+            'feeding': ['দুধ', 'স্তন্যপান', 'খিদে', 'ক্ষুধা', 'খাওয়ানো'],
+            'stool': ['পায়খানা', 'কোষ্ঠকাঠিন্য', 'ডায়রিয়া'],
+            'crying': ['কান্না', 'কাঁদ'],
+            'rash': ['র\u200d্যাশ', 'ফুসকুড়ি', 'চুলকানি'],
+            'cold': ['কাশি', 'সর্দি', 'হাঁচি'],
+            'solids': ['শক্ত খাবার', 'খাবার'],
+            'greeting': ['নমস্কার', 'হ্যালো'],
+            'thanks': ['ধন্যবাদ'],
+        },
         'tips': {
             'feeding': {
                 'title': 'আপনার নবজাত শিশুকে খাওয়ানো',